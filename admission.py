@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+ADMISSION - In-flight caps per mode and load shedding at the front door
+Every request is classified into a mode (ultra, video, page, ...) and a
+priority. A request runs if its mode and the process are both under their
+in-flight caps; otherwise it waits in one bounded priority queue for at
+most ADMISSION_WAIT seconds. Arrivals that don't fit - or that time out
+waiting - get an immediate 503 with Retry-After instead of piling up until
+threads and memory run out. A full queue drops its lowest-priority waiter
+in favour of a cheaper newcomer, so cheap requests keep being served while
+expensive ones are shed first. Requests the response cache can answer
+count as cheap.
+"""
+import itertools
+import os
+import threading
+
+from flask import Response, g, request
+
+CHEAP, NORMAL, EXPENSIVE = 0, 1, 2
+
+# Configuration (environment overrides)
+ADMISSION_TOTAL = int(os.environ.get('PROXY_ADMISSION_TOTAL', 64))       # in-flight across all modes
+ADMISSION_QUEUE = int(os.environ.get('PROXY_ADMISSION_QUEUE', 128))      # waiters before shedding
+ADMISSION_WAIT = float(os.environ.get('PROXY_ADMISSION_WAIT', 2))        # seconds a waiter may queue
+RETRY_AFTER = int(os.environ.get('PROXY_RETRY_AFTER', 2))                # seconds, sent on 503
+
+DEFAULT_LIMITS = {
+    'static': 64,
+    'page': 32,
+    'video': 16,
+    'ultra': 4,
+    'tunnel': 16,
+}
+
+
+def parse_limits(spec):
+    """'ultra=4,video=16' -> {mode: limit}"""
+    limits = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            mode, limit = item.split('=', 1)
+            limits[mode.strip()] = int(limit)
+    return limits
+
+
+ADMISSION_LIMITS = dict(DEFAULT_LIMITS, **parse_limits(os.environ.get('PROXY_ADMISSION_LIMITS', '')))
+
+
+class Overloaded(Exception):
+    """Request shed by admission control"""
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'mode', 'event', 'state')
+
+    def __init__(self, priority, seq, mode):
+        self.priority = priority
+        self.seq = seq
+        self.mode = mode
+        self.event = threading.Event()
+        self.state = 'queued'
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Per-mode and total in-flight caps with a bounded priority queue"""
+
+    def __init__(self, limits=None, total=ADMISSION_TOTAL, queue_size=ADMISSION_QUEUE,
+                 max_wait=ADMISSION_WAIT):
+        self.limits = dict(ADMISSION_LIMITS if limits is None else limits)
+        self.total = total
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.in_flight = {}
+        self.counters = {}
+        self._running = 0
+        self._queue = []  # waiting _Waiters, unordered (bounded by queue_size)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _count(self, mode, name):
+        counters = self.counters.setdefault(mode, {'admitted': 0, 'queued': 0, 'shed': 0})
+        counters[name] += 1
+
+    def _fits(self, mode):
+        return (self._running < self.total
+                and self.in_flight.get(mode, 0) < self.limits.get(mode, self.total))
+
+    def _admit(self, mode):
+        self._running += 1
+        self.in_flight[mode] = self.in_flight.get(mode, 0) + 1
+        self._count(mode, 'admitted')
+
+    def _shed(self, waiter):
+        waiter.state = 'shed'
+        self._count(waiter.mode, 'shed')
+        waiter.event.set()
+
+    def _grant(self):
+        """Admit queued waiters, best priority first, while capacity lasts"""
+        for waiter in sorted(self._queue):
+            if self._running >= self.total:
+                break
+            if self._fits(waiter.mode):
+                self._queue.remove(waiter)
+                waiter.state = 'admitted'
+                self._admit(waiter.mode)
+                waiter.event.set()
+
+    def acquire(self, mode, priority=NORMAL):
+        """Block until admitted; raise Overloaded if shed"""
+        with self._lock:
+            if self._fits(mode):
+                self._admit(mode)
+                return
+            waiter = _Waiter(priority, next(self._seq), mode)
+            if len(self._queue) >= self.queue_size:
+                worst = max(self._queue, default=None)
+                if worst is None or worst.priority <= priority:
+                    self._count(mode, 'shed')
+                    raise Overloaded(mode)
+                # A cheaper request bumps the most expensive, newest waiter
+                self._queue.remove(worst)
+                self._shed(worst)
+            self._queue.append(waiter)
+            self._count(mode, 'queued')
+
+        waiter.event.wait(self.max_wait)
+        with self._lock:
+            if waiter.state == 'admitted':
+                return
+            if waiter.state == 'queued':
+                self._queue.remove(waiter)
+                self._shed(waiter)
+        raise Overloaded(mode)
+
+    def release(self, mode):
+        with self._lock:
+            self._running -= 1
+            self.in_flight[mode] -= 1
+            self._grant()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._running,
+                'total_limit': self.total,
+                'queued': len(self._queue),
+                'modes': {
+                    mode: dict(self.counters.get(mode, {}), in_flight=self.in_flight.get(mode, 0), limit=limit)
+                    for mode, limit in self.limits.items()
+                },
+            }
+
+
+controller = AdmissionController()
+
+
+def shed_response():
+    return Response(
+        'Service overloaded, retry shortly\n',
+        status=503,
+        mimetype='text/plain',
+        headers={'Retry-After': str(RETRY_AFTER), 'Cache-Control': 'no-store'}
+    )
+
+
+def init_app(app, classify):
+    """Put a Flask app behind admission control
+
+    classify(request) returns (mode, priority), or None to exempt the
+    request (health checks, stats).
+    """
+    @app.before_request
+    def admit():
+        decision = classify(request)
+        if decision is None:
+            return None
+        mode, priority = decision
+        try:
+            controller.acquire(mode, priority)
+        except Overloaded:
+            print(f"[ADMIT   ] ✗ shed {mode} {request.path[:60]}")
+            return shed_response()
+        g.admission_mode = mode
+        return None
+
+    @app.after_request
+    def hold_until_sent(response):
+        # Streamed bodies (video) keep their slot until the last byte is out
+        if response.is_streamed and 'admission_mode' in g:
+            mode = g.pop('admission_mode')
+            response.call_on_close(lambda: controller.release(mode))
+        return response
+
+    @app.teardown_request
+    def release(exc):
+        # Buffered responses, websockets and errors are done by teardown
+        mode = g.pop('admission_mode', None)
+        if mode is not None:
+            controller.release(mode)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+BANDWIDTH - Token-bucket egress scheduler for relayed video streams
+Every client (by remote address) gets a token bucket shared by all of its
+streams. Bucket rates are re-divided every REBALANCE_INTERVAL seconds by
+max-min fair share: the global cap is split evenly, clients that use less
+than their share hand the rest to those that want more, and no client
+exceeds the per-client cap. New buckets start full so the player can
+buffer its first BW_BURST bytes at line rate.
+
+A bucket outlives its client's streams by CLIENT_IDLE_GRACE seconds. HLS
+segments and range requests arrive as a series of short streams, and
+each would otherwise get a fresh full bucket.
+
+Rates are bytes per second; 0 disables that cap.
+"""
+import itertools
+import os
+import threading
+import time
+
+# Configuration (environment overrides)
+BW_GLOBAL = int(os.environ.get('PROXY_BW_GLOBAL', 50 * 1024 * 1024))      # all video streams together
+BW_PER_CLIENT = int(os.environ.get('PROXY_BW_PER_CLIENT', 4 * 1024 * 1024))  # ~32 Mbit/s, enough for 4K
+BW_BURST = int(os.environ.get('PROXY_BW_BURST', 8 * 1024 * 1024))         # startup buffering allowance
+REBALANCE_INTERVAL = 0.5  # seconds between fair-share recalculations
+CLIENT_IDLE_GRACE = 30    # seconds a client's bucket is kept with no open streams
+RATE_SMOOTHING = 0.3      # EWMA weight of the newest throughput sample
+
+
+class _Client:
+    def __init__(self, burst, rate):
+        self.tokens = float(burst)
+        self.rate = rate
+        self.refilled = time.monotonic()
+        self.streams = 0
+        self.idle_since = None  # when its last stream closed
+        self.bytes = 0          # since the last rebalance
+        self.starved = False    # had to wait for tokens since the last rebalance
+
+
+class _Stream:
+    def __init__(self, stream_id, client, label):
+        self.id = stream_id
+        self.client = client
+        self.label = label
+        self.started = time.monotonic()
+        self.total = 0
+        self.bytes = 0          # since the last rebalance
+        self.throughput = 0.0   # smoothed bytes/s
+
+
+class Meter:
+    """Paces one stream: charge() sleeps until the client's bucket covers
+    the bytes. The stream is registered on the first charge and must be
+    closed when it ends."""
+
+    def __init__(self, scheduler, client_key, label):
+        self.scheduler = scheduler
+        self.client_key = client_key
+        self.label = label
+        self.stream = None
+
+    def charge(self, size):
+        if self.stream is None:
+            self.stream = self.scheduler._open(self.client_key, self.label)
+        wait = self.scheduler._consume(self.stream, size)
+        if wait > 0:
+            time.sleep(wait)
+
+    def close(self):
+        if self.stream is not None:
+            self.scheduler._close(self.stream)
+            self.stream = None
+
+    def wrap(self, chunks):
+        """Pace an iterable of byte chunks"""
+        try:
+            for chunk in chunks:
+                self.charge(len(chunk))
+                yield chunk
+        finally:
+            self.close()
+
+
+def max_min_share(demands, capacity):
+    """Water-fill capacity over {key: demand}; returns {key: allocation}"""
+    allocation = {}
+    remaining = capacity
+    pending = sorted(demands.items(), key=lambda item: item[1])
+    while pending:
+        share = remaining / len(pending)
+        key, demand = pending[0]
+        if demand > share:
+            # Everyone left wants at least an equal share - split evenly
+            for key, _ in pending:
+                allocation[key] = share
+            break
+        allocation[key] = demand
+        remaining -= demand
+        pending.pop(0)
+    return allocation
+
+
+class BandwidthScheduler:
+    """Per-client token buckets with max-min fair rates under a global cap"""
+
+    def __init__(self, global_rate=BW_GLOBAL, per_client=BW_PER_CLIENT, burst=BW_BURST):
+        self.global_rate = global_rate
+        self.per_client = per_client
+        self.burst = burst
+        self._clients = {}
+        self._streams = {}
+        self._ids = itertools.count(1)
+        self._rebalanced = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.global_rate or self.per_client)
+
+    def _initial_rate(self):
+        if self.global_rate and self.per_client:
+            return min(self.global_rate, self.per_client)
+        return self.global_rate or self.per_client
+
+    def _rebalance(self, now):
+        elapsed = now - self._rebalanced
+        self._rebalanced = now
+        for key in [key for key, client in self._clients.items()
+                    if not client.streams and now - client.idle_since > CLIENT_IDLE_GRACE]:
+            del self._clients[key]
+        # Idle clients keep their rate, so their buckets refill as before
+        active = {key: client for key, client in self._clients.items() if client.streams}
+        demands = {}
+        for key, client in active.items():
+            # A client that waited on its bucket would take more if offered
+            measured = client.bytes / elapsed if elapsed > 0 else 0
+            demands[key] = float('inf') if client.starved else measured * 1.25
+            client.bytes = 0
+            client.starved = False
+        if self.global_rate:
+            allocation = max_min_share(demands, self.global_rate)
+        else:
+            allocation = {key: float('inf') for key in demands}
+        for key, client in active.items():
+            rate = allocation[key]
+            if self.per_client:
+                rate = min(rate, self.per_client)
+            # Never starve a quiet client completely - it may be about to ramp up
+            client.rate = max(rate, 16 * 1024)
+        for stream in self._streams.values():
+            sample = stream.bytes / elapsed if elapsed > 0 else 0
+            stream.throughput += RATE_SMOOTHING * (sample - stream.throughput)
+            stream.bytes = 0
+
+    def _consume(self, stream, size):
+        """Charge size bytes to the stream's client; returns seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._rebalanced >= REBALANCE_INTERVAL:
+                self._rebalance(now)
+            client = self._clients[stream.client]
+            client.tokens = min(self.burst, client.tokens + (now - client.refilled) * client.rate)
+            client.refilled = now
+            client.tokens -= size
+            client.bytes += size
+            stream.bytes += size
+            stream.total += size
+            if client.tokens >= 0:
+                return 0
+            client.starved = True
+            return -client.tokens / client.rate
+
+    def _open(self, client_key, label):
+        with self._lock:
+            client = self._clients.get(client_key)
+            if client is None:
+                client = self._clients[client_key] = _Client(self.burst, self._initial_rate())
+            client.streams += 1
+            client.idle_since = None
+            stream = _Stream(next(self._ids), client_key, label)
+            self._streams[stream.id] = stream
+            return stream
+
+    def _close(self, stream):
+        with self._lock:
+            self._streams.pop(stream.id, None)
+            client = self._clients.get(stream.client)
+            if client is not None:
+                client.streams -= 1
+                if client.streams <= 0:
+                    client.idle_since = time.monotonic()  # pruned by _rebalance after the grace period
+
+    def meter(self, client_key, label=''):
+        """Meter for one stream, or None when no cap is configured"""
+        return Meter(self, client_key, label) if self.enabled else None
+
+    def throttle(self, chunks, client_key, label=''):
+        """Yield chunks no faster than the client's fair share allows"""
+        meter = self.meter(client_key, label)
+        return meter.wrap(chunks) if meter else chunks
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'global_rate': self.global_rate,
+                'per_client_rate': self.per_client,
+                'clients': {key: {'streams': c.streams, 'rate': round(c.rate)} for key, c in self._clients.items()},
+                'streams': [
+                    {
+                        'id': s.id,
+                        'client': s.client,
+                        'url': s.label[:100],
+                        'bytes': s.total,
+                        'seconds': round(now - s.started, 1),
+                        'throughput': round(s.throughput),
+                    }
+                    for s in self._streams.values()
+                ],
+            }
+
+
+scheduler = BandwidthScheduler()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+BENCH RELAY - Throughput and CPU cost of the binary relay loops
+Serves a large body from a child process on localhost and drains it with
+each relay strategy, reporting wall-clock throughput and CPU seconds per
+GiB spent in this (the relaying) process.
+
+Usage: python3 bench_relay.py [--size-mb 512] [--rounds 3]
+"""
+import argparse
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+import relay
+
+BLOCK = b'\x00' * (1024 * 1024)
+
+
+def serve(port, size):
+    """Minimal keep-alive HTTP/1.1 server answering every request with size bytes"""
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', port))
+    listener.listen(8)
+    print('ready', flush=True)
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            reader = conn.makefile('rb')
+            while True:
+                # Read one request's headers
+                line = reader.readline()
+                if not line:
+                    break
+                while line not in (b'\r\n', b'\n', b''):
+                    line = reader.readline()
+                conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: video/mp4\r\n'
+                             b'Content-Length: %d\r\n\r\n' % size)
+                remaining = size
+                while remaining:
+                    n = min(remaining, len(BLOCK))
+                    conn.sendall(BLOCK[:n])
+                    remaining -= n
+
+
+def drain_iter_content(resp):
+    for chunk in resp.iter_content(chunk_size=8192):
+        yield chunk
+
+
+def drain_raw_stream(resp):
+    return resp.raw.stream(relay.CHUNK_SIZE, decode_content=False)
+
+
+def drain_views(resp):
+    # Upper bound: memoryviews straight from the pooled buffer, no copy out
+    return relay.read_views(resp.raw._fp)
+
+
+STRATEGIES = [
+    ('iter_content(8192)', drain_iter_content),
+    ('raw.stream(64K)', drain_raw_stream),
+    ('relay.iter_raw', relay.iter_raw),
+    ('relay.read_views', drain_views),
+]
+
+
+def run(url, strategy, session):
+    resp = session.get(url, stream=True)
+    wall, cpu = time.perf_counter(), time.process_time()
+    total = chunks = 0
+    for chunk in strategy(resp):
+        total += len(chunk)
+        chunks += 1
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    resp.close()
+    return total, chunks, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    if args.serve:
+        serve(args.port, size)
+        return
+
+    server = subprocess.Popen(
+        [sys.executable, __file__, '--serve', '--port', str(args.port), '--size-mb', str(args.size_mb)],
+        stdout=subprocess.PIPE
+    )
+    try:
+        server.stdout.readline()
+        url = f'http://127.0.0.1:{args.port}/video.mp4'
+        session = requests.Session()
+        print(f"{'strategy':20} {'MiB/s':>8} {'CPU s/GiB':>10} {'reads':>8}")
+        for name, strategy in STRATEGIES:
+            best = None
+            for _ in range(args.rounds):
+                result = run(url, strategy, session)
+                if best is None or result[3] < best[3]:
+                    best = result
+            total, chunks, wall, cpu = best
+            gib = total / 1024 ** 3
+            print(f"{name:20} {total / 1024 ** 2 / wall:8.0f} {cpu / gib:10.3f} {chunks:8d}")
+    finally:
+        server.kill()
+
+
+if __name__ == '__main__':
+    main()
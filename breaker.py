@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+BREAKER - Per-host circuit breaker and negative cache for sub-resources
+A host that keeps timing out or returning 5xx is tripped open and fetches
+to it fail immediately for BREAKER_COOLDOWN seconds; after that a single
+probe is let through (half-open) and its outcome closes or re-opens the
+circuit. Individual URLs that failed are remembered for NEGATIVE_TTL
+seconds so a dead image isn't re-fetched on every page view.
+
+Failing fast raises FastFail, a requests RequestException, so callers'
+existing error fallbacks apply unchanged.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+
+# Configuration (environment overrides)
+BREAKER_FAILURES = int(os.environ.get('PROXY_BREAKER_FAILURES', 5))      # consecutive failures to trip
+BREAKER_COOLDOWN = float(os.environ.get('PROXY_BREAKER_COOLDOWN', 30))   # seconds open before probing
+NEGATIVE_TTL = float(os.environ.get('PROXY_NEGATIVE_TTL', 60))           # seconds a failed URL is skipped
+NEGATIVE_MAX_ENTRIES = 4096
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+# Failures that say something about the host rather than the URL
+HOST_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class FastFail(requests.exceptions.RequestException):
+    """Fetch refused without contacting the upstream"""
+
+
+class CircuitOpen(FastFail):
+    """The upstream host's circuit is open"""
+
+
+class KnownFailure(FastFail):
+    """The URL failed recently and is in the negative cache"""
+
+
+def _host_failure(status):
+    return status >= 500 or status == 429
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+        self.short_circuited = 0
+
+
+class _Attempt:
+    """Handed to the body of Breaker.guard() to report the response status"""
+
+    def __init__(self):
+        self.code = None
+
+    def status(self, code):
+        self.code = code
+
+
+class Breaker:
+    """Circuit state per host plus a TTL cache of failed URLs"""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, negative_ttl=NEGATIVE_TTL):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.negative_ttl = negative_ttl
+        self._circuits = {}
+        self._negative = {}  # url -> (expires_at, reason)
+        self._lock = threading.Lock()
+        self.negative_hits = 0
+
+    def _circuit(self, host):
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = _Circuit()
+        return circuit
+
+    def check(self, url):
+        """Raise FastFail if url shouldn't be fetched right now
+
+        Returns True when the caller is the half-open probe for its host.
+        """
+        host = urlparse(url).netloc.lower()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._negative.get(url)
+            if entry:
+                if entry[0] > now:
+                    self.negative_hits += 1
+                    raise KnownFailure(f"{url[:80]} failed recently ({entry[1]})")
+                del self._negative[url]
+
+            circuit = self._circuit(host)
+            if circuit.state == OPEN and now - circuit.opened_at >= self.cooldown:
+                circuit.state = HALF_OPEN
+                circuit.probing = False
+            if circuit.state == HALF_OPEN and not circuit.probing:
+                circuit.probing = True  # this caller is the probe
+                return True
+            if circuit.state != CLOSED:
+                circuit.short_circuited += 1
+                raise CircuitOpen(f"circuit open for {host}")
+            return False
+
+    def _release_probe(self, url):
+        """Let another caller probe when the probe ended without an outcome"""
+        with self._lock:
+            self._circuit(urlparse(url).netloc.lower()).probing = False
+
+    def _remember(self, url, reason):
+        if len(self._negative) >= NEGATIVE_MAX_ENTRIES:
+            self._negative.pop(next(iter(self._negative)))
+        self._negative[url] = (time.monotonic() + self.negative_ttl, reason)
+
+    def record(self, url, status=None, error=None):
+        """Report how a fetch of url went (a status code or an exception)"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            circuit = self._circuit(host)
+            circuit.probing = False
+            if error is not None:
+                self._remember(url, type(error).__name__)
+                host_failed = isinstance(error, HOST_ERRORS)
+            else:
+                if status >= 400:
+                    self._remember(url, status)
+                host_failed = _host_failure(status)
+
+            if not host_failed:
+                circuit.state = CLOSED
+                circuit.failures = 0
+                return
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN or circuit.failures >= self.failures:
+                if circuit.state != OPEN:
+                    circuit.trips += 1
+                    print(f"[BREAKER ] ✗ {host} open for {self.cooldown:g}s after {circuit.failures} failures")
+                circuit.state = OPEN
+                circuit.opened_at = time.monotonic()
+
+    @contextmanager
+    def guard(self, url):
+        """Check url, run the fetch in the block, and record the outcome
+
+            with breaker.guard(url) as attempt:
+                resp = session.get(url)
+                attempt.status(resp.status_code)
+        """
+        probe = self.check(url)
+        attempt = _Attempt()
+        try:
+            yield attempt
+        except requests.exceptions.RequestException as e:
+            if not isinstance(e, FastFail):
+                self.record(url, error=e)
+            elif probe:  # refused locally (e.g. HostBusy), so the host wasn't tried
+                self._release_probe(url)
+            raise
+        except BaseException:
+            if probe:
+                self._release_probe(url)
+            raise
+        else:
+            self.record(url, status=attempt.code if attempt.code is not None else 200)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            negative = sum(1 for expires, _ in self._negative.values() if expires > now)
+            hosts = {
+                host: {
+                    'state': circuit.state,
+                    'failures': circuit.failures,
+                    'trips': circuit.trips,
+                    'short_circuited': circuit.short_circuited,
+                }
+                for host, circuit in self._circuits.items()
+                if circuit.state != CLOSED or circuit.trips or circuit.failures
+            }
+        return {'hosts': hosts, 'negative_entries': negative, 'negative_hits': self.negative_hits}
+
+
+breaker = Breaker()
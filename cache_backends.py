@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+CACHE BACKENDS - One byte-oriented cache interface behind every cache
+Values are bytes, keys are strings, every entry may carry its own TTL.
+Backends:
+  memory          in-process LRU bounded by total bytes
+  disk:/path      files under a directory, bounded by total bytes
+  redis://h:p/db  any Redis-protocol (RESP) server, shared by all workers
+Two of them stack as a tiered cache: lookups try the local L1 first, then
+the shared L2, and L2 hits are copied into L1 for a short while. With
+PROXY_CLUSTER_PEERS set (see cluster.py) the whole stack becomes this
+node's shard of a cache spread over several proxy nodes.
+
+PROXY_CACHE_L1 (default memory) and PROXY_CACHE_L2 (default none) pick the
+tiers; PROXY_CACHE_MEMORY_MB / PROXY_CACHE_DISK_MB bound the local ones.
+A shared tier that is down or slow degrades to misses, never to errors.
+
+`python3 cache_backends.py --serve-resp PORT` runs a small in-memory RESP
+server that stands in for Redis in tests and local experiments.
+"""
+import argparse
+import hashlib
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# Configuration (environment overrides)
+CACHE_L1 = os.environ.get('PROXY_CACHE_L1', 'memory')
+CACHE_L2 = os.environ.get('PROXY_CACHE_L2', '')
+CACHE_MEMORY_MB = int(os.environ.get('PROXY_CACHE_MEMORY_MB', 256))
+CACHE_DISK_MB = int(os.environ.get('PROXY_CACHE_DISK_MB', 1024))
+L1_PROMOTE_TTL = 60         # seconds an L2 hit lives in L1 (bounds cross-worker staleness)
+RESP_TIMEOUT = 0.5          # seconds per shared-tier round trip
+RESP_POOL_SIZE = 16         # idle connections kept to the shared tier
+RESP_RETRY_INTERVAL = 5     # seconds a failed shared tier is skipped before retrying
+
+
+class CacheBackend(ABC):
+    """get/set/delete/contains over bytes values with optional TTL (seconds)"""
+
+    name = 'base'
+
+    @abstractmethod
+    def get(self, key):
+        """Value bytes for key, or None if missing or expired"""
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Store value under key; False if the backend refused it"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Drop key if present"""
+
+    def contains(self, key):
+        return self.get(key) is not None
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+def _expiry(ttl):
+    return time.time() + ttl if ttl else 0.0
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU bounded by total value bytes"""
+
+    name = 'memory'
+
+    def __init__(self, max_bytes=CACHE_MEMORY_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _pop(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] and entry[0] <= time.time():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        if len(value) > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (_expiry(ttl), value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def contains(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not (entry[0] and entry[0] <= time.time())
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.name, 'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+class DiskBackend(CacheBackend):
+    """One file per key under a directory, bounded by total bytes
+
+    Each file is an 8-byte expiry timestamp followed by the value, written
+    to a temp file and renamed into place so readers never see half a value.
+    """
+
+    name = 'disk'
+    HEADER = struct.Struct('>d')
+
+    def __init__(self, directory, max_bytes=CACHE_DISK_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._bytes = sum(os.path.getsize(path) for path in self._files())
+        self.hits = self.misses = self.evictions = 0
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.tmp'):
+                    yield os.path.join(root, name)
+
+    def _remove(self, path):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            self._bytes -= size
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            expires, = self.HEADER.unpack_from(data)
+        except struct.error:  # truncated, e.g. by a crash mid-write
+            self._remove(path)
+            return None
+        if expires and expires <= time.time():
+            self._remove(path)
+            return None
+        return data
+
+    def get(self, key):
+        data = self._read(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return data[self.HEADER.size:]
+
+    def set(self, key, value, ttl=None):
+        size = self.HEADER.size + len(value)
+        if size > self.max_bytes:
+            return False
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.HEADER.pack(_expiry(ttl)))
+            f.write(value)
+        with self._lock:
+            # Replacing a file under the lock, so concurrent sets of a key are counted once
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp, path)
+            self._bytes += size - replaced
+            over = self._bytes > self.max_bytes
+        if over:
+            self._evict()
+        return True
+
+    def _evict(self):
+        """Delete least recently written files down to 90% of the budget"""
+        files = sorted(self._files(), key=lambda path: os.path.getmtime(path))
+        for path in files:
+            with self._lock:
+                if self._bytes <= self.max_bytes * 0.9:
+                    return
+                self.evictions += 1
+            self._remove(path)
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def contains(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, = self.HEADER.unpack(f.read(self.HEADER.size))
+        except (OSError, struct.error):
+            return False
+        return not (expires and expires <= time.time())
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.name, 'directory': self.directory, 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+class RespError(Exception):
+    """Error reply from a RESP server"""
+
+
+def encode_command(*args):
+    """RESP array of bulk strings"""
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(out)
+
+
+def read_reply(reader):
+    """One RESP reply from a buffered reader"""
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('connection closed by cache server')
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode()
+    if kind == b'-':
+        raise RespError(payload.decode())
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError('connection closed by cache server')
+        return data[:-2]
+    if kind == b'*':
+        count = int(payload)
+        return None if count < 0 else [read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f'bad reply from cache server: {line[:40]!r}')
+
+
+class _RespConnection:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def call(self, *args):
+        self.sock.sendall(encode_command(*args))
+        return read_reply(self.reader)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RespBackend(CacheBackend):
+    """Shared tier on any Redis-protocol server (Redis, Valkey, KeyDB, ...)"""
+
+    name = 'resp'
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, prefix='proxy:',
+                 timeout=RESP_TIMEOUT, pool_size=RESP_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.errors = 0
+
+    @classmethod
+    def from_url(cls, url):
+        parsed = urlparse(url)
+        db = int(parsed.path.strip('/') or 0)
+        return cls(parsed.hostname or '127.0.0.1', parsed.port or 6379, db, parsed.password)
+
+    def _connect(self):
+        conn = _RespConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.call('AUTH', self.password)
+        if self.db:
+            conn.call('SELECT', self.db)
+        return conn
+
+    def _call(self, *args):
+        """Run one command; None (and the tier skipped for a while) on failure"""
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = None
+        try:
+            if conn is None:
+                conn = self._connect()
+            reply = conn.call(*args)
+        except (OSError, RespError) as e:
+            if conn is not None:
+                conn.close()
+            with self._lock:
+                self.errors += 1
+                self._down_until = time.monotonic() + RESP_RETRY_INTERVAL
+            print(f"[CACHE   ] ✗ {self.host}:{self.port} {args[0]}: {e}", flush=True)
+            return None
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return reply
+
+    def get(self, key):
+        value = self._call('GET', self.prefix + key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            return self._call('SET', self.prefix + key, value, 'PX', max(1, int(ttl * 1000))) == 'OK'
+        return self._call('SET', self.prefix + key, value) == 'OK'
+
+    def delete(self, key):
+        self._call('DEL', self.prefix + key)
+
+    def contains(self, key):
+        return bool(self._call('EXISTS', self.prefix + key))
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.name, 'server': f'{self.host}:{self.port}/{self.db}',
+                    'up': time.monotonic() >= self._down_until, 'hits': self.hits,
+                    'misses': self.misses, 'errors': self.errors}
+
+
+class TieredBackend(CacheBackend):
+    """Local L1 in front of a shared L2"""
+
+    name = 'tiered'
+
+    def __init__(self, l1, l2, promote_ttl=L1_PROMOTE_TTL):
+        self.l1 = l1
+        self.l2 = l2
+        self.promote_ttl = promote_ttl
+
+    def get(self, key):
+        value = self.l1.get(key)
+        if value is None:
+            value = self.l2.get(key)
+            if value is not None:
+                self.l1.set(key, value, self.promote_ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.l1.set(key, value, min(ttl, self.promote_ttl) if ttl else self.promote_ttl)
+        return self.l2.set(key, value, ttl)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def contains(self, key):
+        return self.l1.contains(key) or self.l2.contains(key)
+
+    def stats(self):
+        return {'backend': self.name, 'l1': self.l1.stats(), 'l2': self.l2.stats()}
+
+
+class ClusterBackend(CacheBackend):
+    """This node's shard plus its consistent-hash peers (cluster.py)
+
+    Keys this node owns go straight to the local backend. Others are read
+    from a short-lived local copy, then from their owner over HTTP, and
+    written through to the owner. While an owner is unreachable its keys
+    are cached locally instead.
+    """
+
+    name = 'cluster'
+
+    def __init__(self, local, cluster):
+        self.local = local
+        self.cluster = cluster
+
+    def get(self, key):
+        owner = self.cluster.owner(key)
+        value = self.local.get(key)
+        if value is None and owner is not None:
+            value = self.cluster.get(owner, key)
+            if value is not None:
+                self.local.set(key, value, self.cluster.near_ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        owner = self.cluster.owner(key)
+        if owner is None or not self.cluster.put(owner, key, value, ttl):
+            return self.local.set(key, value, ttl)
+        self.local.set(key, value, min(ttl, self.cluster.near_ttl) if ttl else self.cluster.near_ttl)
+        return True
+
+    def delete(self, key):
+        owner = self.cluster.owner(key)
+        self.local.delete(key)
+        if owner is not None:
+            self.cluster.delete(owner, key)
+
+    def contains(self, key):
+        if self.local.contains(key):
+            return True
+        owner = self.cluster.owner(key)
+        return owner is not None and self.cluster.contains(owner, key)
+
+    def stats(self):
+        return {'backend': self.name, 'local': self.local.stats(), 'cluster': self.cluster.stats()}
+
+
+class Namespace:
+    """A cache's view of the shared backend under its own key prefix"""
+
+    def __init__(self, backend, prefix):
+        self.backend = backend
+        self.prefix = prefix + ':'
+
+    def get(self, key):
+        return self.backend.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        return self.backend.set(self.prefix + key, value, ttl)
+
+    def delete(self, key):
+        self.backend.delete(self.prefix + key)
+
+    def contains(self, key):
+        return self.backend.contains(self.prefix + key)
+
+
+def from_spec(spec):
+    """Backend for 'memory', 'disk:/path' or 'redis://host:port/db'; None for ''/'none'"""
+    if not spec or spec == 'none':
+        return None
+    if spec == 'memory':
+        return MemoryBackend()
+    if spec.startswith('disk:'):
+        return DiskBackend(spec[len('disk:'):] or '.proxy_cache')
+    if spec.startswith(('redis://', 'resp://')):
+        return RespBackend.from_url(spec)
+    raise ValueError(f"unknown cache backend {spec!r}")
+
+
+def build(l1=CACHE_L1, l2=CACHE_L2):
+    first, second = from_spec(l1), from_spec(l2)
+    if first and second:
+        return TieredBackend(first, second)
+    return first or second or MemoryBackend()
+
+
+local = build()  # this node's own storage, served to peers by cluster.init_app
+backend = local
+if os.environ.get('PROXY_CLUSTER_PEERS'):
+    import cluster  # pulls in Flask and the upstream session, so only when clustered
+    if cluster.node.enabled:
+        backend = ClusterBackend(local, cluster.node)
+
+
+def namespace(prefix):
+    return Namespace(backend, prefix)
+
+
+# =============================================================================
+# Stand-in RESP server (GET/SET [PX|EX]/DEL/EXISTS/PING/SELECT/AUTH)
+# =============================================================================
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store, lock = self.server.store, self.server.lock
+        while True:
+            try:
+                args = read_reply(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            command = args[0].upper()
+            with lock:
+                if command == b'GET':
+                    entry = store.get(args[1])
+                    if entry and entry[0] and entry[0] <= time.time():
+                        del store[args[1]]
+                        entry = None
+                    reply = b'$-1\r\n' if entry is None else b'$%d\r\n%s\r\n' % (len(entry[1]), entry[1])
+                elif command == b'SET':
+                    expires = 0.0
+                    if len(args) == 5 and args[3].upper() == b'PX':
+                        expires = time.time() + int(args[4]) / 1000
+                    elif len(args) == 5 and args[3].upper() == b'EX':
+                        expires = time.time() + int(args[4])
+                    store[args[1]] = (expires, args[2])
+                    reply = b'+OK\r\n'
+                elif command in (b'DEL', b'EXISTS'):
+                    found = [key for key in args[1:] if key in store]
+                    if command == b'DEL':
+                        for key in found:
+                            del store[key]
+                    reply = b':%d\r\n' % len(found)
+                elif command in (b'PING', b'SELECT', b'AUTH'):
+                    reply = b'+PONG\r\n' if command == b'PING' else b'+OK\r\n'
+                else:
+                    reply = b'-ERR unknown command\r\n'
+            self.wfile.write(reply)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _RespHandler)
+        self.store = {}
+        self.lock = threading.Lock()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--serve-resp', type=int, metavar='PORT', required=True)
+    args = parser.parse_args()
+    server = RespServer(('127.0.0.1', args.serve_resp))
+    print(f"[CACHE   ] stand-in RESP server on 127.0.0.1:{args.serve_resp}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
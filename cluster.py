@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+CLUSTER - Consistent-hash ownership of cache keys across proxy nodes
+Optional. When PROXY_CLUSTER_PEERS lists the nodes behind the load
+balancer (base URLs, this node included as PROXY_CLUSTER_SELF), every cache
+key has exactly one owner picked by a consistent-hash ring. Entries live
+only on their owner, so total cache capacity grows with the node count and
+each asset is fetched upstream once per cluster, not once per node.
+
+A node asks a key's owner over HTTP (GET/PUT /cluster/cache?key=...)
+before going upstream, keeping a short-lived local copy of what it got.
+An unreachable owner is skipped for PEER_RETRY_INTERVAL seconds and its
+keys are cached locally meanwhile. Adding or removing a node only moves
+roughly 1/N of the keys.
+
+Peers authenticate with PROXY_CLUSTER_SECRET, sent as X-Cluster-Secret.
+Without a secret cluster mode stays off and /cluster/cache isn't served:
+it can overwrite any cached page.
+"""
+import bisect
+import hashlib
+import hmac
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from flask import Response, abort, request
+
+from upstream import make_session
+
+# Configuration (environment overrides)
+CLUSTER_PEERS = [p.strip().rstrip('/') for p in os.environ.get('PROXY_CLUSTER_PEERS', '').split(',') if p.strip()]
+CLUSTER_SELF = os.environ.get('PROXY_CLUSTER_SELF', '').rstrip('/')
+CLUSTER_SECRET = os.environ.get('PROXY_CLUSTER_SECRET', '')
+VIRTUAL_NODES = 128          # ring points per node, evens out the key spread
+PEER_TIMEOUT = 1.0           # seconds per peer round trip
+PEER_RETRY_INTERVAL = 10     # seconds an unreachable peer is skipped
+NEAR_COPY_TTL = 30           # seconds a non-owner keeps a copy of a remote entry
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys onto nodes"""
+
+    def __init__(self, nodes, vnodes=VIRTUAL_NODES):
+        self.nodes = list(nodes)
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._owners:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class Cluster:
+    """This node's view of its peers"""
+
+    def __init__(self, peers=CLUSTER_PEERS, self_url=CLUSTER_SELF, secret=CLUSTER_SECRET,
+                 timeout=PEER_TIMEOUT):
+        self.self_url = self_url
+        self.secret = secret
+        self.timeout = timeout
+        self.near_ttl = NEAR_COPY_TTL
+        self.ring = HashRing(peers)
+        self.enabled = len(peers) > 1 and self_url in peers and bool(secret)
+        if peers and self_url not in peers:
+            print(f"[CLUSTER ] ✗ PROXY_CLUSTER_SELF {self_url!r} not in peers - cluster mode off", flush=True)
+        elif peers and not secret:
+            print("[CLUSTER ] ✗ PROXY_CLUSTER_SECRET not set - cluster mode off", flush=True)
+        self._down_until = {}
+        self._session = make_session()
+        self._lock = threading.Lock()
+        self.counters = {'remote_hits': 0, 'remote_misses': 0, 'remote_stores': 0, 'errors': 0}
+
+    def owner(self, key):
+        """Owning peer's base URL, or None when this node owns key"""
+        if not self.enabled:
+            return None
+        node = self.ring.owner(key)
+        if node == self.self_url or time.monotonic() < self._down_until.get(node, 0):
+            return None
+        return node
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _call(self, method, node, key, data=None, ttl=None):
+        headers = {'X-Cluster-Secret': self.secret}
+        if ttl:
+            headers['X-Cache-TTL'] = str(int(ttl))
+        try:
+            resp = self._session.request(method, f'{node}/cluster/cache', params={'key': key},
+                                         data=data, headers=headers, timeout=self.timeout)
+        except Exception as e:
+            self._count('errors')
+            self._down_until[node] = time.monotonic() + PEER_RETRY_INTERVAL
+            print(f"[CLUSTER ] ✗ {urlparse(node).netloc} unreachable, caching locally: {e}", flush=True)
+            return None
+        return resp
+
+    def get(self, node, key):
+        """Value from the owning peer, or None"""
+        resp = self._call('GET', node, key)
+        if resp is not None and resp.status_code == 200:
+            self._count('remote_hits')
+            return resp.content
+        self._count('remote_misses')
+        return None
+
+    def put(self, node, key, value, ttl=None):
+        resp = self._call('PUT', node, key, value, ttl)
+        if resp is not None and resp.status_code == 204:
+            self._count('remote_stores')
+            return True
+        return False
+
+    def delete(self, node, key):
+        self._call('DELETE', node, key)
+
+    def contains(self, node, key):
+        resp = self._call('HEAD', node, key)
+        return resp is not None and resp.status_code == 200
+
+    def authorized(self, secret):
+        """Does a request's X-Cluster-Secret match ours?"""
+        return bool(self.secret) and hmac.compare_digest((secret or '').encode(), self.secret.encode())
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return dict(
+                self.counters,
+                enabled=self.enabled,
+                self=self.self_url,
+                peers={node: now >= self._down_until.get(node, 0) for node in self.ring.nodes},
+            )
+
+
+node = Cluster()
+
+
+def init_app(app, local_backend):
+    """Serve this node's share of the cluster cache to its peers
+
+    local_backend must be the node's own storage, never the cluster view,
+    so a request can't be forwarded on to another node. Nothing is
+    registered unless cluster mode is on.
+    """
+    if not node.enabled:
+        return
+
+    @app.route('/cluster/cache', methods=['GET', 'HEAD', 'PUT', 'DELETE'])
+    def cluster_cache():
+        if not node.authorized(request.headers.get('X-Cluster-Secret')):
+            abort(403)
+        key = request.args.get('key')
+        if not key:
+            abort(400)
+        if request.method == 'PUT':
+            ttl = request.headers.get('X-Cache-TTL', type=float)
+            local_backend.set(key, request.get_data(), ttl)
+            return Response(status=204)
+        if request.method == 'DELETE':
+            local_backend.delete(key)
+            return Response(status=204)
+        value = local_backend.get(key)
+        if value is None:
+            return Response(status=404)
+        return Response(value, mimetype='application/octet-stream')
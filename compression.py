@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+COMPRESSION - Client-facing gzip/brotli for rewritten text responses
+Negotiated from the client's Accept-Encoding. Buffered bodies below
+COMPRESS_MIN_SIZE are sent as-is; streamed bodies are compressed chunk by
+chunk with a sync flush so the client never waits for the whole upstream.
+Media that is already compressed (images, video, fonts, archives) is
+skipped, as is anything that already carries a Content-Encoding.
+"""
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configuration (environment overrides)
+COMPRESS_LEVEL = int(os.environ.get('PROXY_COMPRESS_LEVEL', 6))        # gzip 1-9
+BROTLI_QUALITY = int(os.environ.get('PROXY_BROTLI_QUALITY', 5))        # brotli 0-11
+COMPRESS_MIN_SIZE = int(os.environ.get('PROXY_COMPRESS_MIN_SIZE', 1024))  # bytes
+
+# Always worth compressing, even though some sit under a skipped prefix
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/x-javascript',
+    'application/json',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/manifest+json',
+    'application/vnd.apple.mpegurl',
+    'application/x-mpegurl',
+    'application/dash+xml',
+    'image/svg+xml',
+    'font/ttf',
+    'font/otf',
+}
+
+# Already-compressed media - recompressing only burns CPU
+SKIP_PREFIXES = (
+    'image/',
+    'video/',
+    'audio/',
+    'font/',
+    'application/octet-stream',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/pdf',
+    'application/wasm',
+)
+
+
+def is_compressible(mimetype):
+    """Should a body of this MIME type be compressed for the client?"""
+    mimetype = (mimetype or '').lower()
+    if mimetype in COMPRESSIBLE_TYPES:
+        return True
+    if mimetype.startswith(SKIP_PREFIXES):
+        return False
+    return mimetype.startswith('text/')
+
+
+def negotiate(accept_encodings):
+    """Preferred encoding the client accepts, or None"""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    """Compress a whole buffered body"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def stream_compress(chunks, encoding):
+    """Compress an iterable of chunks, flushing after each one"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            if chunk:
+                out = compressor.process(chunk) + compressor.flush()
+                if out:
+                    yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            if chunk:
+                out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if out:
+                    yield out
+        yield compressor.flush()
+
+
+def compress_response(response):
+    """after_request hook: compress the response if it is worth it"""
+    if request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if not is_compressible(response.mimetype):
+        return response
+
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = stream_compress(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The bytes changed, so a strong validator from upstream no longer holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Enable response compression on a Flask app"""
+    app.after_request(compress_response)
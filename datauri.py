@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+DATA URI - Streaming, size-capped encoder for inlined resources
+An inlined image or font used to exist four times at once: the raw body,
+its base64 bytes, those decoded to str and the 'data:...' concatenation.
+Here the upstream body is streamed through incremental base64 straight
+into one buffer that already holds the 'data:<mime>;base64,' prefix and is
+sized from Content-Length, so the encoded form (4/3 of the resource) is
+the only full-size copy until it is handed back as text.
+
+Every resource has a byte cap (PROXY_INLINE_MAX_BYTES by default). A
+Content-Length over the cap is refused before any of the body is read, and
+a body that turns out bigger is abandoned as soon as it crosses the cap.
+Either way the caller gets None and links the resource through the proxy
+instead of inlining it.
+
+Raster images are the exception: imageopt.py needs the whole body to
+shrink them, so they are read raw (up to PROXY_IMAGE_SOURCE_MAX_BYTES),
+and the cap applies to the shrunk result.
+"""
+import binascii
+import mimetypes
+import os
+from urllib.parse import urlparse
+
+import imageopt
+import pipeline
+
+# Configuration (environment overrides)
+INLINE_MAX_BYTES = int(os.environ.get('PROXY_INLINE_MAX_BYTES', 500000))  # per resource, before encoding
+CHUNK_SIZE = 48 * 1024  # multiple of 3, so whole chunks encode without padding
+
+TEXT_TYPES = ('javascript', 'css', 'json')
+
+
+def encoded_size(length):
+    """Base64 length of `length` bytes"""
+    return (length + 2) // 3 * 4
+
+
+def content_length(resp):
+    value = resp.headers.get('Content-Length', '')
+    return int(value) if value.isdigit() else None
+
+
+def mime_of(resp, default='application/octet-stream'):
+    """MIME type for a response's body: its Content-Type, else a guess from the URL"""
+    content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type:
+        return content_type
+    return mimetypes.guess_type(urlparse(resp.url).path)[0] or default
+
+
+def read_capped(resp, max_bytes):
+    """A stream=True response's whole body, or None if it exceeds max_bytes"""
+    length = content_length(resp)
+    if length is not None and length > max_bytes:
+        return None
+    body = bytearray()
+    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+        body += chunk
+        if len(body) > max_bytes:
+            return None
+    return bytes(body)
+
+
+def _encode_optimized(resp, mime, max_bytes):
+    body = read_capped(resp, max(max_bytes, imageopt.SOURCE_MAX_BYTES))
+    if body is None:
+        return None
+    body, mime = imageopt.optimizer.optimize(body, mime)
+    if len(body) > max_bytes:
+        return None
+    return f'data:{mime};base64,' + binascii.b2a_base64(body, newline=False).decode('ascii')
+
+
+def encode(resp, mime, max_bytes=INLINE_MAX_BYTES):
+    """data: URI for a stream=True response's body, or None if it exceeds max_bytes"""
+    if imageopt.applies(mime):
+        return _encode_optimized(resp, mime, max_bytes)
+    length = content_length(resp)
+    if length is not None and length > max_bytes:
+        return None
+    prefix = f'data:{mime};base64,'.encode('ascii')
+    buf = bytearray(len(prefix) + encoded_size(length or 0))
+    buf[:len(prefix)] = prefix
+    pos = len(prefix)
+    total = 0
+    carry = b''
+    # iter_content undoes any Content-Encoding, so the cap is on the real body
+    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            return None
+        if carry:
+            chunk = carry + chunk
+        whole = len(chunk) - len(chunk) % 3
+        carry = chunk[whole:]
+        out = binascii.b2a_base64(memoryview(chunk)[:whole], newline=False)
+        buf[pos:pos + len(out)] = out  # grows the buffer if Content-Length was missing or low
+        pos += len(out)
+    if carry:
+        out = binascii.b2a_base64(carry, newline=False)
+        buf[pos:pos + len(out)] = out
+        pos += len(out)
+    del buf[pos:]
+    return buf.decode('ascii')
+
+
+def _encode_logged(resp, mime, max_bytes):
+    data_uri = encode(resp, mime, max_bytes)
+    if data_uri is None:
+        print(f"[INLINE  ] ✗ over {max_bytes}b, left to the proxy: {resp.url[:80]}", flush=True)
+    return data_uri
+
+
+def fetch(url, mime=None, max_bytes=INLINE_MAX_BYTES, timeout=None):
+    """Fetch url as a data URI, or None (failed or too big)
+
+    mime is a MIME type string or a function of the response; by default
+    the upstream Content-Type is used.
+    """
+    def read(resp):
+        if resp.status_code != 200:
+            return None
+        return _encode_logged(resp, mime(resp) if callable(mime) else mime or mime_of(resp), max_bytes)
+    return pipeline.get_resource(url, timeout, read=read)
+
+
+def fetch_inline(url, max_bytes=INLINE_MAX_BYTES, as_text=None, timeout=None):
+    """('text', text, mime) for scripts/stylesheets, ('data', data URI, mime)
+    for anything else, or None (failed or too big)
+
+    as_text forces (True) or forbids (False) the text form regardless of
+    the Content-Type. Text isn't size-capped: it is inlined as-is.
+    """
+    def read(resp):
+        if resp.status_code != 200:
+            return None
+        mime = mime_of(resp)
+        text = as_text if as_text is not None else any(kind in mime for kind in TEXT_TYPES)
+        if text:
+            return ('text', resp.text, mime)
+        data_uri = _encode_logged(resp, mime, max_bytes)
+        return ('data', data_uri, mime) if data_uri else None
+    return pipeline.get_resource(url, timeout, read=read)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+DNS CACHE - In-process, TTL-respecting resolver cache for upstream hosts
+Installed under urllib3 so every requests fetch in the process resolves
+through it. Record TTLs come from dnspython when it is installed; with
+only the system resolver (which hides TTLs) DNS_DEFAULT_TTL is used.
+Expired entries are kept as a fallback if re-resolution fails.
+"""
+import ipaddress
+import os
+import socket
+import threading
+import time
+
+import urllib3.util.connection as urllib3_connection
+
+from latency import tracker
+
+try:
+    import dns.resolver
+except ImportError:
+    dns = None
+
+# Configuration (environment overrides)
+DNS_DEFAULT_TTL = int(os.environ.get('PROXY_DNS_TTL', 60))      # when the resolver gives no TTL
+DNS_MIN_TTL = int(os.environ.get('PROXY_DNS_MIN_TTL', 5))
+DNS_MAX_TTL = int(os.environ.get('PROXY_DNS_MAX_TTL', 600))
+DNS_MAX_ENTRIES = 1024
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class DNSCache:
+    """Thread-safe cache of getaddrinfo-style results keyed by host/port/family"""
+
+    def __init__(self, default_ttl=DNS_DEFAULT_TTL, min_ttl=DNS_MIN_TTL, max_ttl=DNS_MAX_TTL):
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self._entries = {}  # (host, port, family) -> (expires_at, addrinfos)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+
+    def _lookup_dnspython(self, host, port, family):
+        """Resolve with record TTLs; returns (addrinfos, ttl)"""
+        addrinfos = []
+        ttls = []
+        queries = []
+        if family in (socket.AF_UNSPEC, socket.AF_INET):
+            queries.append(('A', socket.AF_INET))
+        if family in (socket.AF_UNSPEC, socket.AF_INET6):
+            queries.append(('AAAA', socket.AF_INET6))
+        for rdtype, af in queries:
+            try:
+                answer = dns.resolver.resolve(host, rdtype)
+            except Exception:
+                continue
+            ttls.append(answer.rrset.ttl)
+            for record in answer:
+                sockaddr = (record.address, port) if af == socket.AF_INET else (record.address, port, 0, 0)
+                addrinfos.append((af, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', sockaddr))
+        if not addrinfos:
+            raise socket.gaierror(socket.EAI_NONAME, f"no A/AAAA records for {host}")
+        return addrinfos, min(ttls)
+
+    def _lookup(self, host, port, family):
+        if dns is not None:
+            try:
+                return self._lookup_dnspython(host, port, family)
+            except Exception:
+                pass
+        addrinfos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        return addrinfos, self.default_ttl
+
+    def resolve(self, host, port, family=socket.AF_UNSPEC):
+        """getaddrinfo() for host, served from cache while its TTL lasts"""
+        if _is_ip(host):
+            return socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+
+        key = (host.lower(), port, family)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        try:
+            addrinfos, ttl = self._lookup(host, port, family)
+        except OSError:
+            if entry:
+                # Resolver trouble - an expired answer beats no answer
+                self.stale_served += 1
+                return entry[1]
+            raise
+
+        ttl = max(self.min_ttl, min(self.max_ttl, ttl))
+        with self._lock:
+            if len(self._entries) >= DNS_MAX_ENTRIES:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (now + ttl, addrinfos)
+        return addrinfos
+
+    def invalidate(self, host):
+        """Forget every cached answer for host"""
+        host = host.lower()
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == host]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'entries': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_served': self.stale_served,
+            'resolver': 'dnspython' if dns is not None else 'system',
+        }
+
+
+cache = DNSCache()
+_original_create_connection = urllib3_connection.create_connection
+
+
+def create_connection(address, *args, **kwargs):
+    """urllib3 create_connection() that resolves through the cache"""
+    host, port = address
+    host = host.strip('[]')
+    if _is_ip(host):
+        return _original_create_connection((host, port), *args, **kwargs)
+
+    addrinfos = cache.resolve(host, port, urllib3_connection.allowed_gai_family())
+    err = None
+    for addrinfo in addrinfos:
+        try:
+            # An IP literal makes urllib3's own getaddrinfo a no-op; TLS SNI and
+            # certificate checks still use the hostname held by the connection
+            start = time.monotonic()
+            sock = _original_create_connection((addrinfo[4][0], port), *args, **kwargs)
+            tracker.observe(host, time.monotonic() - start, 'connect')
+            return sock
+        except OSError as e:
+            err = e
+    # Every cached address failed - the host may have moved
+    cache.invalidate(host)
+    raise err if err else OSError(f"no addresses for {host}")
+
+
+def install():
+    """Route all urllib3 (and so requests) connections through the cache"""
+    urllib3_connection.create_connection = create_connection
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+EARLY HINTS - Preload the critical subresources of rewritten pages
+After a page is rewritten, its proxied stylesheets, fonts and first-party
+scripts are collected - in that priority order, capped at PRELOAD_MAX - and
+sent as Link: rel=preload headers on the HTML response, so the browser
+starts fetching them while it is still parsing.
+
+The list is also remembered per page. With PROXY_EARLY_HINTS=1 the next
+request for that page gets it as a 103 Early Hints response written to the
+client socket before the upstream fetch even starts. That needs an HTTP/1.1
+client and a WSGI server that exposes its socket (werkzeug, gunicorn), and
+every hop in front of the proxy must tolerate 1xx responses - so it is off
+by default.
+"""
+import html
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs, quote, urljoin, urlparse
+
+from flask import request
+
+from relay import client_socket
+
+# Configuration (environment overrides)
+EARLY_HINTS = os.environ.get('PROXY_EARLY_HINTS', '0') == '1'  # send 103 before the upstream fetch
+PRELOAD_MAX = int(os.environ.get('PROXY_PRELOAD_MAX', 8))     # Link preloads per page
+REMEMBERED_PAGES = 512                                          # pages whose hints are kept for 103s
+
+STYLE, FONT, SCRIPT = 0, 1, 2  # preload priority, most critical first
+PRELOAD_AS = {STYLE: 'style', FONT: 'font', SCRIPT: 'script'}
+FONT_EXTENSIONS = ('.woff2', '.woff', '.ttf', '.otf', '.eot')
+
+TAG_PATTERN = re.compile(r'<(link|script)\b([^>]*)>', re.I)
+ATTR_PATTERN = re.compile(r'([\w-]+)\s*=\s*(["\'])(.*?)\2', re.S)
+
+
+def _site(host):
+    """Registrable-ish part of a host: the last two labels"""
+    return '.'.join((host or '').lower().split('.')[-2:])
+
+
+def _upstream(url, page_url):
+    """Upstream URL behind a proxied URL"""
+    parsed = urlparse(url)
+    if parsed.path.endswith('/proxy') and 'url' in parse_qs(parsed.query):
+        return parse_qs(parsed.query)['url'][0]
+    # Anything else on the proxy's origin maps onto the page's site
+    return urljoin(page_url, parsed.path)
+
+
+def _proxied(url, proxy_host):
+    """Relative URLs and URLs on the proxy's own origin"""
+    if url.startswith(('data:', 'blob:', 'javascript:', '#')):
+        return False
+    netloc = urlparse(url).netloc
+    return not netloc or netloc == proxy_host
+
+
+def collect(page_html, page_url, proxy_origin, limit=PRELOAD_MAX):
+    """Link header values for a rewritten page's critical subresources"""
+    proxy_host = urlparse(proxy_origin).netloc
+    page_site = _site(urlparse(page_url).hostname)
+    found = {}
+    for match in TAG_PATTERN.finditer(page_html):
+        tag = match.group(1).lower()
+        attrs = {name.lower(): html.unescape(value) for name, _, value in ATTR_PATTERN.findall(match.group(2))}
+        if tag == 'link':
+            url = attrs.get('href', '').strip()
+            rel = attrs.get('rel', '').lower().split()
+            if 'stylesheet' in rel:
+                kind = STYLE
+            elif attrs.get('as', '').lower() == 'font' or urlparse(url).path.lower().endswith(FONT_EXTENSIONS):
+                kind = FONT
+            else:
+                continue
+        else:
+            url = attrs.get('src', '').strip()
+            if attrs.get('type', '').lower() == 'module':
+                continue
+            kind = SCRIPT
+        if not url or url in found or not _proxied(url, proxy_host):
+            continue
+        if kind == SCRIPT and _site(urlparse(_upstream(url, page_url)).hostname) != page_site:
+            continue
+        found[url] = kind
+
+    ranked = sorted(found.items(), key=lambda item: item[1])[:limit]
+    links = []
+    for url, kind in ranked:
+        link = f'<{quote(url, safe=":/?&=%#;,+@!$*~")}>; rel=preload; as={PRELOAD_AS[kind]}'
+        if kind == FONT:
+            link += '; crossorigin'
+        links.append(link)
+    return links
+
+
+class PreloadHints:
+    """Per-page preload lists, emitted as Link headers and 103 Early Hints"""
+
+    def __init__(self, early=EARLY_HINTS, remembered=REMEMBERED_PAGES):
+        self.early = early
+        self.remembered = remembered
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.preloads = self.early_sent = 0
+
+    def send_early(self, page_url):
+        """Write a 103 for a page whose hints are known; True if sent"""
+        if not self.early or request.environ.get('SERVER_PROTOCOL') != 'HTTP/1.1':
+            return False
+        with self._lock:
+            links = self._pages.get(page_url)
+        sock = client_socket()
+        if not links or sock is None:
+            return False
+        head = 'HTTP/1.1 103 Early Hints\r\n' + ''.join(f'Link: {link}\r\n' for link in links) + '\r\n'
+        try:
+            sock.sendall(head.encode('latin-1'))
+        except (OSError, UnicodeEncodeError):
+            return False
+        with self._lock:
+            self.early_sent += 1
+        return True
+
+    def apply(self, response, page_url, links):
+        """Add preload Link headers to the final response and remember them"""
+        if not links:
+            return response
+        for link in links:
+            response.headers.add('Link', link)
+        with self._lock:
+            self.preloads += 1
+            self._pages[page_url] = links
+            self._pages.move_to_end(page_url)
+            while len(self._pages) > self.remembered:
+                self._pages.popitem(last=False)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'early_hints': self.early,
+                'pages': len(self._pages),
+                'preloaded_responses': self.preloads,
+                'early_hints_sent': self.early_sent,
+            }
+
+
+hints = PreloadHints()
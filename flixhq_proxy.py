@@ -3,10 +3,12 @@
 FlixHQ Streaming Proxy - Full video streaming support
 Proxies both page content AND video streams
 """
-from flask import Flask, Response, request, stream_with_context
-import requests
+from flask import Flask, request
 import re
-from urllib.parse import urljoin, urlparse, parse_qs, urlencode
+from urllib.parse import urljoin
+
+import pipeline
+from relay import passthrough
 
 app = Flask(__name__)
 
@@ -31,42 +33,7 @@ def rewrite_urls(content, base_url):
     
     return content
 
-@app.route('/iframe-proxy')
-def iframe_proxy():
-    """Proxy embedded iframes - handles video player embeds"""
-    iframe_url = request.args.get('url')
-    
-    if not iframe_url:
-        return "No iframe URL provided", 400
-    
-    print(f"\n{'='*70}")
-    print(f"[IFRAME PROXY] Loading embedded iframe")
-    print(f"[IFRAME PROXY] URL: {iframe_url}")
-    print(f"{'='*70}\n")
-    
-    try:
-        # Fetch the iframe content
-        resp = requests.get(
-            iframe_url,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': TARGET_URL,
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
-            },
-            timeout=15
-        )
-        
-        content_type = resp.headers.get('Content-Type', '')
-        
-        # If it's HTML, rewrite it to proxy through us
-        if 'text/html' in content_type:
-            html = resp.text
-            
-            # Rewrite URLs in the iframe to go through our proxy
-            html = rewrite_urls(html, iframe_url)
-            
-            # Inject the same interceptor
-            interceptor = '''
+IFRAME_INTERCEPTOR = '''
 <script>
 console.log('[IFRAME] Proxy interceptor active in embedded frame');
 if (window.HTMLMediaElement) {
@@ -83,119 +50,8 @@ if (window.HTMLMediaElement) {
 }
 </script>
 '''
-            html = html.replace('</head>', interceptor + '</head>', 1) if '</head>' in html else interceptor + html
-            
-            print(f"[IFRAME PROXY] ✓ Proxied iframe HTML ({len(html)} bytes)")
-            return Response(html, content_type='text/html', headers={
-                'Access-Control-Allow-Origin': '*',
-                'X-Frame-Options': 'ALLOWALL'
-            })
-        
-        # For non-HTML, just pass through
-        else:
-            print(f"[IFRAME PROXY] ✓ Passing through {content_type}")
-            return Response(resp.content, content_type=content_type, headers={
-                'Access-Control-Allow-Origin': '*'
-            })
-        
-    except Exception as e:
-        print(f"[IFRAME PROXY] ❌ Error: {e}")
-        return f"Iframe proxy error: {e}", 500
-
-@app.route('/video-proxy')
-def video_proxy():
-    """Proxy video streams - handles MP4, M3U8, etc."""
-    video_url = request.args.get('url')
-    
-    if not video_url:
-        return "No video URL provided", 400
-    
-    print(f"\n{'='*70}")
-    print(f"[VIDEO PROXY] Attempting to stream video")
-    print(f"[VIDEO PROXY] URL: {video_url}")
-    print(f"{'='*70}\n")
-    
-    try:
-        # Stream the video
-        resp = requests.get(
-            video_url,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'https://flixhq.to/',
-                'Origin': 'https://flixhq.to'
-            },
-            stream=True,
-            timeout=30
-        )
-        
-        # Get content type
-        content_type = resp.headers.get('Content-Type', 'video/mp4')
-        
-        print(f"[VIDEO PROXY] ✓ Streaming {content_type} - Status: {resp.status_code}")
-        
-        # Stream response
-        def generate():
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    yield chunk
-        
-        return Response(
-            stream_with_context(generate()),
-            content_type=content_type,
-            headers={
-                'Access-Control-Allow-Origin': '*',
-                'Cache-Control': 'no-cache'
-            }
-        )
-        
-    except Exception as e:
-        print(f"[VIDEO PROXY] ❌ Error: {e}")
-        return f"Video proxy error: {e}", 500
 
-@app.route('/')
-@app.route('/<path:path>')
-def proxy_page(path=''):
-    """Proxy FlixHQ pages"""
-    
-    # Build target URL
-    if path:
-        target_url = urljoin(TARGET_URL, path)
-    else:
-        target_url = TARGET_URL
-    
-    # Add query parameters
-    if request.query_string:
-        target_url += '?' + request.query_string.decode()
-    
-    print(f"\n[PROXY] {request.method} {target_url}")
-    
-    try:
-        # Forward the request
-        resp = requests.request(
-            method=request.method,
-            url=target_url,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': request.headers.get('Accept', '*/*'),
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Referer': 'https://flixhq.to/'
-            },
-            data=request.get_data(),
-            allow_redirects=True,
-            timeout=15
-        )
-        
-        content_type = resp.headers.get('Content-Type', '')
-        
-        # Handle HTML pages
-        if 'text/html' in content_type:
-            html = resp.text
-            
-            # Rewrite URLs to go through proxy
-            html = rewrite_urls(html, target_url)
-            
-            # Inject video proxy interceptor
-            interceptor = '''
+PAGE_INTERCEPTOR = '''
 <script>
 (function() {
     console.log('[FlixHQ Proxy] AGGRESSIVE MODE - Intercepting EVERYTHING...');
@@ -254,48 +110,117 @@ def proxy_page(path=''):
 })();
 </script>
 '''
-            html = html.replace('</head>', interceptor + '</head>', 1)
-            
-            # Add status banner
-            banner = '''
+
+PAGE_BANNER = '''
 <div style="position:fixed;bottom:0;left:0;right:0;background:linear-gradient(135deg,#10b981,#059669);color:#fff;padding:8px 15px;z-index:999999;text-align:center;font-size:12px;font-family:monospace;">
     🎬 FlixHQ Streaming Proxy Active - Videos streaming through GitHub Codespaces
 </div>
 '''
-            html = html.replace('</body>', banner + '</body>', 1)
-            
-            print(f"[PROXY] ✓ Served HTML ({len(html)} bytes)")
-            
-            return Response(html, content_type='text/html')
+
+def inject_iframe_interceptor(html, iframe_url):
+    """Same video interceptor, inside the embedded frame"""
+    if '</head>' in html:
+        return html.replace('</head>', IFRAME_INTERCEPTOR + '</head>', 1)
+    return IFRAME_INTERCEPTOR + html
+
+def inject_page_interceptor(html, target_url):
+    """Video proxy interceptor and status banner"""
+    html = html.replace('</head>', PAGE_INTERCEPTOR + '</head>', 1)
+    return html.replace('</body>', PAGE_BANNER + '</body>', 1)
+
+def log_video_sources(js, target_url):
+    """Log if this is a video source response"""
+    if 'sources' in target_url or 'episode' in target_url:
+        print(f"[DEBUG] Video source response: {js[:500]}")
+    return js
+
+IFRAME_MODE = pipeline.Mode(
+    'iframe',
+    upstream_headers={
+        'Referer': TARGET_URL,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+    },
+    transforms={'html': (rewrite_urls, inject_iframe_interceptor)},
+    headers={'Access-Control-Allow-Origin': '*', 'X-Frame-Options': 'ALLOWALL'},
+    error_page='Iframe proxy error: {}',
+)
+
+PAGE_MODE = pipeline.Mode(
+    'proxy',
+    upstream_headers={'Accept-Language': 'en-US,en;q=0.9', 'Referer': 'https://flixhq.to/'},
+    transforms={
+        'html': (rewrite_urls, inject_page_interceptor),
+        'css': (rewrite_urls,),
+        'script': (log_video_sources, rewrite_urls),
+    },
+    relay_headers={'Access-Control-Allow-Origin': '*'},  # CORS for relayed media, not pages
+    error_page='<h1>Proxy Error</h1><p>{}</p>',
+    early_hints=True,
+)
+
+@app.route('/iframe-proxy')
+def iframe_proxy():
+    """Proxy embedded iframes - handles video player embeds"""
+    iframe_url = request.args.get('url')
+    
+    if not iframe_url:
+        return "No iframe URL provided", 400
+    
+    return pipeline.run(IFRAME_MODE, iframe_url)
+
+@app.route('/video-proxy')
+def video_proxy():
+    """Proxy video streams - handles MP4, M3U8, etc."""
+    video_url = request.args.get('url')
+    
+    if not video_url:
+        return "No video URL provided", 400
+    
+    print(f"\n{'='*70}")
+    print(f"[VIDEO PROXY] Attempting to stream video")
+    print(f"[VIDEO PROXY] URL: {video_url}")
+    print(f"{'='*70}\n")
+    
+    try:
+        # Stream the video
+        resp = pipeline.fetch(video_url, request_class='video', cached=False, headers={
+            'Referer': 'https://flixhq.to/',
+            'Origin': 'https://flixhq.to'
+        })
         
-        # Handle CSS
-        elif 'text/css' in content_type:
-            css = resp.text
-            css = rewrite_urls(css, target_url)
-            return Response(css, content_type='text/css')
+        # Get content type
+        content_type = resp.headers.get('Content-Type', 'video/mp4')
         
-        # Handle JavaScript
-        elif 'javascript' in content_type or 'application/json' in content_type:
-            js = resp.text
-            
-            # Log if this is a video source response
-            if 'sources' in target_url or 'episode' in target_url:
-                print(f"[DEBUG] Video source response: {js[:500]}")
-            
-            js = rewrite_urls(js, target_url)
-            return Response(js, content_type=content_type)
+        print(f"[VIDEO PROXY] ✓ Streaming {content_type} - Status: {resp.status_code}")
         
-        # Handle everything else (images, fonts, etc.)
-        else:
-            return Response(
-                resp.content,
-                content_type=content_type,
-                headers={'Access-Control-Allow-Origin': '*'}
-            )
+        # Stream response
+        return passthrough(resp, content_type, headers={
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-cache'
+        })
         
     except Exception as e:
-        print(f"[PROXY] Error: {e}")
-        return f"<h1>Proxy Error</h1><p>{e}</p>", 500
+        print(f"[VIDEO PROXY] ❌ Error: {e}")
+        return f"Video proxy error: {e}", 500
+
+@app.route('/')
+@app.route('/<path:path>')
+def proxy_page(path=''):
+    """Proxy FlixHQ pages"""
+    
+    # Build target URL
+    if path:
+        target_url = urljoin(TARGET_URL, path)
+    else:
+        target_url = TARGET_URL
+    
+    # Add query parameters
+    if request.query_string:
+        target_url += '?' + request.query_string.decode()
+    
+    return pipeline.run(PAGE_MODE, target_url, request.method,
+                        headers={'Accept': request.headers.get('Accept', '*/*')},
+                        data=request.get_data())
 
 if __name__ == '__main__':
     print("\n" + "="*70)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+HEDGE - Hedged requests for idempotent, latency-critical sub-fetches
+If a fetch hasn't finished by its host's observed p90 latency a second
+attempt is started and whichever succeeds first wins; the loser is left to
+finish in the background. Hedges are paid for out of a token budget that
+grows by HEDGE_BUDGET per fetch, capping the extra load at ~5% of fetches.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from latency import tracker
+
+# Configuration (environment overrides)
+HEDGE_ENABLED = os.environ.get('PROXY_HEDGE', '1') != '0'
+HEDGE_PERCENTILE = float(os.environ.get('PROXY_HEDGE_PERCENTILE', 90))
+HEDGE_BUDGET = float(os.environ.get('PROXY_HEDGE_BUDGET', 0.05))   # extra requests per fetch
+HEDGE_BURST = 10           # most hedges that can be saved up while idle
+HEDGE_MIN_SAMPLES = 20     # observations needed before a host is hedged
+HEDGE_MIN_DELAY = 0.05     # seconds - never hedge sooner than this
+HEDGE_WORKERS = 64
+
+
+class Hedger:
+    """Runs fetches with an optional budgeted backup attempt"""
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET, enabled=HEDGE_ENABLED):
+        self.percentile = percentile
+        self.budget = budget
+        self.enabled = enabled
+        self.tokens = 0.0
+        self.fetches = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+
+    def _timed(self, url, fn, args, kwargs):
+        start = time.monotonic()
+        result = fn(*args, **kwargs)
+        tracker.observe(url, time.monotonic() - start)
+        return result
+
+    def _submit(self, url, fn, args, kwargs):
+        ctx = contextvars.copy_context()
+        return self._pool.submit(ctx.run, self._timed, url, fn, args, kwargs)
+
+    def _take_token(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.hedged += 1
+                return True
+            self.budget_denied += 1
+            return False
+
+    def delay_for(self, url):
+        """Seconds to wait before hedging url, or None if it can't be hedged yet"""
+        p = tracker.percentile(url, self.percentile, min_samples=HEDGE_MIN_SAMPLES)
+        return None if p is None else max(p, HEDGE_MIN_DELAY)
+
+    def call(self, url, fn, *args, ok=None, **kwargs):
+        """fn(*args, **kwargs), hedged against url's host latency
+
+        fn must be idempotent; it may run twice. ok(result), if given, says
+        whether a returned result counts as a success - a failed attempt
+        doesn't win a race the other one may still succeed in.
+        """
+        with self._lock:
+            self.fetches += 1
+            self.tokens = min(HEDGE_BURST, self.tokens + self.budget)
+
+        delay = self.delay_for(url) if self.enabled else None
+        if delay is None:
+            return self._timed(url, fn, args, kwargs)
+
+        primary = self._submit(url, fn, args, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_token():
+            return primary.result()
+
+        backup = self._submit(url, fn, args, kwargs)
+        pending = {primary, backup}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done
+                         if future.exception() is None and (ok is None or ok(future.result()))]
+            if succeeded or not pending:
+                # First success wins; if both failed, surface the last error
+                winner = succeeded[0] if succeeded else done.pop()
+                if succeeded and winner is backup:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return winner.result()
+        return primary.result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'fetches': self.fetches,
+                'hedged': self.hedged,
+                'hedge_rate': round(self.hedged / self.fetches, 4) if self.fetches else 0,
+                'hedge_wins': self.hedge_wins,
+                'win_rate': round(self.hedge_wins / self.hedged, 4) if self.hedged else 0,
+                'budget_denied': self.budget_denied,
+            }
+
+
+hedger = Hedger()
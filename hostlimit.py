@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+HOST LIMIT - Per-upstream-host concurrency limits with fair queuing
+Each upstream host gets at most N fetches in flight (PROXY_HOST_LIMIT, or a
+per-host value from PROXY_HOST_LIMITS). Excess fetches wait in per-flow
+queues - a flow is one client request - and free slots are handed out
+round-robin across flows, so one page assembly bursting 40 images can't
+starve every other client queued behind it.
+"""
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from breaker import FastFail
+
+# Configuration (environment overrides)
+HOST_LIMIT = int(os.environ.get('PROXY_HOST_LIMIT', 6))                      # default in-flight per host
+HOST_QUEUE_TIMEOUT = float(os.environ.get('PROXY_HOST_QUEUE_TIMEOUT', 30))   # seconds before giving up
+WAIT_SAMPLES = 256  # recent waits kept per host for percentiles
+
+
+def parse_limits(spec):
+    """'img.example.com=4,cdn.example.net=12' -> {host: limit}"""
+    limits = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            host, limit = item.split('=', 1)
+            limits[host.strip().lower()] = int(limit)
+    return limits
+
+
+HOST_LIMITS = parse_limits(os.environ.get('PROXY_HOST_LIMITS', ''))
+
+current_flow = contextvars.ContextVar('hostlimit_flow', default=None)
+_flow_ids = itertools.count(1)
+
+
+class HostBusy(FastFail):
+    """Timed out waiting for a free slot to an upstream host"""
+
+
+class _HostState:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.flows = OrderedDict()  # flow -> deque of waiting Events, in round-robin order
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.granted = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+
+
+class HostLimiter:
+    """Counts in-flight fetches per host and queues the excess fairly"""
+
+    def __init__(self, default_limit=HOST_LIMIT, limits=None, queue_timeout=HOST_QUEUE_TIMEOUT):
+        self.default_limit = default_limit
+        self.limits = dict(HOST_LIMITS if limits is None else limits)
+        self.queue_timeout = queue_timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def limit_for(self, host):
+        return self.limits.get(host.split(':')[0], self.default_limit)
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.limit_for(host))
+        return state
+
+    def _grant(self, state):
+        """Hand free slots to waiters, one flow at a time (lock held)"""
+        while state.active < state.limit and state.flows:
+            flow, waiters = next(iter(state.flows.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                state.flows.move_to_end(flow)
+            else:
+                del state.flows[flow]
+            state.active += 1
+            waiter.set()
+
+    def _record(self, state, waited):
+        state.granted += 1
+        state.waits.append(waited)
+        state.max_wait = max(state.max_wait, waited)
+
+    def acquire(self, host, flow=None):
+        flow = flow if flow is not None else (current_flow.get() or threading.get_ident())
+        with self._lock:
+            state = self._state(host)
+            if state.active < state.limit and not state.flows:
+                state.active += 1
+                self._record(state, 0.0)
+                return
+            waiter = threading.Event()
+            state.flows.setdefault(flow, deque()).append(waiter)
+            state.queued += 1
+
+        start = time.monotonic()
+        granted = waiter.wait(self.queue_timeout)
+        with self._lock:
+            if not granted and not waiter.is_set():
+                waiters = state.flows.get(flow)
+                if waiters is not None:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del state.flows[flow]
+                state.timeouts += 1
+                raise HostBusy(f"no free slot for {host} after {self.queue_timeout:g}s")
+            self._record(state, time.monotonic() - start)
+
+    def try_acquire(self, host):
+        """Take a slot only if one is free and nobody is queued (background work)"""
+        with self._lock:
+            state = self._state(host)
+            if state.active < state.limit and not state.flows:
+                state.active += 1
+                self._record(state, 0.0)
+                return True
+            return False
+
+    def release(self, host):
+        with self._lock:
+            state = self._hosts[host]
+            state.active -= 1
+            self._grant(state)
+
+    @contextmanager
+    def slot(self, url):
+        """Hold one of url's host slots for the duration of the block"""
+        host = urlparse(url).netloc.lower()
+        self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def stats(self):
+        result = {}
+        with self._lock:
+            for host, state in self._hosts.items():
+                waits = sorted(state.waits)
+                result[host] = {
+                    'limit': state.limit,
+                    'active': state.active,
+                    'waiting': sum(len(w) for w in state.flows.values()),
+                    'granted': state.granted,
+                    'queued': state.queued,
+                    'timeouts': state.timeouts,
+                    'wait_p50_ms': round(waits[len(waits) // 2] * 1000, 1) if waits else 0,
+                    'wait_p95_ms': round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0,
+                    'wait_max_ms': round(state.max_wait * 1000, 1),
+                }
+        return result
+
+
+limiter = HostLimiter()
+
+
+def begin_flow():
+    """Start a new flow for the current client request"""
+    current_flow.set(next(_flow_ids))
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit() that keeps the caller's flow in the worker thread"""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+def init_app(app):
+    """Give every request to a Flask app its own flow"""
+    app.before_request(begin_flow)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+IMAGE OPT - Downscale and recompress images before they are inlined
+A page that shows a 3000px photo as a 200px thumbnail still got the whole
+photo embedded. When Pillow is installed, every image datauri.py inlines
+is first decoded and shrunk to fit PROXY_IMAGE_MAX_DIM, then re-encoded
+as PROXY_IMAGE_FORMAT at PROXY_IMAGE_QUALITY. The original is kept
+whenever the result is not smaller, and also for SVG and animated images.
+
+Decoding and encoding are CPU-bound, so they run in a process pool rather
+than on the request threads, where they would hold the GIL. Results are
+stored in the shared cache under the source bytes' hash plus the
+parameters. The same image reached through different URLs, or by another
+node, is converted only once.
+
+Without Pillow, or with PROXY_IMAGE_OPTIMIZE=0, images are inlined as
+fetched.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cache_backends
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Configuration (environment overrides)
+OPTIMIZE = os.environ.get('PROXY_IMAGE_OPTIMIZE', '1') != '0'
+MAX_DIM = int(os.environ.get('PROXY_IMAGE_MAX_DIM', 1024))                     # px, longest side
+QUALITY = int(os.environ.get('PROXY_IMAGE_QUALITY', 70))                       # 1-100
+FORMAT = os.environ.get('PROXY_IMAGE_FORMAT', 'webp').upper()                  # WEBP / JPEG / PNG
+SOURCE_MAX_BYTES = int(os.environ.get('PROXY_IMAGE_SOURCE_MAX_BYTES', 8000000))  # largest image decoded
+WORKERS = int(os.environ.get('PROXY_IMAGE_WORKERS', min(4, os.cpu_count() or 1)))
+CONVERT_TIMEOUT = 10       # seconds before the original is used instead
+RESULT_TTL = 86400         # seconds a converted image is reused
+
+SKIP_TYPES = ('image/svg+xml', 'image/gif')  # vector, or usually animated
+
+enabled = OPTIMIZE and Image is not None
+results = cache_backends.namespace('img')
+
+
+def applies(mime):
+    """Is an image of this MIME type recompressed before inlining?"""
+    return enabled and mime.startswith('image/') and mime not in SKIP_TYPES
+
+
+def convert(data, max_dim, quality, fmt):
+    """(bytes, mime) for data shrunk and re-encoded, or None to keep it
+
+    Runs in a pool worker.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        if getattr(img, 'is_animated', False):
+            return None
+        img.draft('RGB', (max_dim, max_dim))  # JPEG decodes straight at a reduced scale
+        img.thumbnail((max_dim, max_dim))
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        if fmt == 'JPEG':
+            if has_alpha:
+                return None
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+        out = io.BytesIO()
+        img.save(out, fmt, quality=quality, optimize=True)
+    except Exception:
+        return None
+    if out.tell() >= len(data):
+        return None
+    return out.getvalue(), Image.MIME[fmt]
+
+
+class ImageOptimizer:
+    """Process pool plus result cache in front of convert()"""
+
+    def __init__(self, max_dim=MAX_DIM, quality=QUALITY, fmt=FORMAT, workers=WORKERS):
+        self.params = (max_dim, quality, fmt)
+        self.workers = workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.converted = 0
+        self.kept = 0
+        self.hits = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _executor(self):
+        # A pool doesn't survive fork (gunicorn workers), so each process starts its own
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._pool
+
+    def key(self, data):
+        max_dim, quality, fmt = self.params
+        return f'{hashlib.sha256(data).hexdigest()}:{max_dim}:{quality}:{fmt}'
+
+    def optimize(self, data, mime):
+        """(bytes, mime) to inline for an image body: the converted one or the original"""
+        if not applies(mime) or len(data) > SOURCE_MAX_BYTES:
+            return data, mime
+        key = self.key(data)
+        cached = results.get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            if not cached:
+                return data, mime
+            new_mime, _, body = cached.partition(b'\n')
+            return body, new_mime.decode('ascii')
+        try:
+            result = self._executor().submit(convert, data, *self.params).result(timeout=CONVERT_TIMEOUT)
+        except Exception as e:
+            print(f"[IMAGE   ] ✗ convert failed: {e!r}", flush=True)
+            with self._lock:
+                self.errors += 1
+                if isinstance(e, BrokenProcessPool):  # a worker died (e.g. OOM); start over next time
+                    self._pool = None
+            return data, mime
+        with self._lock:
+            self.bytes_in += len(data)
+            if result is None:
+                self.kept += 1
+                self.bytes_out += len(data)
+            else:
+                self.converted += 1
+                self.bytes_out += len(result[0])
+        if result is None:
+            results.set(key, b'', RESULT_TTL)
+            return data, mime
+        body, new_mime = result
+        results.set(key, new_mime.encode('ascii') + b'\n' + body, RESULT_TTL)
+        return body, new_mime
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': enabled,
+                'converted': self.converted,
+                'kept': self.kept,
+                'hits': self.hits,
+                'errors': self.errors,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+            }
+
+
+optimizer = ImageOptimizer()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+INLINING - Byte-budgeted choice of what ultra mode embeds in a page
+Inlining every image a page references can turn it into a 50 MB document.
+Instead each page gets a budget of bytes it may grow by. Candidates are
+sized first: a cached size, or a concurrent HEAD for its Content-Length.
+They are then taken in document order, since what comes first is what the
+user sees first. A resource is skipped when it is over the per-resource
+limit or no longer fits what is left of the budget, and smaller ones
+further down can still use the remainder. Whatever isn't inlined stays a
+proxied URL the browser loads on its own.
+
+Sizes only estimate. Once a resource is fetched, settle() books its real
+size and refuses it if the budget has been overrun after all.
+
+Defaults come from PROXY_INLINE_BUDGET and PROXY_INLINE_MAX_BYTES. A
+request can pick its own with ?inline_budget=<bytes>&inline_max=<bytes>,
+up to PROXY_INLINE_BUDGET_CEILING. inline_budget=0 inlines nothing.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cache_backends
+import datauri
+import hostlimit
+import imageopt
+import timeouts
+from breaker import breaker
+from upstream import session
+
+# Configuration (environment overrides)
+INLINE_BUDGET = int(os.environ.get('PROXY_INLINE_BUDGET', 3000000))                 # bytes a page may grow by
+INLINE_BUDGET_CEILING = int(os.environ.get('PROXY_INLINE_BUDGET_CEILING', 20000000))  # cap on per-request values
+MAX_CANDIDATES = 64        # resources considered per page
+PROBE_WORKERS = 8          # concurrent HEAD requests per page
+SIZE_TTL = 3600            # seconds a probed size is reused
+
+sizes = cache_backends.namespace('size')
+
+
+def _bytes_arg(args, name, default):
+    """Non-negative integer query parameter, clamped to the ceiling"""
+    try:
+        value = int(args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+    return min(max(value, 0), INLINE_BUDGET_CEILING)
+
+
+def probe(url):
+    """Upstream size of url in bytes, or None if it can't be told without a GET"""
+    cached = sizes.get(url)
+    if cached is not None:
+        return int(cached) if cached else None
+    size = None
+    try:
+        with breaker.guard(url) as attempt, hostlimit.limiter.slot(url):
+            resp = session.head(url, allow_redirects=True, timeout=timeouts.for_request(url, 'subresource'))
+            attempt.status(resp.status_code)
+        if resp.status_code == 200 and 'Content-Encoding' not in resp.headers:
+            size = datauri.content_length(resp)
+    except Exception as e:
+        print(f"[INLINE  ] ✗ HEAD {url[:80]}: {e}", flush=True)
+        return None
+    sizes.set(url, str(size if size is not None else '').encode('ascii'), SIZE_TTL)
+    return size
+
+
+class InlinePolicy:
+    """One page's inlining budget"""
+
+    def __init__(self, budget=INLINE_BUDGET, max_item=datauri.INLINE_MAX_BYTES):
+        self.budget = budget
+        self.max_item = max_item
+        self.spent = 0
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, args):
+        """Policy with any inline_budget / inline_max overrides from a request's query"""
+        return cls(_bytes_arg(args, 'inline_budget', INLINE_BUDGET),
+                   _bytes_arg(args, 'inline_max', datauri.INLINE_MAX_BYTES))
+
+    def choose(self, urls, encoded=True):
+        """The urls worth fetching for inlining, in document order
+
+        encoded means the resource is embedded as base64 (4/3 of its size)
+        rather than as text. Unknown sizes are tried; the per-resource cap
+        and settle() bound them.
+        """
+        urls = list(dict.fromkeys(urls))[:MAX_CANDIDATES]
+        if not urls or self.budget <= 0:
+            return []
+        with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(urls))) as executor:
+            futures = [hostlimit.submit(executor, probe, url) for url in urls]
+            probed = [(url, future.result()) for url, future in zip(urls, futures)]
+        # Shrunk images only have to fit once shrunk; settle() books what they came to
+        limit = max(self.max_item, imageopt.SOURCE_MAX_BYTES) if encoded and imageopt.enabled else self.max_item
+        chosen = []
+        with self._lock:
+            for url, size in probed:
+                if size is not None and size > limit:
+                    continue
+                if size is not None:
+                    size = min(size, self.max_item)
+                cost = (datauri.encoded_size(size) if encoded else size) if size is not None else 0
+                if self.spent + cost > self.budget:
+                    continue
+                self.spent += cost
+                self._reserved[url] = cost
+                chosen.append(url)
+        print(f"[INLINE  ] {len(chosen)}/{len(urls)} chosen, {self.spent}/{self.budget}b reserved", flush=True)
+        return chosen
+
+    def settle(self, url, cost):
+        """Book what inlining url actually adds; False means don't inline it after all"""
+        with self._lock:
+            self.spent -= self._reserved.pop(url, 0)
+            if self.spent + cost > self.budget:
+                return False
+            self.spent += cost
+            return True
+
+    def release(self, url):
+        """Give back url's reservation (its fetch failed)"""
+        with self._lock:
+            self.spent -= self._reserved.pop(url, 0)
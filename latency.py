@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+LATENCY - Rolling per-upstream-host latency samples
+Keeps the most recent LATENCY_SAMPLES observations per (host, metric) and
+answers percentile queries, so policies can adapt to how each host
+actually behaves instead of using one fixed number for everything.
+"""
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+LATENCY_SAMPLES = 200  # observations kept per host and metric
+
+
+def host_of(url):
+    """Hostname of a URL, or the value itself if it is already a host"""
+    if '//' not in url:
+        return url.lower()
+    return (urlparse(url).hostname or '').lower()
+
+
+class LatencyTracker:
+    """Thread-safe rolling latency windows keyed by (host, metric)"""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def observe(self, url, seconds, metric='fetch'):
+        key = (host_of(url), metric)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = deque(maxlen=self.samples)
+            window.append(seconds)
+
+    def count(self, url, metric='fetch'):
+        with self._lock:
+            return len(self._windows.get((host_of(url), metric), ()))
+
+    def percentile(self, url, q, metric='fetch', min_samples=1):
+        """q-th percentile (0-100) in seconds, or None with too few samples"""
+        with self._lock:
+            window = list(self._windows.get((host_of(url), metric), ()))
+        if len(window) < min_samples or not window:
+            return None
+        window.sort()
+        return window[min(len(window) - 1, int(len(window) * q / 100))]
+
+    def stats(self):
+        with self._lock:
+            windows = {key: sorted(window) for key, window in self._windows.items()}
+        result = {}
+        for (host, metric), window in windows.items():
+            result.setdefault(host, {})[metric] = {
+                'samples': len(window),
+                'p50_ms': round(window[len(window) // 2] * 1000, 1),
+                'p90_ms': round(window[int(len(window) * 0.9)] * 1000, 1),
+                'p99_ms': round(window[int(len(window) * 0.99)] * 1000, 1),
+            }
+        return result
+
+
+tracker = LatencyTracker()
@@ -1,16 +1,66 @@
+import time
+BOOT_TIME = time.monotonic()
+
 import requests
 import os
 import logging
 import sys
-import base64
-from flask import Flask, request, Response, abort, send_from_directory
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, Response, abort, send_from_directory, jsonify
 from urllib.parse import urljoin, urlparse
+from werkzeug.datastructures import Headers
+
+import admission
+import cache_backends
+import cluster
+import compression
+import datauri
+import early_hints
+import hostlimit
+import pipeline
+from relay import passthrough
+import stylesheets
+import prefetch
+import response_cache
+from prewarm import prewarmer
+from warmup import Warmup
 
 app = Flask(__name__)
+compression.init_app(app)
+hostlimit.init_app(app)
+cluster.init_app(app, cache_backends.local)
+warmup = Warmup('main', boot_time=BOOT_TIME)
+
+# Data URIs of embedded fonts and images, shared by all workers (see cache_backends)
+font_cache = cache_backends.namespace('font')
+image_cache = cache_backends.namespace('image')
+EMBED_CACHE_TTL = 24 * 3600  # seconds a fetched font/image data URI is reused
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg']
+EMBED_WORKERS = 8          # concurrent image fetches per page
+EMBED_MAX_BYTES = 500000   # only embed images smaller than this
+
+# Bump to make every client's service worker drop its cached assets
+SW_CACHE_VERSION = os.environ.get('PROXY_SW_CACHE_VERSION', '1')
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.m3u8', '.ts', '.m4s', '.mpd')
 
-# Simple in-memory cache for fonts and images
-font_cache = {}
-image_cache = {}
+def classify_request(req):
+    """Admission mode and priority for a request (None = never shed)"""
+    if req.path == '/healthz' or req.path.startswith('/cluster/'):
+        return None
+    if req.path in ('/content.js', '/sw.js'):
+        return ('static', admission.CHEAP)
+    target = req.args.get('url', '') if req.path == '/proxy' else req.path
+    if urlparse(target).path.lower().endswith(VIDEO_EXTENSIONS):
+        return ('video', admission.EXPENSIVE)
+    if req.method == 'GET':
+        url = target if req.path == '/proxy' else upstream_for_path(req.path, req.query_string.decode())
+        if url and response_cache.cache.likely_hit(url):
+            return ('page', admission.CHEAP)
+    return ('page', admission.NORMAL)
+
+admission.init_app(app, classify_request)
 
 # Configure logging to output to console and to a file so we can inspect logs
 log_file = os.path.join(os.path.dirname(__file__), 'proxy.log')
@@ -41,6 +91,81 @@ if not TARGET_URL.endswith("/"):
     TARGET_URL += "/"
 app.logger.info(f"Using TARGET_URL={TARGET_URL}")
 
+LOCAL_PATHS = ('/content.js', '/sw.js', '/healthz')
+
+def upstream_for_path(path, query):
+    """Upstream URL the catch-all route fetches for a proxy path"""
+    if path in LOCAL_PATHS:
+        return None
+    url = urljoin(TARGET_URL, path.lstrip('/'))
+    return f"{url}?{query}" if query else url
+
+def image_mime(resp):
+    """Upstream Content-Type if it names an image, else guessed from the URL"""
+    mime_type = resp.headers.get('Content-Type', 'image/jpeg')
+    if 'image/' in mime_type:
+        return mime_type
+    full_url = resp.url
+    if '.png' in full_url:
+        return 'image/png'
+    elif '.gif' in full_url:
+        return 'image/gif'
+    elif '.webp' in full_url:
+        return 'image/webp'
+    elif '.svg' in full_url:
+        return 'image/svg+xml'
+    return 'image/jpeg'
+
+def fetch_image_data_uri(full_url):
+    """Fetch one image and return it as a data URI, or None to fall back to the proxy URL"""
+    cached = image_cache.get(full_url)
+    if cached is not None:
+        return cached.decode('ascii')
+    try:
+        print(f"[PROXY] Fetching image for embedding: {full_url[:80]}...", flush=True)
+        # Streamed into the data URI; anything over EMBED_MAX_BYTES is abandoned early
+        data_uri = datauri.fetch(full_url, mime=image_mime, max_bytes=EMBED_MAX_BYTES)
+        if data_uri:
+            image_cache.set(full_url, data_uri.encode('ascii'), EMBED_CACHE_TTL)
+            print(f"[PROXY] Embedded image: {len(data_uri)} chars", flush=True)
+            return data_uri
+        print(f"[PROXY] Image too large or failed, using proxy: {full_url[:80]}", flush=True)
+    except Exception as e:
+        print(f"[PROXY] Failed to embed image {full_url[:50]}: {e}", flush=True)
+    return None
+
+def embed_images(urls):
+    """Fetch a set of image URLs concurrently; returns {url: data URI or None}
+
+    The cache is checked by fetch_image_data_uri, so lookups (L2 or peer
+    round trips with a shared backend) run concurrently too.
+    """
+    urls = list(urls)
+    if not urls:
+        return {}
+    print(f"[PROXY] Embedding {len(urls)} images", flush=True)
+    with ThreadPoolExecutor(max_workers=min(EMBED_WORKERS, len(urls))) as executor:
+        futures = {url: hostlimit.submit(executor, fetch_image_data_uri, url) for url in urls}
+        return {url: future.result() for url, future in futures.items()}
+
+def fetch_font_data_uri(full_url):
+    """Fetch one font and return it as a data URI, or None to fall back to the proxy URL"""
+    cached = font_cache.get(full_url)
+    if cached is not None:
+        return cached.decode('ascii')
+    try:
+        print(f"[PROXY] Fetching font for embedding: {full_url}", flush=True)
+        # Determine MIME type
+        mime_type = 'font/woff2' if '.woff2' in full_url else 'font/woff' if '.woff' in full_url else 'font/ttf'
+        data_uri = datauri.fetch(full_url, mime=mime_type)
+        if data_uri:
+            font_cache.set(full_url, data_uri.encode('ascii'), EMBED_CACHE_TTL)
+            print(f"[PROXY] Embedded font: {full_url[:50]}... ({len(data_uri)} chars)", flush=True)
+            return data_uri
+    except Exception as e:
+        print(f"[PROXY] Failed to embed font {full_url}: {e}", flush=True)
+    return None
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS', 'HEAD'])
 def proxy(path):
@@ -72,19 +197,21 @@ def proxy(path):
         headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
     
     print(f"[PROXY] Request headers: {headers}", flush=True)
+    if request.method == 'GET':
+        early_hints.hints.send_early(target_url)
+    
+    # A stylesheet transformed before is revalidated instead of downloaded again
+    css_validator = None
+    if request.method == 'GET' and not any(key.lower() in ('if-none-match', 'if-modified-since') for key in headers):
+        css_validator = stylesheets.cache.known_validator(target_url)
+    conditional = stylesheets.conditional_headers(css_validator) if css_validator else {}
     
     try:
-        # Make the request to the target website (streamed, with a timeout)
-        resp = requests.request(
-            method=request.method,
-            url=target_url,
-            headers=headers,
-            data=request.get_data(),
-            cookies=request.cookies,
-            allow_redirects=False,
-            stream=True,
-            timeout=10
-        )
+        # Streamed, with a timeout; subresources warmed by the prefetcher
+        # come straight from the shared cache
+        resp = pipeline.fetch(target_url, request.method, pipeline.client_request_class(),
+                              headers=dict(headers, **conditional), data=request.get_data(),
+                              cookies=request.cookies, allow_redirects=False)
 
         # Log upstream response headers for debugging
         print(f"[PROXY] Upstream headers: {dict(resp.headers)}", flush=True)
@@ -105,10 +232,25 @@ def proxy(path):
             proxy_origin = request.url_root.rstrip('/')
         
         print(f"[PROXY] Proxy origin: {proxy_origin}", flush=True)
+        
+        revalidated_css = None
+        if conditional and resp.status_code == 304:
+            revalidated_css = stylesheets.cache.lookup(target_url, css_validator, proxy_origin)
+            if revalidated_css is None:
+                # Only another origin's transform is cached - fetch the body after all
+                resp.close()
+                resp = pipeline.fetch(target_url, request.method, pipeline.client_request_class(),
+                                      headers=headers, cookies=request.cookies, allow_redirects=False)
 
         # If HTML, read and rewrite body so links to the target go through the proxy
+        preload_links = prefetch_urls = None
         content_type = resp.headers.get('Content-Type', '')
-        if 'text/html' in content_type.lower():
+        if revalidated_css is not None:
+            # Upstream says the stylesheet is unchanged - serve the cached transform
+            print(f"[PROXY] Stylesheet not modified, served from cache: {target_url[:80]}", flush=True)
+            resp.close()
+            response = Response(revalidated_css, status=200, mimetype='text/css')
+        elif 'text/html' in content_type.lower():
             try:
                 # grab full content (not streaming) so we can rewrite URLs
                 raw = resp.content
@@ -132,6 +274,7 @@ def proxy(path):
                         # Skip if URL already points to our proxy
                         if '/proxy?url=' in url or url.startswith(proxy_origin):
                             return full_url
+                        prewarmer.discover(url)
                         # Encode the full URL as a query parameter to proxy it
                         return f'{match.group(1)}="{proxy_origin}/proxy?url={quote(url)}"'
                     return full_url
@@ -139,64 +282,42 @@ def proxy(path):
                 # Replace URLs in href, src, srcset, content attributes
                 text = re.sub(r'(href|src|content)=["\']https?://[^"\']+["\']', rewrite_url, text)
                 
-                # Embed small images as base64 data URIs to bypass filter
-                def embed_image(match):
-                    full_match = match.group(0)
-                    url = match.group(2).strip('"').strip("'")
-                    
-                    # Skip if already proxied
+                # Embed small images as base64 data URIs to bypass filter.
+                # Scan for every embeddable src first, fetch them all
+                # concurrently, then substitute in a single pass.
+                src_pattern = r'(src)=["\']([^"\']+)["\']'
+                
+                def src_full_url(url):
+                    """Absolute upstream URL for a src value, or None if not ours to embed"""
+                    url = url.strip('"').strip("'")
                     if '/proxy?url=' in url or proxy_origin in url:
-                        return full_match
-                    
-                    # Build full URL
-                    full_url = None
+                        return None
                     if url.startswith('http'):
-                        full_url = url
-                    elif url.startswith('//'):
-                        full_url = 'https:' + url
-                    
-                    # Only embed images (not fonts or other resources)
-                    if full_url and any(ext in full_url.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg']):
-                        try:
-                            # Check cache
-                            if full_url in image_cache:
-                                return f'{match.group(1)}="{image_cache[full_url]}"'
-                            
-                            print(f"[PROXY] Fetching image for embedding: {full_url[:80]}...", flush=True)
-                            img_resp = requests.get(full_url, timeout=10)
-                            if img_resp.status_code == 200 and len(img_resp.content) < 500000:  # Only embed < 500KB
-                                # Determine MIME type
-                                mime_type = img_resp.headers.get('Content-Type', 'image/jpeg')
-                                if 'image/' not in mime_type:
-                                    if '.png' in full_url:
-                                        mime_type = 'image/png'
-                                    elif '.gif' in full_url:
-                                        mime_type = 'image/gif'
-                                    elif '.webp' in full_url:
-                                        mime_type = 'image/webp'
-                                    elif '.svg' in full_url:
-                                        mime_type = 'image/svg+xml'
-                                    else:
-                                        mime_type = 'image/jpeg'
-                                
-                                # Convert to base64
-                                img_b64 = base64.b64encode(img_resp.content).decode('utf-8')
-                                data_uri = f'data:{mime_type};base64,{img_b64}'
-                                image_cache[full_url] = data_uri
-                                print(f"[PROXY] Embedded image: {len(img_resp.content)} bytes", flush=True)
-                                return f'{match.group(1)}="{data_uri}"'
-                            else:
-                                print(f"[PROXY] Image too large or failed, using proxy: {len(img_resp.content) if img_resp.status_code == 200 else 'error'}", flush=True)
-                        except Exception as e:
-                            print(f"[PROXY] Failed to embed image {full_url[:50]}: {e}", flush=True)
-                    
-                    # Fallback: use proxy URL
+                        return url
+                    if url.startswith('//'):
+                        return 'https:' + url
+                    return None
+                
+                embeddable = set()
+                for match in re.finditer(src_pattern, text):
+                    full_url = src_full_url(match.group(2))
                     if full_url:
-                        return f'{match.group(1)}="{proxy_origin}/proxy?url={quote(full_url)}"'
-                    return full_match
+                        prewarmer.discover(full_url)
+                        if any(ext in full_url.lower() for ext in IMAGE_EXTENSIONS):
+                            embeddable.add(full_url)
+                
+                embedded = embed_images(embeddable)
+                
+                def embed_image(match):
+                    full_url = src_full_url(match.group(2))
+                    if not full_url:
+                        return match.group(0)
+                    if embedded.get(full_url):
+                        return f'{match.group(1)}="{embedded[full_url]}"'
+                    # Fallback: use proxy URL
+                    return f'{match.group(1)}="{proxy_origin}/proxy?url={quote(full_url)}"'
                 
-                # Embed images in src attributes
-                text = re.sub(r'(src)=["\']([^"\']+)["\']', embed_image, text)
+                text = re.sub(src_pattern, embed_image, text)
                 
                 # Handle srcset attributes (multiple images with sizes)
                 def rewrite_srcset(match):
@@ -239,14 +360,14 @@ def proxy(path):
                 text = re.sub(r'srcset=["\']([^"\']+)["\']', rewrite_srcset, text)
                 
                 # Inject Service Worker registration at the end of <head>
-                sw_script = '''<script>
-if ('serviceWorker' in navigator) {
-    navigator.serviceWorker.register('/sw.js').then(function(reg) {
+                sw_script = f'''<script>
+if ('serviceWorker' in navigator) {{
+    navigator.serviceWorker.register('/sw.js?v={quote(SW_CACHE_VERSION)}').then(function(reg) {{
         console.log('[Proxy] Service Worker registered', reg);
-    }).catch(function(err) {
+    }}).catch(function(err) {{
         console.log('[Proxy] Service Worker registration failed', err);
-    });
-}
+    }});
+}}
 </script>'''
                 text = text.replace('</head>', sw_script + '</head>', 1)
                 
@@ -256,6 +377,7 @@ if ('serviceWorker' in navigator) {
                     if '/proxy?url=' in url:
                         return match.group(0)
                     full_url = "https:" + url
+                    prewarmer.discover(full_url)
                     return f'{match.group(1)}="{proxy_origin}/proxy?url={quote(full_url)}"'
                 
                 text = re.sub(r'(href|src|content)=["\']//[^"\']+["\']', rewrite_schemeless, text)
@@ -276,6 +398,8 @@ if ('serviceWorker' in navigator) {
                 text = re.sub(r"'(https?://[^']+)'", rewrite_js_url, text)
                 text = re.sub(r'"(https?://[^"]+)"', lambda m: f'"{proxy_origin}/proxy?url={quote(m.group(1))}"' if '/proxy?url=' not in m.group(1) and not m.group(1).startswith(proxy_origin) else m.group(0), text)
                 
+                preload_links = early_hints.collect(text, target_url, proxy_origin)
+                prefetch_urls = prefetch.subresources(text, request.url, upstream_for_path)
                 body = text.encode(enc)
                 response = Response(body, status=resp.status_code, mimetype='text/html')
             except Exception as e:
@@ -289,58 +413,34 @@ if ('serviceWorker' in navigator) {
         elif 'text/css' in content_type.lower() or 'text/javascript' in content_type.lower():
             # Rewrite CSS and JS files too (for url() in CSS and fetch/XHR in JS)
             try:
-                raw = resp.content
                 enc = resp.encoding or 'utf-8'
-                text = raw.decode(enc, errors='ignore')
+                is_css = 'text/css' in content_type.lower()
+                css_validator = stylesheets.validator(resp.headers) if is_css and resp.status_code == 200 else None
+                cached = stylesheets.cache.lookup(target_url, css_validator, proxy_origin)
+                if cached is not None:
+                    # Unchanged stylesheet already transformed - skip the upstream body
+                    resp.close()
+                    text = cached
+                else:
+                    raw = resp.content
+                    text = raw.decode(enc, errors='ignore')
                 
                 import re
                 from urllib.parse import quote
                 
-                # For CSS: convert fonts to data URIs to bypass filter
-                if 'text/css' in content_type.lower():
-                    def rewrite_css_url(match):
-                        url = match.group(1).strip('"').strip("'")
+                # For CSS: embed fonts as data URIs to bypass filter, proxy every other url()
+                if is_css and cached is None:
+                    def rewrite_css_url(url):
                         if '/proxy?url=' in url or proxy_origin in url:
-                            return match.group(0)
-                        
-                        full_url = None
-                        if url.startswith('http'):
-                            full_url = url
-                        elif url.startswith('//'):
-                            full_url = "https:" + url
-                        
-                        # Convert fonts to base64 data URIs
-                        if full_url and any(ext in full_url.lower() for ext in ['.woff2', '.woff', '.ttf', '.eot', '.otf']):
-                            try:
-                                # Check cache first
-                                if full_url in font_cache:
-                                    return f'url({font_cache[full_url]})'
-                                
-                                # Fetch the font
-                                print(f"[PROXY] Fetching font for embedding: {full_url}", flush=True)
-                                font_resp = requests.get(full_url, timeout=10)
-                                if font_resp.status_code == 200:
-                                    # Determine MIME type
-                                    mime_type = 'font/woff2' if '.woff2' in full_url else 'font/woff' if '.woff' in full_url else 'font/ttf'
-                                    # Convert to base64
-                                    font_b64 = base64.b64encode(font_resp.content).decode('utf-8')
-                                    data_uri = f'"data:{mime_type};base64,{font_b64}"'
-                                    # Cache it
-                                    font_cache[full_url] = data_uri
-                                    print(f"[PROXY] Embedded font: {full_url[:50]}... ({len(font_resp.content)} bytes)", flush=True)
-                                    return f'url({data_uri})'
-                            except Exception as e:
-                                print(f"[PROXY] Failed to embed font {full_url}: {e}", flush=True)
-                                # Fallback to proxy URL
-                                return f'url("{proxy_origin}/proxy?url={quote(full_url)}")'
-                        
-                        # Non-font resources use proxy URL
-                        if full_url:
-                            return f'url("{proxy_origin}/proxy?url={quote(full_url)}")'
-                        return match.group(0)
+                            return None
+                        prewarmer.discover(url)
+                        return f'{proxy_origin}/proxy?url={quote(url)}'
                     
-                    text = re.sub(r'url\(["\']?([^)]+)["\']?\)', rewrite_css_url, text)
-                else:
+                    text = stylesheets.cache.transform(
+                        target_url, text, validator=css_validator, variant=proxy_origin,
+                        fetch_font=fetch_font_data_uri, rewrite=rewrite_css_url
+                    )
+                elif not is_css:
                     # JavaScript: just rewrite URLs normally
                     text = re.sub(r"'(https?://[^']+)'", lambda m: f"'{proxy_origin}/proxy?url={quote(m.group(1))}'" if '/proxy?url=' not in m.group(1) and proxy_origin not in m.group(1) else m.group(0), text)
                     text = re.sub(r'"(https?://[^"]+)"', lambda m: f'"{proxy_origin}/proxy?url={quote(m.group(1))}"' if '/proxy?url=' not in m.group(1) and proxy_origin not in m.group(1) else m.group(0), text)
@@ -356,14 +456,12 @@ if ('serviceWorker' in navigator) {
                 response = Response(generate(), status=resp.status_code)
         else:
             # For images and other binary content, serve directly with proper headers
-            # The key is that they come from our proxy domain, not external domains
-            def generate():
-                for chunk in resp.iter_content(chunk_size=8192):
-                    if chunk:
-                        yield chunk
-            response = Response(generate(), status=resp.status_code)
+            # The key is that they come from our proxy domain, not external domains.
+            # Compressed upstream bytes are relayed untouched when the client accepts them.
+            response = None  # built by passthrough once the headers below are known
 
         # Copy and possibly rewrite headers (force Location -> proxy)
+        out_headers = Headers()
         target_parsed = urlparse(TARGET_URL)
         target_netloc = target_parsed.netloc
         
@@ -404,7 +502,18 @@ if ('serviceWorker' in navigator) {
                 except Exception as e:
                     app.logger.error(f"Error rewriting Location: {e}")
 
-            response.headers[key] = value
+            out_headers[key] = value
+        
+        if response is None:
+            # passthrough owns the merge: it adds Vary / Content-Encoding / Content-Length
+            response = passthrough(resp, content_type=out_headers.pop('Content-Type', None),
+                                   headers=out_headers, status=resp.status_code)
+        else:
+            for key, value in out_headers.items():
+                response.headers[key] = value
+        
+        # Preload the page's critical CSS, fonts and first-party JS
+        early_hints.hints.apply(response, target_url, preload_links)
         
         # Add CORS headers to allow cross-origin resource loading
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -412,7 +521,8 @@ if ('serviceWorker' in navigator) {
         response.headers['Access-Control-Allow-Headers'] = '*'
 
         app.logger.info(f"Upstream {target_url} responded {resp.status_code}")
-        return response
+        # Warm the cache with the page's subresources once it has been sent
+        return prefetch.prefetcher.after(response, prefetch_urls)
 
     except requests.exceptions.RequestException as e:
         app.logger.error(f"Error fetching target URL: {e}")
@@ -433,9 +543,23 @@ def serve_sw():
     response = send_from_directory(static_dir, 'sw.js')
     response.headers['Content-Type'] = 'application/javascript'
     response.headers['Service-Worker-Allowed'] = '/'
+    # The worker script must be re-checked so a new cache version is picked up
+    response.headers['Cache-Control'] = 'no-cache'
     return response
 
+@warmup.step('upstream_pool')
+def warm_upstream_pool():
+    """Pre-open keep-alive connections to TARGET_URL and keep hot hosts warm"""
+    prewarmer.pin(TARGET_URL)
+    return prewarmer.start()
+
+@app.route('/healthz')
+def healthz():
+    payload, status = warmup.status()
+    return jsonify(payload), status
+
 if __name__ == '__main__':
     # Run the Flask app on localhost, port 5000
     # You can access the proxy at http://127.0.0.1:5000/
+    warmup.start()
     app.run(debug=True, port=5000)
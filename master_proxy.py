@@ -3,33 +3,61 @@
 MASTER PROXY - Combines all successful bypass strategies
 Multi-mode proxy with streaming, embedding, and tunneling capabilities
 """
-from flask import Flask, Response, request, stream_with_context, jsonify
-from flask_sock import Sock
-import requests
+import time
+BOOT_TIME = time.monotonic()
+
+from flask import Flask, request, jsonify
 import base64
 import re
 import json
-import hashlib
-from urllib.parse import urljoin, urlparse, unquote
 from concurrent.futures import ThreadPoolExecutor
-import sys
-import subprocess
+from urllib.parse import quote, urljoin
 
-app = Flask(__name__)
+import admission
+import bandwidth
+import cache_backends
+import cluster
+import compression
+import datauri
+import early_hints
+import inlining
+import pipeline
+from breaker import breaker
+from hedge import hedger
+from pipeline import log_request
+from relay import passthrough
+from static_assets import StaticAsset
+import dnscache
+import hostlimit
+import imageopt
+import latency
+import timeouts
+import prefetch
+from prewarm import prewarmer
+import relay
+import response_cache
+from warmup import Warmup
 
-# Install flask-sock if needed
 try:
-    sock = Sock(app)
-except:
-    print("Installing flask-sock...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "-q", "flask-sock", "simple-websocket"])
-    sock = Sock(app)
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+app = Flask(__name__)
+compression.init_app(app)
+hostlimit.init_app(app)
+cluster.init_app(app, cache_backends.local)
+
+# WebSocket tunnel is optional - never shell out to pip at import time
+sock = Sock(app) if Sock else None
+if sock is None:
+    print("[MASTER] flask-sock not installed - /tunnel disabled (pip3 install flask-sock simple-websocket)")
 
 # Configuration
 FLIXHQ_URL = "https://flixhq.to/"
-DEFAULT_TIMEOUT = 15
 MAX_WORKERS = 10
-resource_cache = {}  # For stealth mode
+warmup = Warmup('master_proxy', boot_time=BOOT_TIME)
+prerendered = {}  # StaticAsset per page, built once during warm-up
 
 # =============================================================================
 # UTILITY FUNCTIONS
@@ -51,71 +79,48 @@ def rewrite_urls(content, target_url, mode='flixhq'):
         )
     return content
 
-def fetch_resource(url, timeout=10):
+def fetch_resource(url, timeout=None, hedge=False, max_bytes=datauri.INLINE_MAX_BYTES):
     """Fetch a resource and return as data URI or text"""
     try:
-        resp = requests.get(url, timeout=timeout, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        
-        if resp.status_code == 200:
-            content_type = resp.headers.get('content-type', '').lower().split(';')[0]
-            
-            # Return text content as-is
-            if 'javascript' in content_type or 'css' in content_type or 'json' in content_type:
-                return ('text', resp.text, content_type)
-            
-            # Return binary as base64 data URI
-            mime = content_type or 'application/octet-stream'
-            data_uri = f"data:{mime};base64,{base64.b64encode(resp.content).decode()}"
-            return ('data', data_uri, mime)
-        
-        return None
+        # Text comes back as-is; binaries are streamed into a size-capped data URI
+        if hedge:
+            return hedger.call(url, datauri.fetch_inline, url, ok=lambda result: result is not None,
+                               max_bytes=max_bytes, timeout=timeout)
+        return datauri.fetch_inline(url, max_bytes=max_bytes, timeout=timeout)
     except Exception as e:
         print(f"[FETCH ERROR] {url[:60]}: {e}")
         return None
 
-def log_request(mode, method, url, status="→"):
-    """Consistent logging format"""
-    print(f"[{mode.upper():8}] {status} {method:4} {url[:80]}")
+def classify_request(req):
+    """Admission mode and priority for a request (None = never shed)"""
+    path = req.path
+    if path in ('/healthz', '/stats') or path.startswith('/cluster/'):
+        return None
+    if path == '/':
+        return ('static', admission.CHEAP)
+    if path.startswith('/video-proxy'):
+        return ('video', admission.EXPENSIVE)
+    if path.startswith('/ultra'):
+        # Images left out of a page's inlining budget come back through /ultra too;
+        # they are plain passthrough fetches, not page assemblies
+        if pipeline.client_request_class() == 'subresource':
+            return ('page', admission.NORMAL)
+        return ('ultra', admission.EXPENSIVE)
+    if path.startswith('/tunnel'):
+        return ('tunnel', admission.NORMAL)
+    if req.method == 'GET':
+        url = flixhq_upstream(path, req.query_string.decode())
+        if url and response_cache.cache.likely_hit(url):
+            return ('page', admission.CHEAP)
+    return ('page', admission.NORMAL)
+
+admission.init_app(app, classify_request)
 
 # =============================================================================
-# MODE 1: FLIXHQ STREAMING PROXY (Best for video streaming)
+# INJECTED SCRIPTS & BANNERS (built once at import, spliced into every page)
 # =============================================================================
 
-@app.route('/flixhq')
-@app.route('/flixhq/')
-@app.route('/flixhq/<path:path>')
-def flixhq_proxy(path=''):
-    """FlixHQ proxy with aggressive video/iframe interception"""
-    target_url = urljoin(FLIXHQ_URL, path)
-    if request.query_string:
-        target_url += '?' + request.query_string.decode()
-    
-    log_request('flixhq', request.method, target_url)
-    
-    try:
-        resp = requests.request(
-            method=request.method,
-            url=target_url,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': request.headers.get('Accept', '*/*'),
-                'Referer': FLIXHQ_URL
-            },
-            data=request.get_data(),
-            allow_redirects=True,
-            timeout=DEFAULT_TIMEOUT
-        )
-        
-        content_type = resp.headers.get('Content-Type', '')
-        
-        if 'text/html' in content_type:
-            html = resp.text
-            html = rewrite_urls(html, target_url, 'flixhq')
-            
-            # Inject aggressive interceptor
-            interceptor = '''
+FLIXHQ_INTERCEPTOR = '''
 <script>
 (function() {
     console.log('[Master Proxy] FlixHQ mode - Intercepting video streams...');
@@ -174,34 +179,118 @@ def flixhq_proxy(path=''):
 })();
 </script>
 '''
-            html = html.replace('</head>', interceptor + '</head>', 1)
-            
-            banner = '''
+
+FLIXHQ_BANNER = '''
 <div style="position:fixed;bottom:0;left:0;right:0;background:linear-gradient(135deg,#6366f1,#8b5cf6);color:#fff;padding:10px 15px;z-index:999999;text-align:center;font-size:13px;font-family:system-ui,-apple-system,sans-serif;box-shadow:0 -2px 10px rgba(0,0,0,0.3);">
     🎬 <b>Master Proxy</b> | Mode: FlixHQ Streaming | Server: GitHub Codespaces
 </div>
 '''
-            html = html.replace('</body>', banner + '</body>', 1)
-            
-            log_request('flixhq', 'GET', target_url, f"✓ {len(html)}b")
-            return Response(html, content_type='text/html')
-        
-        elif 'text/css' in content_type:
-            css = rewrite_urls(resp.text, target_url, 'flixhq')
-            return Response(css, content_type='text/css')
-        
-        elif 'javascript' in content_type or 'application/json' in content_type:
-            js = rewrite_urls(resp.text, target_url, 'flixhq')
-            return Response(js, content_type=content_type)
-        
-        else:
-            return Response(resp.content, content_type=content_type, headers={
-                'Access-Control-Allow-Origin': '*'
-            })
-    
-    except Exception as e:
-        log_request('flixhq', 'GET', target_url, f"✗ {e}")
-        return f"<h1>Error</h1><p>{e}</p>", 500
+
+IFRAME_INTERCEPTOR = '''
+<script>
+console.log('[Master Proxy] Iframe interceptor active');
+if (window.HTMLMediaElement) {
+    const originalSrc = Object.getOwnPropertyDescriptor(HTMLMediaElement.prototype, 'src').set;
+    Object.defineProperty(HTMLMediaElement.prototype, 'src', {
+        set: function(value) {
+            if (value && !value.startsWith('blob:') && !value.includes(location.host)) {
+                console.log('[Master Iframe] Proxying video:', value);
+                value = parent.location.origin + '/video-proxy?url=' + encodeURIComponent(value);
+            }
+            originalSrc.call(this, value);
+        }
+    });
+}
+</script>
+'''
+
+ULTRA_BLOCKER = '''
+<script>
+console.log('[Master Proxy] Ultra mode - Blocking external requests...');
+const originalFetch = window.fetch;
+window.fetch = (url) => {
+    if (typeof url === 'string' && !url.startsWith('data:') && !url.startsWith('blob:') && !url.includes(location.host)) {
+        console.log('[Ultra] Blocked fetch:', url);
+        return Promise.resolve(new Response('', {status: 200}));
+    }
+    return originalFetch.apply(this, arguments);
+};
+</script>
+'''
+
+ULTRA_BANNER = '''
+<div style="position:fixed;top:0;left:0;right:0;background:linear-gradient(135deg,#f59e0b,#ef4444);color:#fff;padding:12px 15px;z-index:999999;text-align:center;font-size:13px;font-family:system-ui,-apple-system,sans-serif;box-shadow:0 2px 10px rgba(0,0,0,0.3);">
+    ⚡ <b>Master Proxy</b> | Mode: Ultra (All Resources Embedded) | External requests blocked
+</div>
+<div style="height:50px;"></div>
+'''
+
+STEALTH_SCRIPT = '''
+<script>
+console.log('[Master Proxy] Stealth mode active - Resources as JSON');
+// Simplified stealth loader - block external images
+const originalImage = window.Image;
+window.Image = function() {
+    const img = new originalImage();
+    img.src = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7';
+    return img;
+};
+</script>
+'''
+
+# Pre-joined with the tag they are inserted before, so a page rewrite is a
+# single str.replace with no per-request concatenation
+FLIXHQ_HEAD_INJECT = FLIXHQ_INTERCEPTOR + '</head>'
+FLIXHQ_BODY_INJECT = FLIXHQ_BANNER + '</body>'
+IFRAME_HEAD_INJECT = IFRAME_INTERCEPTOR + '</head>'
+ULTRA_HEAD_INJECT = ULTRA_BLOCKER + '</head>'
+ULTRA_BODY_INJECT = ULTRA_BANNER + '<body'
+STEALTH_HEAD_INJECT = '<head>' + STEALTH_SCRIPT
+
+# =============================================================================
+# MODE 1: FLIXHQ STREAMING PROXY (Best for video streaming)
+# =============================================================================
+
+def flixhq_upstream(path, query):
+    """Upstream FlixHQ URL behind a /flixhq/... proxy path"""
+    if not path.startswith('/flixhq/'):
+        return None
+    url = urljoin(FLIXHQ_URL, path[len('/flixhq/'):])
+    return f"{url}?{query}" if query else url
+
+def flixhq_rewrite(content, target_url):
+    return rewrite_urls(content, target_url, 'flixhq')
+
+def flixhq_inject(html, target_url):
+    """Aggressive interceptor and status banner"""
+    html = html.replace('</head>', FLIXHQ_HEAD_INJECT, 1)
+    return html.replace('</body>', FLIXHQ_BODY_INJECT, 1)
+
+FLIXHQ_MODE = pipeline.Mode(
+    'flixhq',
+    upstream_headers={'Referer': FLIXHQ_URL},
+    transforms={
+        'html': (flixhq_rewrite, flixhq_inject),
+        'css': (flixhq_rewrite,),
+        'script': (flixhq_rewrite,),
+    },
+    relay_headers={'Access-Control-Allow-Origin': '*'},  # CORS for relayed media, not pages
+    error_page='<h1>Error</h1><p>{}</p>',
+    early_hints=True,
+    to_upstream=flixhq_upstream,
+)
+
+@app.route('/flixhq')
+@app.route('/flixhq/')
+@app.route('/flixhq/<path:path>')
+def flixhq_proxy(path=''):
+    """FlixHQ proxy with aggressive video/iframe interception"""
+    target_url = urljoin(FLIXHQ_URL, path)
+    if request.query_string:
+        target_url += '?' + request.query_string.decode()
+    return pipeline.run(FLIXHQ_MODE, target_url, request.method,
+                        headers={'Accept': request.headers.get('Accept', '*/*')},
+                        data=request.get_data())
 
 # =============================================================================
 # MODE 2: VIDEO STREAMING PROXY (Chunked streaming relay)
@@ -218,33 +307,21 @@ def video_proxy():
     log_request('video', 'GET', video_url)
     
     try:
-        resp = requests.get(
-            video_url,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': FLIXHQ_URL,
-                'Origin': FLIXHQ_URL.rstrip('/')
-            },
-            stream=True,
-            timeout=30
-        )
+        resp = pipeline.fetch(video_url, request_class='video', cached=False, headers={
+            'Referer': FLIXHQ_URL,
+            'Origin': FLIXHQ_URL.rstrip('/')
+        })
+        # Headers are in - from here on only stalls between chunks matter
+        timeouts.set_idle(resp, 'video')
         
         content_type = resp.headers.get('Content-Type', 'video/mp4')
         log_request('video', 'GET', video_url, f"✓ {content_type}")
         
-        def generate():
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    yield chunk
-        
-        return Response(
-            stream_with_context(generate()),
-            content_type=content_type,
-            headers={
-                'Access-Control-Allow-Origin': '*',
-                'Cache-Control': 'no-cache'
-            }
-        )
+        # Body is paced to this client's fair share of egress
+        return passthrough(resp, content_type, headers={
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-cache'
+        }, meter=bandwidth.scheduler.meter(request.remote_addr, video_url))
     
     except Exception as e:
         log_request('video', 'GET', video_url, f"✗ {e}")
@@ -254,6 +331,23 @@ def video_proxy():
 # MODE 3: IFRAME PROXY (Recursive iframe proxying)
 # =============================================================================
 
+def iframe_inject(html, iframe_url):
+    """Video interceptor inside the iframe"""
+    if '</head>' in html:
+        return html.replace('</head>', IFRAME_HEAD_INJECT, 1)
+    return IFRAME_INTERCEPTOR + html
+
+IFRAME_MODE = pipeline.Mode(
+    'iframe',
+    upstream_headers={
+        'Referer': FLIXHQ_URL,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+    },
+    transforms={'html': (flixhq_rewrite, iframe_inject)},
+    headers={'Access-Control-Allow-Origin': '*', 'X-Frame-Options': 'ALLOWALL'},
+    error_page='Iframe proxy error: {}',
+)
+
 @app.route('/iframe-proxy')
 def iframe_proxy():
     """Proxy embedded iframes and inject interceptors"""
@@ -262,64 +356,65 @@ def iframe_proxy():
     if not iframe_url:
         return "Missing url parameter", 400
     
-    log_request('iframe', 'GET', iframe_url)
+    return pipeline.run(IFRAME_MODE, iframe_url)
+
+# =============================================================================
+# MODE 4: ULTRA PROXY (Complete server-side assembly)
+# =============================================================================
+
+def ultra_inline_images(html, target_url):
+    """Embed the page's images as data URIs within its inlining budget; proxy the rest"""
+    img_urls = re.findall(r'(?:src|srcset)=["\']([^"\']+)["\']', html, re.IGNORECASE)
+    img_urls = list(dict.fromkeys(url for url in img_urls if url.startswith('http') or url.startswith('//')))
+    full_urls = {url: 'https:' + url if url.startswith('//') else url for url in img_urls}
+    for full_url in full_urls.values():
+        prewarmer.discover(full_url)
     
-    try:
-        resp = requests.get(
-            iframe_url,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': FLIXHQ_URL,
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
-            },
-            timeout=DEFAULT_TIMEOUT
-        )
-        
-        content_type = resp.headers.get('Content-Type', '')
-        
-        if 'text/html' in content_type:
-            html = resp.text
-            html = rewrite_urls(html, iframe_url, 'flixhq')
-            
-            # Inject video interceptor in iframe
-            iframe_interceptor = '''
-<script>
-console.log('[Master Proxy] Iframe interceptor active');
-if (window.HTMLMediaElement) {
-    const originalSrc = Object.getOwnPropertyDescriptor(HTMLMediaElement.prototype, 'src').set;
-    Object.defineProperty(HTMLMediaElement.prototype, 'src', {
-        set: function(value) {
-            if (value && !value.startsWith('blob:') && !value.includes(location.host)) {
-                console.log('[Master Iframe] Proxying video:', value);
-                value = parent.location.origin + '/video-proxy?url=' + encodeURIComponent(value);
-            }
-            originalSrc.call(this, value);
+    policy = inlining.InlinePolicy.from_args(request.args)
+    chosen = set(policy.choose(full_urls.values()))
+    print(f"[ULTRA] Inlining {len(chosen)} of {len(img_urls)} images...")
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        future_to_url = {
+            hostlimit.submit(executor, fetch_resource, full_url, hedge=True, max_bytes=policy.max_item): full_url
+            for full_url in full_urls.values() if full_url in chosen
         }
-    });
-}
-</script>
-'''
-            html = html.replace('</head>', iframe_interceptor + '</head>', 1) if '</head>' in html else iframe_interceptor + html
-            
-            log_request('iframe', 'GET', iframe_url, f"✓ {len(html)}b")
-            return Response(html, content_type='text/html', headers={
-                'Access-Control-Allow-Origin': '*',
-                'X-Frame-Options': 'ALLOWALL'
-            })
         
+        for future in future_to_url:
+            full_url = future_to_url[future]
+            try:
+                fetched[full_url] = future.result()
+            except Exception as e:
+                print(f"[ULTRA] Error for {full_url}: {e}")
+    
+    # Settle in document order, so earlier images win if sizes were underestimated
+    embedded = 0
+    for url in img_urls:
+        full_url = full_urls[url]
+        result = fetched.get(full_url)
+        if result and result[0] == 'data' and policy.settle(full_url, len(result[1])):
+            replacement = result[1]
+            embedded += 1
         else:
-            log_request('iframe', 'GET', iframe_url, f"✓ {content_type}")
-            return Response(resp.content, content_type=content_type, headers={
-                'Access-Control-Allow-Origin': '*'
-            })
+            policy.release(full_url)
+            replacement = '/ultra/?url=' + quote(full_url, safe='')
+        if url.startswith('//'):
+            html = html.replace('https:' + url, replacement)
+        html = html.replace(url, replacement)
     
-    except Exception as e:
-        log_request('iframe', 'GET', iframe_url, f"✗ {e}")
-        return f"Iframe proxy error: {e}", 500
+    print(f"[ULTRA] Embedded {embedded} images ({policy.spent}b), proxied {len(img_urls) - embedded}")
+    return html
 
-# =============================================================================
-# MODE 4: ULTRA PROXY (Complete server-side assembly)
-# =============================================================================
+def ultra_inject(html, target_url):
+    """Request blocker and banner"""
+    html = html.replace('</head>', ULTRA_HEAD_INJECT, 1)
+    return html.replace('<body', ULTRA_BODY_INJECT, 1)
+
+ULTRA_MODE = pipeline.Mode(
+    'ultra',
+    transforms={'html': (ultra_inline_images, ultra_inject)},
+    error_page='<h1>Error</h1><p>{}</p>',
+)
 
 @app.route('/ultra')
 @app.route('/ultra/')
@@ -327,78 +422,7 @@ if (window.HTMLMediaElement) {
 def ultra_proxy(path=''):
     """Ultra mode: Fetch and inline ALL resources server-side"""
     target_url = request.args.get('url') or urljoin(FLIXHQ_URL, path) or FLIXHQ_URL
-    
-    log_request('ultra', 'GET', target_url)
-    
-    try:
-        resp = requests.get(target_url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }, timeout=DEFAULT_TIMEOUT)
-        
-        if 'text/html' not in resp.headers.get('Content-Type', ''):
-            return Response(resp.content, mimetype=resp.headers.get('Content-Type'))
-        
-        html = resp.text
-        
-        # Find and inline images
-        img_urls = set(re.findall(r'(?:src|srcset)=["\']([^"\']+)["\']', html, re.IGNORECASE))
-        img_urls = [url for url in img_urls if url.startswith('http') or url.startswith('//')][:20]
-        
-        print(f"[ULTRA] Inlining {len(img_urls)} images...")
-        url_to_data = {}
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_url = {
-                executor.submit(fetch_resource, 'https:' + url if url.startswith('//') else url): url 
-                for url in img_urls
-            }
-            
-            for future in future_to_url:
-                url = future_to_url[future]
-                try:
-                    result = future.result()
-                    if result and result[0] == 'data':
-                        url_to_data[url] = result[1]
-                except Exception as e:
-                    print(f"[ULTRA] Error for {url}: {e}")
-        
-        # Replace image URLs with data URIs
-        for url, data_uri in url_to_data.items():
-            html = html.replace(url, data_uri)
-            if url.startswith('//'):
-                html = html.replace('https:' + url, data_uri)
-        
-        print(f"[ULTRA] Embedded {len(url_to_data)} images")
-        
-        # Inject blocker
-        blocker = '''
-<script>
-console.log('[Master Proxy] Ultra mode - Blocking external requests...');
-const originalFetch = window.fetch;
-window.fetch = (url) => {
-    if (typeof url === 'string' && !url.startsWith('data:') && !url.startsWith('blob:') && !url.includes(location.host)) {
-        console.log('[Ultra] Blocked fetch:', url);
-        return Promise.resolve(new Response('', {status: 200}));
-    }
-    return originalFetch.apply(this, arguments);
-};
-</script>
-'''
-        html = html.replace('</head>', blocker + '</head>', 1)
-        
-        banner = '''
-<div style="position:fixed;top:0;left:0;right:0;background:linear-gradient(135deg,#f59e0b,#ef4444);color:#fff;padding:12px 15px;z-index:999999;text-align:center;font-size:13px;font-family:system-ui,-apple-system,sans-serif;box-shadow:0 2px 10px rgba(0,0,0,0.3);">
-    ⚡ <b>Master Proxy</b> | Mode: Ultra (All Resources Embedded) | External requests blocked
-</div>
-<div style="height:50px;"></div>
-'''
-        html = html.replace('<body', banner + '<body', 1)
-        
-        log_request('ultra', 'GET', target_url, f"✓ {len(html)}b")
-        return Response(html, mimetype='text/html')
-    
-    except Exception as e:
-        log_request('ultra', 'GET', target_url, f"✗ {e}")
-        return f"<h1>Error</h1><p>{e}</p>", 500
+    return pipeline.run(ULTRA_MODE, target_url)
 
 # =============================================================================
 # MODE 5: VPN TUNNEL (Encrypted WebSocket)
@@ -414,7 +438,6 @@ def decrypt_data(data, key=0x5A):
     """Simple XOR decryption"""
     return bytes([b ^ key for b in data])
 
-@sock.route('/tunnel')
 def tunnel(ws):
     """VPN-style encrypted WebSocket tunnel"""
     log_request('tunnel', 'WS', 'Client connected')
@@ -434,9 +457,7 @@ def tunnel(ws):
             log_request('tunnel', method, url)
             
             try:
-                resp = requests.get(url, timeout=DEFAULT_TIMEOUT, allow_redirects=True, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
+                resp = pipeline.fetch(url, request_class='tunnel', cached=False)
                 
                 response_data = {
                     'status': resp.status_code,
@@ -461,62 +482,32 @@ def tunnel(ws):
     
     log_request('tunnel', 'WS', 'Client disconnected')
 
+if sock:
+    tunnel = sock.route('/tunnel')(tunnel)
+
 # =============================================================================
 # MODE 6: STEALTH PROXY (JSON-disguised resources)
 # =============================================================================
 
+def stealth_inject(html, target_url):
+    """Stealth loader (simplified)"""
+    return html.replace('<head>', STEALTH_HEAD_INJECT, 1)
+
+STEALTH_MODE = pipeline.Mode('stealth', transforms={'html': (stealth_inject,)})
+
 @app.route('/stealth/<path:path>')
 def stealth_proxy(path=''):
     """Stealth mode: Resources as JSON text/plain"""
     target_url = urljoin(FLIXHQ_URL, path)
     if request.query_string:
         target_url += '?' + request.query_string.decode()
-    
-    log_request('stealth', 'GET', target_url)
-    
-    try:
-        resp = requests.get(target_url, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }, timeout=DEFAULT_TIMEOUT, allow_redirects=True)
-        
-        content_type = resp.headers.get('Content-Type', '')
-        
-        if 'text/html' in content_type:
-            html = resp.text
-            
-            # Inject stealth loader (simplified)
-            stealth_script = '''
-<script>
-console.log('[Master Proxy] Stealth mode active - Resources as JSON');
-// Simplified stealth loader - block external images
-const originalImage = window.Image;
-window.Image = function() {
-    const img = new originalImage();
-    img.src = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7';
-    return img;
-};
-</script>
-'''
-            html = html.replace('<head>', '<head>' + stealth_script, 1)
-            
-            log_request('stealth', 'GET', target_url, f"✓ {len(html)}b")
-            return Response(html, mimetype='text/html')
-        
-        else:
-            return Response(resp.content, mimetype=content_type)
-    
-    except Exception as e:
-        log_request('stealth', 'GET', target_url, f"✗ {e}")
-        return f"Error: {e}", 500
+    return pipeline.run(STEALTH_MODE, target_url)
 
 # =============================================================================
 # HOMEPAGE (Mode selector)
 # =============================================================================
 
-@app.route('/')
-def index():
-    """Landing page with mode selector"""
-    html = '''
+INDEX_HTML = '''
 <!DOCTYPE html>
 <html>
 <head>
@@ -694,7 +685,60 @@ def index():
 </body>
 </html>
 '''
-    return Response(html, mimetype='text/html')
+
+def render_index():
+    """Build the landing page asset once; reused by every hit after warm-up"""
+    if 'index' not in prerendered:
+        prerendered['index'] = StaticAsset(INDEX_HTML, 'text/html')
+    return prerendered['index']
+
+@app.route('/')
+def index():
+    """Landing page with mode selector"""
+    return render_index().response()
+
+# =============================================================================
+# WARM-UP & HEALTH
+# =============================================================================
+
+@warmup.step('upstream_pool')
+def warm_upstream_pool():
+    """Pre-open keep-alive connections to FlixHQ and keep hot hosts warm"""
+    prewarmer.pin(FLIXHQ_URL)
+    return prewarmer.start()
+
+@warmup.step('prerender')
+def warm_prerender():
+    """Pre-render static pages"""
+    render_index()
+    return sorted(prerendered)
+
+@app.route('/healthz')
+def healthz():
+    """Readiness probe - 503 until warm-up has finished"""
+    payload, status = warmup.status()
+    return jsonify(payload), status
+
+@app.route('/stats')
+def stats():
+    """Upstream connection statistics for tuning"""
+    return jsonify({
+        'dns': dnscache.cache.stats(),
+        'prewarm': prewarmer.stats(),
+        'hosts': hostlimit.limiter.stats(),
+        'breaker': breaker.stats(),
+        'latency': latency.tracker.stats(),
+        'hedge': hedger.stats(),
+        'timeouts': timeouts.stats(),
+        'admission': admission.controller.stats(),
+        'bandwidth': bandwidth.scheduler.stats(),
+        'early_hints': early_hints.hints.stats(),
+        'cache': cache_backends.backend.stats(),
+        'response_cache': response_cache.cache.stats(),
+        'prefetch': prefetch.prefetcher.stats(),
+        'images': imageopt.optimizer.stats(),
+        'relay_buffers': relay.buffers.stats(),
+    })
 
 # =============================================================================
 # MAIN
@@ -723,4 +767,5 @@ if __name__ == '__main__':
     print(f"Starting server on http://0.0.0.0:5000")
     print(f"Open homepage: http://localhost:5000\n")
     
+    warmup.start()
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+PIPELINE - The fetch -> classify -> transform -> respond path every mode shares
+Each entry-point script describes its modes as Mode objects: which
+request class it fetches as, the upstream headers it sends, the text
+transforms it applies to HTML / CSS / script bodies and the headers it
+adds to what it returns. run() does the rest, so all modes share the
+same optimizations:
+
+  fetch      pooled upstream session, latency-derived timeouts, and the
+             shared response cache for subresources; always streamed
+  classify   html / css / script by Content-Type, anything else is opaque
+  transform  the mode's steps, each step(text, url) -> text
+  respond    transformed text, or the untouched body relayed by
+             relay.passthrough (zero-copy where the platform allows);
+             rewritten pages get early hints and prefetching if enabled
+
+Sub-resources fetched while building a page (images, fonts, scripts to
+inline) go through get_resource(), which adds the circuit breaker and
+per-host limit; datauri.py builds on it to embed them.
+"""
+from flask import Response, has_request_context, request
+
+import early_hints
+import hostlimit
+import prefetch
+import response_cache
+import timeouts
+from breaker import breaker
+from relay import passthrough
+from upstream import session
+
+TEXT_MIMETYPES = {'html': 'text/html', 'css': 'text/css'}
+NAVIGATION_DESTS = ('document', 'iframe', 'frame')
+
+
+def log_request(mode, method, url, status="→"):
+    """Consistent logging format"""
+    print(f"[{mode.upper():8}] {status} {method:4} {url[:80]}")
+
+
+def kind_of(content_type):
+    """'html', 'css' or 'script' for a Content-Type, None for anything else"""
+    content_type = content_type.lower()
+    if 'text/html' in content_type:
+        return 'html'
+    if 'text/css' in content_type:
+        return 'css'
+    if 'javascript' in content_type or 'application/json' in content_type:
+        return 'script'
+    return None
+
+
+def client_request_class(default='page'):
+    """default for a browser navigation, 'subresource' for anything else
+
+    Modes proxy pages and their assets through the same routes; only the
+    assets are ever in the response cache (see prefetch.py).
+    """
+    if default != 'page' or not has_request_context():
+        return default
+    dest = request.headers.get('Sec-Fetch-Dest')
+    if dest:
+        return 'page' if dest in NAVIGATION_DESTS else 'subresource'
+    return 'page' if 'text/html' in request.headers.get('Accept', '') else 'subresource'
+
+
+def fetch(url, method='GET', request_class='page', headers=None, data=None, cookies=None,
+          allow_redirects=True, cached=True):
+    """Streamed upstream response for url, from the shared response cache when it has it
+
+    Pages are never cached, so only other request classes are looked up.
+    """
+    if cached and method == 'GET' and request_class != 'page':
+        resp = response_cache.cache.lookup(url)
+        if resp is not None:
+            return resp
+    return session.request(
+        method=method,
+        url=url,
+        headers=headers,
+        data=data,
+        cookies=cookies,
+        allow_redirects=allow_redirects,
+        stream=True,
+        timeout=timeouts.for_request(url, request_class)
+    )
+
+
+def get_resource(url, timeout=None, headers=None, read=None):
+    """GET a sub-resource through the circuit breaker and per-host limit
+
+    With read, the body is streamed: read(resp) consumes it while the host
+    slot is still held, and its result is returned instead of resp.
+    """
+    with breaker.guard(url) as attempt, hostlimit.limiter.slot(url):
+        resp = session.get(url, headers=headers, stream=read is not None,
+                           timeout=timeout or timeouts.for_request(url, 'subresource'))
+        attempt.status(resp.status_code)
+        if read is not None:
+            try:
+                return read(resp)
+            finally:
+                resp.close()
+    return resp
+
+
+class Mode:
+    """How one proxy mode fetches, rewrites and answers
+
+    transforms maps 'html' / 'css' / 'script' to a sequence of
+    step(text, url) -> text; kinds without steps are relayed untouched.
+    to_upstream(path, query), if given, maps the mode's proxy paths back
+    to upstream URLs so a rewritten page's subresources can be prefetched.
+    headers go on every response; relay_headers only on bodies relayed
+    untouched (e.g. CORS for media but not for pages).
+    """
+
+    def __init__(self, name, request_class='page', upstream_headers=None, transforms=None,
+                 headers=None, relay_headers=None, error_page='Error: {}', early_hints=False,
+                 to_upstream=None):
+        self.name = name
+        self.request_class = request_class
+        self.upstream_headers = dict(upstream_headers or {})
+        self.transforms = {kind: tuple(steps) for kind, steps in (transforms or {}).items()}
+        self.headers = dict(headers or {})
+        self.relay_headers = dict(self.headers, **(relay_headers or {}))
+        self.error_page = error_page
+        self.early_hints = early_hints
+        self.to_upstream = to_upstream
+
+
+def transform(mode, kind, text, url):
+    """text run through mode's steps for its kind"""
+    for step in mode.transforms.get(kind, ()):
+        text = step(text, url)
+    return text
+
+
+def respond_page(mode, html, url, status=200):
+    """Response for a rewritten page, with early hints and prefetching as configured"""
+    response = Response(html, status=status, mimetype='text/html', headers=mode.headers)
+    if mode.early_hints:
+        links = early_hints.collect(html, url, request.host_url.rstrip('/'))
+        response = early_hints.hints.apply(response, url, links)
+    if mode.to_upstream:
+        response = prefetch.prefetcher.after(response, prefetch.subresources(html, request.url, mode.to_upstream))
+    return response
+
+
+def run(mode, url, method='GET', headers=None, data=None):
+    """Proxy one request to url the way mode says"""
+    log_request(mode.name, method, url)
+    if mode.early_hints and method == 'GET':
+        early_hints.hints.send_early(url)
+    try:
+        resp = fetch(url, method, client_request_class(mode.request_class),
+                     headers=dict(mode.upstream_headers, **(headers or {})), data=data)
+        content_type = resp.headers.get('Content-Type', '')
+        kind = kind_of(content_type)
+        if kind not in mode.transforms:
+            log_request(mode.name, method, url, f"✓ {content_type}")
+            return passthrough(resp, content_type or None, headers=mode.relay_headers, status=resp.status_code)
+
+        text = transform(mode, kind, resp.text, url)
+        log_request(mode.name, method, url, f"✓ {len(text)}b")
+        if kind == 'html':
+            return respond_page(mode, text, url, resp.status_code)
+        return Response(text, status=resp.status_code, content_type=TEXT_MIMETYPES.get(kind, content_type),
+                        headers=mode.headers)
+    except Exception as e:
+        log_request(mode.name, method, url, f"✗ {e}")
+        return mode.error_page.format(e), 500
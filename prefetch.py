@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+PREFETCH - Warm the response cache with a served page's subresources
+Right after a rewritten page has gone out, the stylesheets, scripts,
+icons and images it references through the proxy are fetched into the
+shared response cache, so the browser's follow-up requests are local hits.
+
+The warmer is strictly background work: a couple of worker threads, a
+bounded queue that drops on overflow, and an upstream host slot is only
+taken when one is free with nobody waiting - a busy host is skipped rather
+than queued behind client requests. URLs already cached or in flight are
+skipped. Whether prefetching pays off shows up as prefetch_used vs
+prefetch_wasted in the response cache stats.
+"""
+import html
+import os
+import queue
+import re
+import threading
+from urllib.parse import parse_qs, urljoin, urlparse
+
+import timeouts
+from breaker import breaker
+from hostlimit import limiter
+from response_cache import cache
+from upstream import session
+
+# Configuration (environment overrides)
+PREFETCH = os.environ.get('PROXY_PREFETCH', '1') == '1'
+PREFETCH_WORKERS = int(os.environ.get('PROXY_PREFETCH_WORKERS', 2))
+PREFETCH_PER_PAGE = int(os.environ.get('PROXY_PREFETCH_PER_PAGE', 24))  # URLs taken from one page
+PREFETCH_QUEUE = 256  # pending URLs before new ones are dropped
+
+TAG_PATTERN = re.compile(r'<(link|script|img)\b([^>]*)>', re.I)
+ATTR_PATTERN = re.compile(r'([\w-]+)\s*=\s*(["\'])(.*?)\2', re.S)
+LINK_RELS = {'stylesheet', 'preload', 'icon', 'modulepreload'}
+
+
+def subresources(page_html, request_url, to_upstream, limit=PREFETCH_PER_PAGE):
+    """Upstream URLs of the proxied subresources a rewritten page will request
+
+    request_url is the page's URL on the proxy; to_upstream(path, query)
+    maps a proxy path back to its upstream URL (or None). /proxy?url=
+    references map to their url parameter.
+    """
+    own = urlparse(request_url).netloc
+    found = []
+    for match in TAG_PATTERN.finditer(page_html):
+        attrs = {name.lower(): html.unescape(value) for name, _, value in ATTR_PATTERN.findall(match.group(2))}
+        if match.group(1).lower() == 'link':
+            if not LINK_RELS & set(attrs.get('rel', '').lower().split()):
+                continue
+            value = attrs.get('href', '')
+        else:
+            value = attrs.get('src', '')
+        value = value.strip()
+        if not value or value.startswith(('data:', 'blob:', 'javascript:', '#')):
+            continue
+        proxied = urlparse(urljoin(request_url, value))
+        if proxied.netloc != own:
+            continue
+        params = parse_qs(proxied.query)
+        if proxied.path == '/proxy' and 'url' in params:
+            url = params['url'][0]
+        else:
+            url = to_upstream(proxied.path, proxied.query)
+        if url and url.startswith(('http://', 'https://')) and url not in found:
+            found.append(url)
+            if len(found) >= limit:
+                break
+    return found
+
+
+class Prefetcher:
+    """Background fetcher feeding the shared response cache"""
+
+    def __init__(self, workers=PREFETCH_WORKERS, queue_size=PREFETCH_QUEUE, enabled=PREFETCH):
+        self.workers = workers
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.counters = {'scheduled': 0, 'fetched': 0, 'skipped_cached': 0,
+                         'skipped_busy': 0, 'dropped': 0, 'failed': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _start(self):
+        """Start the worker threads on first use (lock held)"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def schedule(self, urls):
+        """Queue upstream URLs for warming; returns how many were queued"""
+        if not self.enabled:
+            return 0
+        queued = 0
+        with self._lock:
+            self._start()
+            for url in urls:
+                if url in self._pending:
+                    continue
+                try:
+                    self._queue.put_nowait(url)
+                except queue.Full:
+                    self.counters['dropped'] += 1
+                    continue
+                self._pending.add(url)
+                self.counters['scheduled'] += 1
+                queued += 1
+        return queued
+
+    def after(self, response, urls):
+        """Schedule urls once response has been sent to the client"""
+        if self.enabled and urls:
+            response.call_on_close(lambda: self.schedule(urls))
+        return response
+
+    def _run(self):
+        while True:
+            url = self._queue.get()
+            try:
+                self._fetch(url)
+            finally:
+                with self._lock:
+                    self._pending.discard(url)
+
+    def _fetch(self, url):
+        if cache.contains(url):
+            self._count('skipped_cached')
+            return
+        host = urlparse(url).netloc.lower()
+        if not limiter.try_acquire(host):
+            # Client requests to this host are waiting - don't compete with them
+            self._count('skipped_busy')
+            return
+        try:
+            with breaker.guard(url) as attempt:
+                resp = session.get(url, stream=True, timeout=timeouts.for_request(url, 'subresource'))
+                attempt.status(resp.status_code)
+            if cache.store(url, resp, prefetched=True):
+                self._count('fetched')
+        except Exception as e:
+            self._count('failed')
+            print(f"[PREFETCH] ✗ {url[:80]}: {e}", flush=True)
+        finally:
+            limiter.release(host)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, enabled=self.enabled, pending=len(self._pending))
+
+
+prefetcher = Prefetcher()
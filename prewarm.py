@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+PREWARM - Keep idle TLS connections open to hot upstream hosts
+Pinned origins (FLIXHQ_URL, TARGET_URL) plus the most frequently seen
+hosts discovered while rewriting pages are re-warmed periodically, so the
+first request after a quiet period doesn't pay DNS+TCP+TLS.
+"""
+import os
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+import upstream
+
+# Configuration (environment overrides)
+PREWARM_CONNECTIONS = int(os.environ.get('PROXY_PREWARM_CONNECTIONS', 2))  # idle sockets per hot host
+PREWARM_MAX_HOSTS = int(os.environ.get('PROXY_PREWARM_MAX_HOSTS', 8))      # discovered hosts kept warm
+PREWARM_INTERVAL = int(os.environ.get('PROXY_PREWARM_INTERVAL', 20))       # seconds between passes
+DISCOVERY_LIMIT = 512  # distinct origins tracked before the counts are decayed
+
+
+class Prewarmer:
+    """Tracks hot origins and keeps their connection pools warm"""
+
+    def __init__(self, connections=PREWARM_CONNECTIONS, max_hosts=PREWARM_MAX_HOSTS,
+                 interval=PREWARM_INTERVAL):
+        self.connections = connections
+        self.max_hosts = max_hosts
+        self.interval = interval
+        self.pinned = []
+        self.discovered = Counter()
+        self.last_pass = {}  # origin -> connections opened / error on the last pass
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def pin(self, url):
+        """Always keep this URL's origin warm"""
+        origin = upstream.origin_of(url)
+        if origin not in self.pinned:
+            self.pinned.append(origin)
+
+    def discover(self, url):
+        """Note an upstream URL seen while rewriting a page"""
+        if not url.startswith(('http://', 'https://')) or not urlparse(url).netloc:
+            return
+        origin = upstream.origin_of(url)
+        with self._lock:
+            self.discovered[origin] += 1
+            if len(self.discovered) > DISCOVERY_LIMIT:
+                # Halve every count so old favourites eventually fall out
+                self.discovered = Counter({o: c // 2 for o, c in self.discovered.items() if c > 1})
+
+    def hot_origins(self):
+        with self._lock:
+            top = [origin for origin, _ in self.discovered.most_common(self.max_hosts)]
+        return self.pinned + [origin for origin in top if origin not in self.pinned]
+
+    def warm_all(self):
+        """One warming pass over every hot origin; returns origin -> result"""
+        results = {}
+        for origin in self.hot_origins():
+            try:
+                results[origin] = upstream.warm(origin, self.connections)
+            except Exception as e:
+                results[origin] = f"error: {str(e)[:100]}"
+        self.last_pass = results
+        return results
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.warm_all()
+
+    def start(self):
+        """Warm now, then keep re-warming in the background"""
+        results = self.warm_all()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='prewarm', daemon=True)
+            self._thread.start()
+        return results
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'connections_per_host': self.connections,
+            'hot_origins': self.hot_origins(),
+            'last_pass': self.last_pass,
+        }
+
+
+prewarmer = Prewarmer()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+RELAY - Streaming pass-through of untransformed upstream bodies
+Images, fonts and video that no mode rewrites are relayed without going
+through requests' automatic content decoding: when the client accepts the
+upstream's Content-Encoding the encoded bytes are forwarded untouched,
+saving the inflate on our side and the bandwidth on egress.
+
+With PROXY_ZERO_COPY=1, plain-HTTP upstream bodies with a Content-Length
+are moved socket-to-socket with splice(2) instead (see SpliceResponse).
+"""
+import os
+import select
+import socket
+import ssl
+import threading
+import time
+
+from flask import Response, request
+from werkzeug.datastructures import Headers
+
+from upstream import upstream_socket
+
+CHUNK_SIZE = 64 * 1024
+
+ZERO_COPY = os.environ.get('PROXY_ZERO_COPY', '0') == '1'
+SPLICE_CHUNK = 256 * 1024  # bytes moved per splice round trip (and per pacing charge)
+PIPE_SIZE = 1024 * 1024
+SPLICE_FLAGS = getattr(os, 'SPLICE_F_MOVE', 0) | getattr(os, 'SPLICE_F_MORE', 0)
+SPLICE_IDLE_TIMEOUT = 60  # seconds, when the socket has no timeout of its own
+
+# Pooled readinto() buffers (see read_views)
+MIN_READ = 64 * 1024
+MAX_READ = 1024 * 1024
+SMALLEST_BUFFER = 4 * 1024
+TARGET_READ_TIME = 0.05  # seconds - grow reads that fill faster, shrink ones much slower
+POOL_MAX_BYTES = int(os.environ.get('PROXY_RELAY_POOL_BYTES', 16 * 1024 * 1024))  # idle buffers kept
+
+
+class BufferPool:
+    """Process-wide free lists of read buffers in power-of-two sizes
+
+    A relay borrows one buffer at a time and gives it back when its body
+    ends, so concurrent relays share a handful of buffers instead of each
+    allocating its own. At most max_bytes of idle buffers are kept.
+    """
+
+    def __init__(self, max_bytes=POOL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._free = {}  # size -> [bytearray]
+        self._idle = 0
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, size):
+        """A buffer of at least size bytes (capped at MAX_READ)"""
+        size = max(SMALLEST_BUFFER, 1 << (min(size, MAX_READ) - 1).bit_length())
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                self._idle -= size
+                self.reused += 1
+                return free.pop()
+            self.allocated += 1
+        return bytearray(size)
+
+    def release(self, buf):
+        with self._lock:
+            if self._idle + len(buf) <= self.max_bytes:
+                self._free.setdefault(len(buf), []).append(buf)
+                self._idle += len(buf)
+
+    def stats(self):
+        with self._lock:
+            return {'allocated': self.allocated, 'reused': self.reused, 'idle_bytes': self._idle}
+
+
+buffers = BufferPool()
+
+
+def read_views(fp, size=MIN_READ, pool=buffers):
+    """Yield memoryviews of fp's data, read with readinto() into a pooled buffer
+
+    size is the first read's size, ideally the body's length. It doubles
+    while reads fill quickly and halves when they take much longer than
+    TARGET_READ_TIME, so a fast upstream is moved in few large reads and a
+    slow one isn't held back waiting to fill 1 MiB. Each view is only
+    valid until the next one is requested.
+    """
+    floor = min(size, MIN_READ)
+    buf = pool.acquire(size)
+    try:
+        while True:
+            if size > len(buf):
+                pool.release(buf)
+                buf = pool.acquire(size)
+            view = memoryview(buf)
+            started = time.monotonic()
+            n = fp.readinto(view[:size])
+            if not n:
+                return
+            elapsed = time.monotonic() - started
+            if n == size and elapsed < TARGET_READ_TIME:
+                size = min(size * 2, MAX_READ)
+            elif elapsed > TARGET_READ_TIME * 4:
+                size = max(size // 2, floor)
+            yield view[:n]
+    finally:
+        pool.release(buf)
+
+
+def iter_raw(resp):
+    """Undecoded body chunks of a stream=True response
+
+    Reads straight from the http.client response under urllib3 into a
+    pooled buffer sized from Content-Length, so a small image costs one
+    small read. WSGI servers only accept bytes, so each filled slice is
+    copied out once - still one allocation per read instead of the three
+    urllib3's read(amt) costs, over far fewer, larger reads.
+    """
+    fp = getattr(resp.raw, '_fp', None)
+    if fp is None or not hasattr(fp, 'readinto'):
+        yield from resp.raw.stream(CHUNK_SIZE, decode_content=False)
+        return
+    length = getattr(fp, 'length', None)
+    size = max(length, 1) if length is not None else CHUNK_SIZE
+    for view in read_views(fp, min(size, MAX_READ)):
+        yield bytes(view)
+    if fp.isclosed():
+        # Body fully read - hand the keep-alive connection back to the pool
+        resp.raw.release_conn()
+
+
+def client_accepts(encoding):
+    """Does the current client accept this content-coding?"""
+    return request.accept_encodings.quality(encoding) > 0
+
+
+def client_socket():
+    """The current request's client socket if the WSGI server exposes it"""
+    environ = request.environ
+    return environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+
+
+def can_splice(resp):
+    """Can this response's body go socket-to-socket in the kernel?
+
+    Needs: the option on, Linux splice(), a plain (non-TLS) socket on both
+    sides, and a fixed-length, non-chunked upstream body.
+    """
+    if not ZERO_COPY or not hasattr(os, 'splice') or request.method != 'GET':
+        return False
+    client = client_socket()
+    if client is None or isinstance(client, ssl.SSLSocket):
+        return False
+    original = getattr(resp.raw, '_fp', None)
+    if original is None or getattr(original, 'chunked', True) or getattr(original, 'length', None) is None:
+        return False
+    upstream = upstream_socket(resp)
+    return upstream is not None and not isinstance(upstream, ssl.SSLSocket)
+
+
+def _splice(src, dst, count, sock, writing):
+    """One os.splice(), waiting out EAGAIN on non-blocking sockets"""
+    timeout = sock.gettimeout() or SPLICE_IDLE_TIMEOUT
+    while True:
+        try:
+            return os.splice(src, dst, count, flags=SPLICE_FLAGS)
+        except BlockingIOError:
+            waiting = ([], [sock], []) if writing else ([sock], [], [])
+            if not any(select.select(*waiting, timeout)):
+                raise socket.timeout('splice timed out')
+
+
+def splice_body(upstream, client, length, meter=None):
+    """Move length bytes from upstream to client through a kernel pipe"""
+    pipe_r, pipe_w = os.pipe()
+    try:
+        try:
+            import fcntl
+            fcntl.fcntl(pipe_w, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+        except (ImportError, AttributeError, OSError):
+            pass  # default 64 KiB pipe - just more round trips
+        remaining = length
+        while remaining:
+            n = _splice(upstream.fileno(), pipe_w, min(remaining, SPLICE_CHUNK), upstream, writing=False)
+            if n == 0:
+                raise ConnectionError('upstream closed before Content-Length was reached')
+            remaining -= n
+            pending = n
+            while pending:
+                pending -= _splice(pipe_r, client.fileno(), pending, client, writing=True)
+            if meter:
+                meter.charge(n)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+
+
+class SpliceResponse(Response):
+    """Writes its own headers to the client socket and splices the upstream
+    body after them, then tells the WSGI server the connection is handled -
+    the same socket takeover flask-sock uses for websockets."""
+
+    def __init__(self, resp, meter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.upstream = resp
+        self.meter = meter
+        self.direct_passthrough = True  # nothing downstream may touch the body
+
+    def __call__(self, environ, start_response):
+        client = client_socket()
+        original = self.upstream.raw._fp
+        length = original.length
+        self.headers['Content-Length'] = str(length)
+        self.headers['Connection'] = 'close'
+        head = [f"HTTP/1.1 {self.status}\r\n"]
+        head += [f"{key}: {value}\r\n" for key, value in self.get_wsgi_headers(environ).items()]
+        try:
+            client.sendall(''.join(head).encode('latin-1') + b'\r\n')
+            # http.client may already hold the first body bytes it read
+            # along with the headers; those (at most one buffer) go through
+            # Python, everything after them stays in the kernel
+            buffered = original.fp.peek()[:length] if length else b''
+            if buffered:
+                client.sendall(buffered)
+            splice_body(upstream_socket(self.upstream), client, length - len(buffered), self.meter)
+            client.shutdown(socket.SHUT_WR)
+        finally:
+            if self.meter:
+                self.meter.close()
+            self.close()
+        if 'werkzeug.socket' in environ:
+            raise ConnectionError('response written directly to the socket')
+        raise StopIteration()
+
+
+def passthrough(resp, content_type=None, headers=None, status=None, meter=None):
+    """Response relaying a stream=True upstream response body as-is
+
+    Must be called with a `requests` response fetched with stream=True.
+    meter, if given, is a bandwidth.Meter pacing the body.
+    """
+    out_headers = Headers(headers or {})  # case-insensitive, so these replace the caller's
+    encoding = resp.headers.get('Content-Encoding', '').strip().lower()
+    length = resp.headers.get('Content-Length')
+    raw = True
+
+    if encoding and encoding != 'identity':
+        vary = out_headers.get('Vary')
+        if not vary:
+            out_headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            out_headers['Vary'] = f'{vary}, Accept-Encoding'
+        if client_accepts(encoding):
+            # Forward the compressed bytes exactly as the upstream sent them
+            out_headers['Content-Encoding'] = encoding
+        else:
+            # Client can't take this coding - fall back to decoding here
+            raw = False
+            length = None
+
+    if raw and can_splice(resp):
+        response = SpliceResponse(
+            resp,
+            meter=meter,
+            status=status,
+            content_type=content_type or resp.headers.get('Content-Type'),
+            headers=out_headers
+        )
+    else:
+        body = iter_raw(resp) if raw else resp.iter_content(chunk_size=CHUNK_SIZE)
+        if meter:
+            body = meter.wrap(body)
+        if length:
+            out_headers['Content-Length'] = length
+        response = Response(
+            body,
+            status=status,
+            content_type=content_type or resp.headers.get('Content-Type'),
+            headers=out_headers,
+            direct_passthrough=True
+        )
+    # Hand the upstream connection back even if the client disconnects early
+    response.call_on_close(resp.close)
+    return response
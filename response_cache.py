@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+RESPONSE CACHE - Shared cache of upstream subresource responses
+Holds complete, undecoded upstream bodies (CSS, JS, images, fonts) keyed by
+URL in the shared cache backend (see cache_backends), each stored with the
+upstream's freshness as its TTL: Cache-Control max-age/s-maxage or Expires,
+else RESPONSE_CACHE_TTL.
+Responses that are uncacheable - no-store, private, Set-Cookie, Vary on
+anything but Accept-Encoding, HTML, or too large - are never stored.
+
+lookup() hands back a real stream=True requests.Response built from the
+stored bytes, so handlers treat a hit exactly like an upstream fetch.
+likely_hit() is a free, in-process guess at the same answer, for
+admission control to give cache hits priority without asking the backend.
+"""
+import io
+import json
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+import cache_backends
+
+# Configuration (environment overrides)
+RESPONSE_CACHE_TTL = int(os.environ.get('PROXY_RESPONSE_CACHE_TTL', 60))         # seconds, without explicit freshness
+RESPONSE_CACHE_MAX_ENTRY = int(os.environ.get('PROXY_RESPONSE_CACHE_MAX_ENTRY', 8 * 1024 * 1024))
+
+HOP_BY_HOP = {'connection', 'keep-alive', 'transfer-encoding', 'set-cookie', 'age'}
+MAX_AGE_PATTERN = re.compile(r'(s-maxage|max-age)\s*=\s*(\d+)')
+PREFETCH_TRACKED = 4096  # prefetched URLs remembered for the used/wasted counters
+RECENT_TRACKED = 4096    # URLs this process stored or served, for likely_hit()
+META = struct.Struct('>I')  # length of the JSON metadata ahead of the body
+
+_adapter = HTTPAdapter()
+
+
+class _Body(io.BytesIO):
+    """Stored body read back like an http.client response"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.length = len(data)
+
+    def isclosed(self):
+        return self.closed or self.tell() >= self.length
+
+
+def pack(status, reason, headers, body):
+    """Stored form: 4-byte metadata length, JSON metadata, body"""
+    meta = json.dumps({'status': status, 'reason': reason, 'headers': headers}).encode()
+    return META.pack(len(meta)) + meta + body
+
+
+def unpack(data):
+    """(metadata dict, body) from pack()"""
+    size, = META.unpack_from(data)
+    meta = json.loads(data[META.size:META.size + size])
+    return meta, data[META.size + size:]
+
+
+def freshness(headers, now=None):
+    """Seconds a response may be served from cache (0 = don't store)"""
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control or 'no-cache' in cache_control or 'private' in cache_control:
+        return 0
+    ages = dict(MAX_AGE_PATTERN.findall(cache_control))
+    if ages:
+        # A shared cache prefers s-maxage over max-age
+        return int(ages.get('s-maxage', ages.get('max-age')))
+    if headers.get('Expires'):
+        try:
+            expires = parsedate_to_datetime(headers['Expires']).timestamp()
+        except (TypeError, ValueError):
+            return 0
+        return max(0, int(expires - (now or time.time())))
+    return RESPONSE_CACHE_TTL
+
+
+def cacheable(resp):
+    """Can this upstream response be stored for other clients?"""
+    if resp.status_code != 200 or resp.request is not None and resp.request.method != 'GET':
+        return False
+    if 'Set-Cookie' in resp.headers or 'text/html' in resp.headers.get('Content-Type', ''):
+        return False
+    vary = {v.strip().lower() for v in resp.headers.get('Vary', '').split(',') if v.strip()}
+    if vary - {'accept-encoding'}:
+        return False
+    return freshness(resp.headers) > 0
+
+
+class ResponseCache:
+    """URL -> stored upstream response in the shared cache backend"""
+
+    def __init__(self, backend=None, max_entry=RESPONSE_CACHE_MAX_ENTRY):
+        self.backend = backend if backend is not None else cache_backends.namespace('resp')
+        self.max_entry = max_entry
+        self._prefetched = OrderedDict()  # url -> expiry of a not-yet-used prefetch
+        self._recent = OrderedDict()      # url -> expiry of an entry this process stored or served
+        self._lock = threading.Lock()
+        self.counters = {
+            'hits': 0, 'misses': 0, 'stored': 0, 'rejected': 0,
+            'prefetched': 0, 'prefetch_used': 0, 'prefetch_wasted': 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _track_prefetch(self, url, ttl):
+        """Remember a prefetch until it is used, expires or ages out (lock held)"""
+        self._prefetched.pop(url, None)
+        self._prefetched[url] = time.monotonic() + ttl
+        self.counters['prefetched'] += 1
+        now = time.monotonic()
+        while self._prefetched:
+            oldest, expires = next(iter(self._prefetched.items()))
+            if expires > now and len(self._prefetched) <= PREFETCH_TRACKED:
+                break
+            del self._prefetched[oldest]
+            self.counters['prefetch_wasted'] += 1
+
+    def _note(self, url, expires):
+        """Remember url as cached until expires (lock held)"""
+        self._recent.pop(url, None)
+        self._recent[url] = expires
+        if len(self._recent) > RECENT_TRACKED:
+            self._recent.popitem(last=False)
+
+    def contains(self, url):
+        return self.backend.contains(url)
+
+    def likely_hit(self, url):
+        """Would lookup(url) probably hit? In-process only, never touches the backend"""
+        with self._lock:
+            return self._recent.get(url, 0) > time.monotonic()
+
+    def store(self, url, resp, prefetched=False):
+        """Read a stream=True response fully into the cache; True if stored
+
+        The response is always consumed and closed.
+        """
+        try:
+            length = resp.headers.get('Content-Length')
+            if not cacheable(resp) or (length and length.isdigit() and int(length) > self.max_entry):
+                self._count('rejected')
+                return False
+            body = resp.raw.read(self.max_entry + 1, decode_content=False)
+            if len(body) > self.max_entry:
+                self._count('rejected')
+                return False
+        finally:
+            resp.close()
+
+        headers = {k: v for k, v in resp.headers.items() if k.lower() not in HOP_BY_HOP}
+        headers['Content-Length'] = str(len(body))
+        ttl = freshness(resp.headers)
+        if not self.backend.set(url, pack(resp.status_code, resp.reason, headers, body), ttl):
+            self._count('rejected')
+            return False
+        with self._lock:
+            self.counters['stored'] += 1
+            self._note(url, time.monotonic() + ttl)
+            if prefetched:
+                self._track_prefetch(url, ttl)
+        return True
+
+    def lookup(self, url):
+        """A stream=True requests.Response for a fresh entry, or None"""
+        data = self.backend.get(url)
+        with self._lock:
+            if data is None:
+                self.counters['misses'] += 1
+                self._recent.pop(url, None)
+                return None
+            self.counters['hits'] += 1
+            if url not in self._recent:  # stored by another process; its TTL isn't known here
+                self._note(url, time.monotonic() + RESPONSE_CACHE_TTL)
+            if self._prefetched.pop(url, None) is not None:
+                self.counters['prefetch_used'] += 1
+
+        meta, body = unpack(data)
+        raw = HTTPResponse(
+            body=_Body(body),
+            headers=meta['headers'],
+            status=meta['status'],
+            reason=meta['reason'],
+            preload_content=False,
+            decode_content=True,
+        )
+        resp = _adapter.build_response(requests.Request('GET', url).prepare(), raw)
+        resp.elapsed = timedelta(0)
+        return resp
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+cache = ResponseCache()
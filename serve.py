@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+PRODUCTION LAUNCHER - Multi-worker entry point for the proxy apps
+Runs master_proxy (or any other app module) under a pre-fork Gunicorn
+master with SO_REUSEPORT, instead of Flask's single-process dev server.
+
+Usage:
+    python3 serve.py                          # master_proxy:app on 0.0.0.0:5000
+    python3 serve.py --workers 8 --worker-class gevent
+    python3 serve.py --app main:app --bind 0.0.0.0:8080
+
+Every option can also be set through a PROXY_* environment variable.
+Send SIGHUP to the master PID for a graceful reload (new workers are
+started before the old ones are retired), SIGTERM for a graceful stop.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+# Configuration (environment overrides)
+DEFAULT_APP = os.environ.get('PROXY_APP', 'master_proxy:app')
+DEFAULT_BIND = os.environ.get('PROXY_BIND', '0.0.0.0:5000')
+DEFAULT_WORKERS = int(os.environ.get('PROXY_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+DEFAULT_WORKER_CLASS = os.environ.get('PROXY_WORKER_CLASS', 'gthread')
+DEFAULT_THREADS = int(os.environ.get('PROXY_THREADS', 8))
+DEFAULT_WORKER_CONNECTIONS = int(os.environ.get('PROXY_WORKER_CONNECTIONS', 1000))
+DEFAULT_MAX_REQUESTS = int(os.environ.get('PROXY_MAX_REQUESTS', 2000))
+DEFAULT_MAX_REQUESTS_JITTER = int(os.environ.get('PROXY_MAX_REQUESTS_JITTER', 200))
+DEFAULT_GRACEFUL_TIMEOUT = int(os.environ.get('PROXY_GRACEFUL_TIMEOUT', 30))
+DEFAULT_TIMEOUT = int(os.environ.get('PROXY_WORKER_TIMEOUT', 120))
+DEFAULT_KEEPALIVE = int(os.environ.get('PROXY_KEEPALIVE', 5))
+
+# Worker classes suitable for long-lived streaming / WebSocket routes.
+# gthread ships with gunicorn; the green-thread classes need gevent/eventlet.
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'gevent': 'gevent',
+    'eventlet': 'eventlet',
+}
+
+
+class ProxyServer(BaseApplication if BaseApplication else object):
+    """Gunicorn application wrapper that loads a proxy app by import path"""
+
+    def __init__(self, app_path, options):
+        self.app_path = app_path
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        module_name, _, attr = self.app_path.partition(':')
+        module = __import__(module_name)
+        return getattr(module, attr or 'app')
+
+
+def on_starting(server):
+    print(f"[SERVE] Master {os.getpid()} starting "
+          f"({server.cfg.workers} x {server.cfg.worker_class_str} workers)")
+
+
+def post_fork(server, worker):
+    print(f"[SERVE] Worker {worker.pid} booted")
+
+
+def post_worker_init(worker):
+    """Start the app module's warm-up phase once the worker has loaded it"""
+    module = sys.modules.get(worker.app.app_path.partition(':')[0])
+    warmup = getattr(module, 'warmup', None)
+    if warmup is not None:
+        warmup.start()
+
+
+def worker_exit(server, worker):
+    print(f"[SERVE] Worker {worker.pid} exited "
+          f"after serving {worker.nr} requests")
+
+
+def on_reload(server):
+    print("[SERVE] Graceful reload requested - recycling workers")
+
+
+def build_options(args):
+    """Translate CLI arguments into gunicorn settings"""
+    worker_class = WORKER_CLASSES[args.worker_class]
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': worker_class,
+        'worker_connections': args.worker_connections,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests_jitter,
+        'graceful_timeout': args.graceful_timeout,
+        'timeout': args.timeout,
+        'keepalive': args.keepalive,
+        'reuse_port': not args.no_reuse_port,
+        'on_starting': on_starting,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'on_reload': on_reload,
+    }
+    if worker_class == 'gthread':
+        options['threads'] = args.threads
+    return options
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the proxy under a multi-worker production server')
+    parser.add_argument('--app', default=DEFAULT_APP,
+                        help='WSGI app import path (default: %(default)s)')
+    parser.add_argument('--bind', default=DEFAULT_BIND,
+                        help='host:port to listen on (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--worker-class', choices=sorted(WORKER_CLASSES), default=DEFAULT_WORKER_CLASS,
+                        help='worker type; gevent/eventlet suit streaming and WebSocket routes '
+                             '(default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='threads per gthread worker (default: %(default)s)')
+    parser.add_argument('--worker-connections', type=int, default=DEFAULT_WORKER_CONNECTIONS,
+                        help='max simultaneous connections per worker (default: %(default)s)')
+    parser.add_argument('--max-requests', type=int, default=DEFAULT_MAX_REQUESTS,
+                        help='recycle a worker after this many requests, 0 disables '
+                             '(default: %(default)s)')
+    parser.add_argument('--max-requests-jitter', type=int, default=DEFAULT_MAX_REQUESTS_JITTER,
+                        help='random extra requests before recycling, avoids all workers '
+                             'restarting at once (default: %(default)s)')
+    parser.add_argument('--graceful-timeout', type=int, default=DEFAULT_GRACEFUL_TIMEOUT,
+                        help='seconds a worker may finish in-flight requests on reload/stop '
+                             '(default: %(default)s)')
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT,
+                        help='seconds before a silent worker is killed (default: %(default)s)')
+    parser.add_argument('--keepalive', type=int, default=DEFAULT_KEEPALIVE,
+                        help='seconds to hold idle keep-alive connections (default: %(default)s)')
+    parser.add_argument('--no-reuse-port', action='store_true',
+                        help='do not set SO_REUSEPORT on the listening socket')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if BaseApplication is None:
+        print("gunicorn is required for the production launcher: pip3 install gunicorn")
+        print("(use 'python3 master_proxy.py' for the single-process development server)")
+        return 1
+
+    args = parse_args(argv)
+    options = build_options(args)
+
+    print("\n" + "="*70)
+    print("🚀 PROXY - Production Server")
+    print("="*70)
+    print(f"  App:            {args.app}")
+    print(f"  Bind:           {args.bind} (SO_REUSEPORT {'off' if args.no_reuse_port else 'on'})")
+    print(f"  Workers:        {args.workers} x {options['worker_class']}")
+    print(f"  Connections:    {args.worker_connections} per worker")
+    print(f"  Recycle after:  {args.max_requests} (+0..{args.max_requests_jitter}) requests")
+    print("  Graceful reload: kill -HUP <master pid>")
+    print("="*70 + "\n")
+
+    ProxyServer(args.app, options).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
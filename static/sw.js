@@ -1,5 +1,11 @@
 // Service Worker to intercept all requests and proxy them
 // This runs at the browser level before content filters see requests
+//
+// Proxied static assets (CSS, JS, fonts, images) are also kept in Cache
+// Storage and served stale-while-revalidate: a cached copy answers at once
+// while a background fetch refreshes it. The cache name carries the version
+// the server registered us with (/sw.js?v=N), so bumping it on the server
+// drops every old copy on the next activation.
 
 const PROXY_ORIGIN = self.location.origin;
 const TARGET_DOMAINS = [
@@ -10,39 +16,150 @@ const TARGET_DOMAINS = [
     'nflximg.net'
 ];
 
+const CACHE_PREFIX = 'proxy-assets-';
+const CACHE_VERSION = new URL(self.location.href).searchParams.get('v') || '0';
+const CACHE_NAME = CACHE_PREFIX + CACHE_VERSION;
+const MAX_CACHE_BYTES = 50 * 1024 * 1024;   // evict oldest entries beyond this
+const MAX_ENTRY_BYTES = 5 * 1024 * 1024;    // never cache anything bigger
+const STATIC_DESTINATIONS = ['style', 'script', 'font', 'image'];
+const STATIC_EXTENSIONS = /\.(css|js|mjs|woff2?|ttf|otf|eot|png|jpe?g|gif|webp|avif|svg|ico)$/i;
+
+// url -> bytes for everything in CACHE_NAME, oldest first (rebuilt per worker lifetime)
+const cacheIndex = new Map();
+let cacheBytes = 0;
+let indexLoaded = null;
+
 self.addEventListener('install', (event) => {
     console.log('[SW] Service Worker installing...');
     self.skipWaiting();
 });
 
 self.addEventListener('activate', (event) => {
-    console.log('[SW] Service Worker activating...');
-    event.waitUntil(self.clients.claim());
+    console.log('[SW] Service Worker activating, asset cache', CACHE_NAME);
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(
+                names
+                    .filter(name => name.startsWith(CACHE_PREFIX) && name !== CACHE_NAME)
+                    .map(name => caches.delete(name))
+            ))
+            .then(() => self.clients.claim())
+    );
 });
 
+function isStaticAsset(request, upstreamUrl) {
+    if (request.method !== 'GET') {
+        return false;
+    }
+    if (STATIC_DESTINATIONS.includes(request.destination)) {
+        return true;
+    }
+    try {
+        return STATIC_EXTENSIONS.test(new URL(upstreamUrl).pathname);
+    } catch (e) {
+        return false;
+    }
+}
+
+function responseSize(response) {
+    const length = parseInt(response.headers.get('Content-Length'), 10);
+    return isNaN(length) ? null : length;
+}
+
+function loadIndex(cache) {
+    if (!indexLoaded) {
+        indexLoaded = (async () => {
+            for (const request of await cache.keys()) {
+                const cached = await cache.match(request);
+                const size = (cached && responseSize(cached)) || 0;
+                cacheIndex.set(request.url, size);
+                cacheBytes += size;
+            }
+        })();
+    }
+    return indexLoaded;
+}
+
+async function store(cache, url, response) {
+    const cacheControl = response.headers.get('Cache-Control') || '';
+    if (response.status !== 200 || response.type === 'opaque' || /no-store/i.test(cacheControl)) {
+        return;
+    }
+    let size = responseSize(response);
+    if (size === null) {
+        size = (await response.clone().blob()).size;
+    }
+    if (size > MAX_ENTRY_BYTES) {
+        return;
+    }
+    await loadIndex(cache);
+    await cache.put(url, response);
+    if (cacheIndex.has(url)) {
+        cacheBytes -= cacheIndex.get(url);
+        cacheIndex.delete(url);
+    }
+    cacheIndex.set(url, size);
+    cacheBytes += size;
+
+    // Evict least recently stored entries until back under budget
+    for (const [oldest, bytes] of cacheIndex) {
+        if (cacheBytes <= MAX_CACHE_BYTES) {
+            break;
+        }
+        await cache.delete(oldest);
+        cacheIndex.delete(oldest);
+        cacheBytes -= bytes;
+    }
+}
+
+function proxyFetch(proxiedUrl, request) {
+    return fetch(proxiedUrl, {
+        method: request.method,
+        headers: request.headers,
+        credentials: 'omit'
+    });
+}
+
+async function staleWhileRevalidate(event, proxiedUrl) {
+    const cache = await caches.open(CACHE_NAME);
+    const cached = await cache.match(proxiedUrl);
+    const refresh = proxyFetch(proxiedUrl, event.request).then(response => {
+        const copy = response.clone();
+        event.waitUntil(store(cache, proxiedUrl, copy).catch(err => console.log('[SW] Cache store failed', err)));
+        return response;
+    });
+    if (cached) {
+        // Serve the cached copy now; the refresh finishes in the background
+        event.waitUntil(refresh.catch(() => {}));
+        return cached;
+    }
+    return refresh;
+}
+
 self.addEventListener('fetch', (event) => {
     const url = new URL(event.request.url);
-    
-    // Skip if already going through proxy
-    if (url.pathname.startsWith('/proxy')) {
+
+    if (url.origin === PROXY_ORIGIN) {
+        // Already rewritten to go through the proxy - only static assets need us
+        if (url.pathname === '/proxy' && isStaticAsset(event.request, url.searchParams.get('url'))) {
+            event.respondWith(staleWhileRevalidate(event, event.request.url));
+        }
         return;
     }
-    
+
     // Check if this is a Netflix domain that should be proxied
     const shouldProxy = TARGET_DOMAINS.some(domain => url.hostname.includes(domain));
-    
-    if (shouldProxy && url.hostname !== PROXY_ORIGIN) {
-        // Intercept and proxy the request
-        const proxiedUrl = `${PROXY_ORIGIN}/proxy?url=${encodeURIComponent(event.request.url)}`;
-        
-        console.log('[SW] Proxying:', event.request.url, '->', proxiedUrl);
-        
-        event.respondWith(
-            fetch(proxiedUrl, {
-                method: event.request.method,
-                headers: event.request.headers,
-                credentials: 'omit'
-            })
-        );
+    if (!shouldProxy) {
+        return;
+    }
+
+    // Intercept and proxy the request
+    const proxiedUrl = `${PROXY_ORIGIN}/proxy?url=${encodeURIComponent(event.request.url)}`;
+    console.log('[SW] Proxying:', event.request.url, '->', proxiedUrl);
+
+    if (isStaticAsset(event.request, event.request.url)) {
+        event.respondWith(staleWhileRevalidate(event, proxiedUrl));
+    } else {
+        event.respondWith(proxyFetch(proxiedUrl, event.request));
     }
 });
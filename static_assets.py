@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+STATIC ASSETS - Precomputed in-memory responses for static pages
+Each asset is encoded once at startup into immutable bytes plus
+pre-compressed gzip/brotli variants, each with its own strong
+content-hash ETag, so a hit is a dictionary lookup: 304 on revalidation
+of the variant the client would get, otherwise the best variant it
+accepts - no templating or compression per request.
+"""
+import gzip
+import hashlib
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+ETAG_SUFFIXES = {'identity': '', 'gzip': '-gz', 'br': '-br'}
+
+
+class StaticAsset:
+    """An immutable, pre-compressed response body"""
+
+    def __init__(self, body, mimetype, cache_control='no-cache', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.headers = dict(headers or {})
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        # Keep a compressed variant only when it actually saves bytes
+        self.variants = {'identity': body}
+        gzipped = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if len(gzipped) < len(body):
+            self.variants['gzip'] = gzipped
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+            if len(compressed) < len(body):
+                self.variants['br'] = compressed
+        # Strong validators must differ per representation
+        self.etags = {encoding: digest + ETAG_SUFFIXES[encoding] for encoding in self.variants}
+
+    def __len__(self):
+        return len(self.variants['identity'])
+
+    def negotiate(self, accept_encodings):
+        """Pick the smallest variant the client accepts"""
+        best = 'identity'
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings.quality(encoding) > 0:
+                if len(self.variants[encoding]) < len(self.variants[best]):
+                    best = encoding
+        return best
+
+    def response(self):
+        """Serve from memory for the current request (304 if unchanged)"""
+        encoding = self.negotiate(request.accept_encodings)
+        etag = self.etags[encoding]
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        headers.update(self.headers)
+
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
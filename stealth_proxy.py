@@ -1,4 +1,3 @@
-import requests
 import base64
 import json
 import hashlib
@@ -6,89 +5,17 @@ from flask import Flask, Response, request, jsonify
 from urllib.parse import urljoin, quote, unquote
 import re
 
+import cache_backends
+import pipeline
+
 app = Flask(__name__)
 
 TARGET_URL = "https://www.netflix.com/"
-resource_cache = {}
-
-@app.route('/api/resource/<resource_id>')
-def get_resource(resource_id):
-    """
-    Serve resources as JSON (looks like API data to filter, not images)
-    """
-    if resource_id not in resource_cache:
-        return jsonify({'error': 'not found'}), 404
-    
-    url = resource_cache[resource_id]
-    print(f"[API] Fetching resource: {url[:80]}...")
-    
-    try:
-        resp = requests.get(url, timeout=10, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        
-        if resp.status_code != 200:
-            return jsonify({'error': 'fetch failed'}), resp.status_code
-        
-        # Encode as base64 and wrap in JSON
-        # This looks like API data, not an image file
-        data = {
-            'type': 'resource',
-            'encoding': 'base64',
-            'data': base64.b64encode(resp.content).decode('utf-8'),
-            'mime': resp.headers.get('Content-Type', 'application/octet-stream'),
-            'size': len(resp.content)
-        }
-        
-        print(f"[API] Served {len(resp.content)} bytes as JSON")
-        
-        # Return as JSON with text/plain to avoid any image detection
-        response = Response(
-            json.dumps(data),
-            mimetype='text/plain'  # Looks like text, not JSON or images
-        )
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        return response
-        
-    except Exception as e:
-        print(f"[API] Error: {e}")
-        return jsonify({'error': str(e)}), 500
+RESOURCE_TTL = 3600  # seconds a registered resource id stays valid
+# id -> URL, in the shared cache so /register and /api/resource/<id> may hit different workers
+resource_cache = cache_backends.namespace('stealth')
 
-@app.route('/')
-def index():
-    return proxy_page('/')
-
-@app.route('/<path:path>')
-def proxy_page(path=''):
-    """Proxy and inject stealth loader"""
-    
-    if path.startswith('api/'):
-        return "Invalid path", 404
-    
-    # Build target URL
-    target_url = urljoin(TARGET_URL, path)
-    if request.query_string:
-        target_url += '?' + request.query_string.decode('utf-8')
-    
-    print(f"[PROXY] Fetching: {target_url}")
-    
-    try:
-        resp = requests.get(
-            target_url,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            },
-            timeout=10,
-            allow_redirects=True
-        )
-        
-        content_type = resp.headers.get('Content-Type', '')
-        
-        if 'text/html' in content_type:
-            html = resp.text
-            
-            # Inject stealth resource loader at the beginning
-            stealth_script = '''
+STEALTH_SCRIPT = '''
 <script>
 (function() {
     console.log('[Stealth] Initializing...');
@@ -242,21 +169,74 @@ def proxy_page(path=''):
 })();
 </script>
 '''
-            
-            html = html.replace('<head>', '<head>' + stealth_script, 1)
-            
-            # Remove external resources that would be blocked
-            html = re.sub(r'<link[^>]*font[^>]*>', '', html, flags=re.IGNORECASE)
-            
-            return Response(html, mimetype='text/html')
+
+@app.route('/api/resource/<resource_id>')
+def get_resource(resource_id):
+    """
+    Serve resources as JSON (looks like API data to filter, not images)
+    """
+    url = resource_cache.get(resource_id)
+    if url is None:
+        return jsonify({'error': 'not found'}), 404
+    
+    url = url.decode('utf-8')
+    print(f"[API] Fetching resource: {url[:80]}...")
+    
+    try:
+        resp = pipeline.get_resource(url)
+        
+        if resp.status_code != 200:
+            return jsonify({'error': 'fetch failed'}), resp.status_code
+        
+        # Encode as base64 and wrap in JSON
+        # This looks like API data, not an image file
+        data = {
+            'type': 'resource',
+            'encoding': 'base64',
+            'data': base64.b64encode(resp.content).decode('utf-8'),
+            'mime': resp.headers.get('Content-Type', 'application/octet-stream'),
+            'size': len(resp.content)
+        }
+        
+        print(f"[API] Served {len(resp.content)} bytes as JSON")
+        
+        # Return as JSON with text/plain to avoid any image detection
+        response = Response(
+            json.dumps(data),
+            mimetype='text/plain'  # Looks like text, not JSON or images
+        )
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
         
-        else:
-            # Pass through other content
-            return Response(resp.content, mimetype=content_type)
-            
     except Exception as e:
-        print(f"[PROXY] Error: {e}")
-        return f"Error: {e}", 500
+        print(f"[API] Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def inject_stealth_loader(html, target_url):
+    """Stealth resource loader at the beginning; drop font links that would be blocked"""
+    html = html.replace('<head>', '<head>' + STEALTH_SCRIPT, 1)
+    return re.sub(r'<link[^>]*font[^>]*>', '', html, flags=re.IGNORECASE)
+
+# Other content is passed through
+PAGE_MODE = pipeline.Mode('proxy', transforms={'html': (inject_stealth_loader,)})
+
+@app.route('/')
+def index():
+    return proxy_page('/')
+
+@app.route('/<path:path>')
+def proxy_page(path=''):
+    """Proxy and inject stealth loader"""
+    
+    if path.startswith('api/'):
+        return "Invalid path", 404
+    
+    # Build target URL
+    target_url = urljoin(TARGET_URL, path)
+    if request.query_string:
+        target_url += '?' + request.query_string.decode('utf-8')
+    
+    return pipeline.run(PAGE_MODE, target_url)
 
 @app.route('/register')
 def register_resource():
@@ -265,7 +245,7 @@ def register_resource():
     url = request.args.get('url')
     
     if resource_id and url:
-        resource_cache[resource_id] = unquote(url)
+        resource_cache.set(resource_id, unquote(url).encode('utf-8'), RESOURCE_TTL)
         print(f"[REGISTER] {resource_id} -> {url[:60]}...")
     
     # Return 1x1 transparent pixel
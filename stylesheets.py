@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+STYLESHEETS - Stylesheet dependency analysis with a transformed-output cache
+A stylesheet is scanned once for its url() and @import dependencies, its
+fonts are fetched concurrently and embedded as data URIs, and the other
+dependencies are rewritten in a single pass. The dependency list and the
+transformed text are cached under (upstream URL, validator, variant), so a
+repeat request for an unchanged sheet is one cache lookup - no regex
+pass and no font fetches. Entries live in the shared cache backend, so
+every worker sees a sheet once any of them has transformed it.
+
+The validator is the upstream ETag or Last-Modified; sheets served without
+either are keyed by a hash of their body. The variant is anything else the
+output depends on, e.g. the proxy origin written into rewritten URLs.
+The newest validator per sheet is kept too, so a repeat request can be a
+conditional GET: a 304 means the cached output is still current and no
+body crosses the wire.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import cache_backends
+import hostlimit
+
+# Configuration (environment overrides)
+STYLESHEET_TTL = int(os.environ.get('PROXY_STYLESHEET_TTL', 24 * 3600))  # validator-keyed, so only bounds storage
+FONT_WORKERS = 6  # concurrent font fetches per stylesheet
+
+FONT_EXTENSIONS = ('.woff2', '.woff', '.ttf', '.eot', '.otf')
+
+# url(x), url('x'), url("x") and @import 'x' / @import "x"
+DEPENDENCY_PATTERN = re.compile(
+    r'url\(\s*(["\']?)([^"\')]+)\1\s*\)'
+    r'|@import\s+(["\'])([^"\']+)\3'
+)
+
+
+def is_font(url):
+    return urlparse(url).path.lower().endswith(FONT_EXTENSIONS)
+
+
+def validator(headers):
+    """Upstream validator for a response's headers, or None"""
+    return headers.get('ETag') or headers.get('Last-Modified')
+
+
+def conditional_headers(validator):
+    """Request headers that get a 304 from the upstream while validator is current"""
+    if validator.startswith(('"', 'W/"')):
+        return {'If-None-Match': validator}
+    return {'If-Modified-Since': validator}
+
+
+def absolute(url, base_url=None):
+    """Absolute form of a dependency URL, or None if it can't be resolved"""
+    if url.startswith(('http://', 'https://')):
+        return url
+    if url.startswith('//'):
+        return 'https:' + url
+    if base_url and not url.startswith(('data:', '#')):
+        return urljoin(base_url, url)
+    return None
+
+
+class Dependency:
+    """One url() or @import reference in a stylesheet"""
+
+    def __init__(self, raw, url, kind):
+        self.raw = raw      # as written in the sheet
+        self.url = url      # absolute, or None if it stays as written
+        self.kind = kind    # 'font', 'import' or 'url'
+
+
+def dependencies(css, base_url=None):
+    """Every url()/@import in a stylesheet, in order of appearance"""
+    deps = []
+    for match in DEPENDENCY_PATTERN.finditer(css):
+        if match.group(2) is not None:
+            raw = match.group(2).strip()
+            url = absolute(raw, base_url)
+            kind = 'font' if url and is_font(url) else 'url'
+        else:
+            raw = match.group(4).strip()
+            url = absolute(raw, base_url)
+            kind = 'import'
+        deps.append(Dependency(raw, url, kind))
+    return deps
+
+
+class StylesheetCache:
+    """Transformed stylesheets and their dependency lists in the shared cache backend"""
+
+    def __init__(self, backend=None, workers=FONT_WORKERS, ttl=STYLESHEET_TTL):
+        self.backend = backend if backend is not None else cache_backends.namespace('css')
+        self.workers = workers
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.uncacheable = 0
+
+    @staticmethod
+    def _key(url, validator, variant):
+        return f'{url}\n{validator}\n{variant}'
+
+    @staticmethod
+    def _validator_key(url):
+        return f'{url}\nvalidator'
+
+    def _load(self, url, validator, variant):
+        data = self.backend.get(self._key(url, validator, variant)) if validator else None
+        return json.loads(data) if data is not None else None
+
+    def lookup(self, url, validator, variant=''):
+        """Cached transformed output, or None"""
+        entry = self._load(url, validator, variant)
+        if entry is None:
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry['output']
+
+    def known_validator(self, url):
+        """Upstream validator of the newest cached transform of url, or None"""
+        data = self.backend.get(self._validator_key(url))
+        return data.decode('utf-8') if data is not None else None
+
+    def _store(self, url, validator, variant, deps, output, revalidatable):
+        entry = {'deps': [[dep.raw, dep.url, dep.kind] for dep in deps], 'output': output}
+        self.backend.set(self._key(url, validator, variant), json.dumps(entry).encode(), self.ttl)
+        if revalidatable:
+            self.backend.set(self._validator_key(url), validator.encode('utf-8'), self.ttl)
+
+    def _embed_fonts(self, deps, fetch_font, max_fonts):
+        """Fetch the sheet's fonts concurrently; {url: data URI or None}"""
+        fonts = list(dict.fromkeys(dep.url for dep in deps if dep.kind == 'font'))
+        if max_fonts is not None:
+            fonts = fonts[:max_fonts]
+        if not fonts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(fonts))) as executor:
+            futures = {url: hostlimit.submit(executor, fetch_font, url) for url in fonts}
+            return {url: future.result() for url, future in futures.items()}
+
+    def transform(self, url, css, validator=None, variant='', base_url=None,
+                  fetch_font=None, rewrite=None, max_fonts=None):
+        """Transformed stylesheet text, from cache when possible
+
+        fetch_font(url) returns a data URI or None; rewrite(url) returns
+        the replacement for any other absolute dependency, or None to leave
+        it as written. Output with a failed font is not cached, so the
+        next request retries the fetch. A sheet cached under an upstream
+        validator can be revalidated with it (see known_validator).
+        """
+        revalidatable = bool(validator)
+        validator = validator or hashlib.sha1(css.encode('utf-8', 'surrogatepass')).hexdigest()
+        cached = self.lookup(url, validator, variant)
+        if cached is not None:
+            return cached
+
+        deps = dependencies(css, base_url)
+        embedded = self._embed_fonts(deps, fetch_font, max_fonts) if fetch_font else {}
+        replacements = iter(deps)
+
+        def substitute(match):
+            dep = next(replacements)
+            data_uri = embedded.get(dep.url)
+            if data_uri:
+                return f'url("{data_uri}")'
+            target = rewrite(dep.url) if rewrite and dep.url else None
+            if target is None:
+                return match.group(0)
+            if dep.kind == 'import':
+                return f'@import "{target}"'
+            return f'url("{target}")'
+
+        output = DEPENDENCY_PATTERN.sub(substitute, css)
+        complete = all(embedded.values())
+        with self._lock:
+            self.misses += 1
+            if not complete:
+                self.uncacheable += 1
+        if complete:
+            self._store(url, validator, variant, deps, output, revalidatable)
+        print(f"[CSS     ] {len(deps)} deps, {len(embedded)} fonts embedded "
+              f"({'cached' if complete else 'not cached'}): {url[:80]}", flush=True)
+        return output
+
+    def dependencies_of(self, url, validator, variant=''):
+        """Cached dependency list for a sheet, or None"""
+        entry = self._load(url, validator, variant)
+        if entry is None:
+            return None
+        return [Dependency(*dep) for dep in entry['deps']]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'uncacheable': self.uncacheable}
+
+
+cache = StylesheetCache()
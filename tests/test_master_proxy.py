@@ -14,6 +14,8 @@ from threading import Thread
 # Test configuration
 BASE_URL = "http://localhost:5000"
 SERVER_STARTUP_WAIT = 3  # seconds
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)  # offline tests import the proxy's modules directly
 
 
 class MasterProxyTestCase(unittest.TestCase):
@@ -93,6 +95,30 @@ class TestHomepage(MasterProxyTestCase):
         
         self.assertIn('6', html)  # 6 proxy modes
         self.assertIn('Proxy Modes', html)
+    
+    def test_homepage_revalidates_with_etag(self):
+        """Test that homepage has a strong ETag and answers 304 when unchanged"""
+        resp = requests.get(BASE_URL, timeout=5)
+        etag = resp.headers.get('ETag')
+        self.assertIsNotNone(etag)
+        self.assertFalse(etag.startswith('W/'))
+        
+        resp = requests.get(BASE_URL, headers={'If-None-Match': etag}, timeout=5)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b'')
+        
+        # Another encoding is another representation, so the validator doesn't match it
+        resp = requests.get(BASE_URL, headers={'If-None-Match': etag, 'Accept-Encoding': 'identity'},
+                            timeout=5)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers.get('ETag'), etag)
+    
+    def test_homepage_served_compressed(self):
+        """Test that homepage is served from a pre-compressed variant"""
+        resp = requests.get(BASE_URL, headers={'Accept-Encoding': 'gzip'}, timeout=5)
+        self.assertEqual(resp.headers.get('Content-Encoding'), 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers.get('Vary', ''))
+        self.assertIn('Master Proxy', resp.text)
 
 
 class TestFlixHQMode(MasterProxyTestCase):
@@ -214,6 +240,23 @@ class TestIframeProxy(MasterProxyTestCase):
             # Check for iframe interceptor
             self.assertIn('Master', html)
     
+    def test_iframe_proxy_compresses_html(self):
+        """Test that rewritten HTML is compressed when the client accepts gzip"""
+        test_url = "https://example.com"
+        
+        resp = requests.get(
+            f"{BASE_URL}/iframe-proxy",
+            params={'url': test_url},
+            headers={'Accept-Encoding': 'gzip'},
+            timeout=10
+        )
+        if resp.status_code != 200:
+            # example.com not reachable from here; TestCompression covers this offline
+            self.skipTest("example.com not accessible")
+        
+        self.assertEqual(resp.headers.get('Content-Encoding'), 'gzip')
+        self.assertIn('Master', resp.text)
+    
     def test_iframe_proxy_has_cors_headers(self):
         """Test that iframe proxy includes CORS headers"""
         test_url = "https://example.com"
@@ -328,6 +371,1025 @@ class TestUtilityFunctions(MasterProxyTestCase):
         self.assertIn(resp.status_code, [400, 500, 502, 504])
 
 
+class TestHealth(MasterProxyTestCase):
+    """Test warm-up readiness reporting"""
+    
+    def test_healthz_reports_readiness(self):
+        """Test that /healthz reports warm-up status and time-to-ready"""
+        resp = requests.get(f"{BASE_URL}/healthz", timeout=5)
+        self.assertIn(resp.status_code, [200, 503])
+        
+        data = resp.json()
+        self.assertIn(data['status'], ['ready', 'warming'])
+        self.assertIn('time_to_ready_ms', data)
+        self.assertIn('steps', data)
+    
+    def test_healthz_becomes_ready(self):
+        """Test that warm-up finishes even when upstream is unreachable"""
+        for _ in range(20):
+            resp = requests.get(f"{BASE_URL}/healthz", timeout=5)
+            if resp.status_code == 200:
+                break
+            time.sleep(0.5)
+        
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNotNone(resp.json()['time_to_ready_ms'])
+
+
+class TestStats(MasterProxyTestCase):
+    """Test upstream statistics endpoint"""
+    
+    def test_stats_reports_dns_and_prewarm(self):
+        """Test that /stats exposes the DNS cache and pre-warmed hosts"""
+        resp = requests.get(f"{BASE_URL}/stats", timeout=5)
+        self.assertEqual(resp.status_code, 200)
+        
+        data = resp.json()
+        self.assertIn('hits', data['dns'])
+        self.assertIn('misses', data['dns'])
+        self.assertIn('https://flixhq.to/', data['prewarm']['hot_origins'])
+        self.assertIn('hosts', data)
+    
+    def test_stats_reports_prefetch_usage(self):
+        """Test that /stats shows how many prefetched cache entries were used"""
+        resp = requests.get(f"{BASE_URL}/stats", timeout=5)
+        data = resp.json()
+        self.assertIn('prefetch_used', data['response_cache'])
+        self.assertIn('prefetch_wasted', data['response_cache'])
+        self.assertIn('scheduled', data['prefetch'])
+
+
+class TestCacheBackends(unittest.TestCase):
+    """Test the shared cache tier against the stand-in RESP server"""
+    
+    RESP_PORT = 6390
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.server_process = subprocess.Popen(
+            [sys.executable, "cache_backends.py", "--serve-resp", str(cls.RESP_PORT)],
+            stdout=subprocess.PIPE,
+            cwd=PROJECT_ROOT
+        )
+        cls.server_process.stdout.readline()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server_process.terminate()
+        cls.server_process.wait()
+    
+    def test_tiered_round_trip_with_ttl(self):
+        """Test that binary values reach L2, come back after an L1 miss and expire"""
+        import cache_backends
+        tiered = cache_backends.TieredBackend(
+            cache_backends.MemoryBackend(),
+            cache_backends.RespBackend(port=self.RESP_PORT)
+        )
+        value = bytes(range(256))
+        self.assertTrue(tiered.set('test:blob', value, ttl=0.5))
+        tiered.l1.delete('test:blob')
+        self.assertEqual(tiered.get('test:blob'), value)
+        time.sleep(0.6)
+        self.assertIsNone(tiered.l2.get('test:blob'))
+    
+    def test_unreachable_shared_tier_is_a_miss(self):
+        """Test that a down L2 degrades to misses instead of errors"""
+        import cache_backends
+        backend = cache_backends.RespBackend(port=1)
+        self.assertIsNone(backend.get('anything'))
+        self.assertFalse(backend.set('anything', b'x'))
+    
+    def test_disk_accounting_and_truncated_files(self):
+        """Test that rewrites of a key are counted once and a truncated file is a miss"""
+        import tempfile
+        import cache_backends
+        with tempfile.TemporaryDirectory() as directory:
+            backend = cache_backends.DiskBackend(directory)
+            workers = [Thread(target=backend.set, args=('key', b'x' * 100)) for _ in range(8)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            self.assertEqual(backend.stats()['bytes'], backend.HEADER.size + 100)
+            with open(backend._path('key'), 'wb') as f:
+                f.write(b'\0\0')
+            self.assertIsNone(backend.get('key'))
+            self.assertFalse(os.path.exists(backend._path('key')))
+
+
+class TestCluster(unittest.TestCase):
+    """Test the cache cluster's key placement and peer route offline"""
+    
+    def test_ring_moves_few_keys(self):
+        """Test that adding a node only moves the keys it takes over"""
+        import cluster
+        nodes = ['http://a:5000', 'http://b:5000', 'http://c:5000']
+        before = cluster.HashRing(nodes)
+        after = cluster.HashRing(nodes + ['http://d:5000'])
+        keys = [f'key{i}' for i in range(2000)]
+        moved = [k for k in keys if before.owner(k) != after.owner(k)]
+        self.assertTrue(all(after.owner(k) == 'http://d:5000' for k in moved))
+        self.assertLess(len(moved), len(keys) * 0.4)
+    
+    def test_cache_route_needs_secret(self):
+        """Test that /cluster/cache only exists with a secret and checks it"""
+        from unittest import mock
+        from flask import Flask
+        import cache_backends
+        import cluster
+        peers = ['http://a:5000', 'http://b:5000']
+        for secret, served in (('', False), ('s3cret', True)):
+            app = Flask(__name__)
+            with mock.patch.object(cluster, 'node', cluster.Cluster(peers, peers[0], secret)):
+                cluster.init_app(app, cache_backends.MemoryBackend())
+                client = app.test_client()
+                status = client.put('/cluster/cache?key=k', data=b'x').status_code
+                self.assertEqual(status, 403 if served else 404)
+                if served:
+                    status = client.put('/cluster/cache?key=k', data=b'x',
+                                        headers={'X-Cluster-Secret': secret}).status_code
+                    self.assertEqual(status, 204)
+
+
+class TestBreaker(unittest.TestCase):
+    """Test the per-host circuit breaker without touching the network"""
+    
+    URL = 'http://flaky.invalid/a.png'
+    
+    def setUp(self):
+        import breaker
+        self.breaker = breaker
+        self.b = breaker.Breaker(failures=2, cooldown=0, negative_ttl=60)
+    
+    def fail_fetch(self, url):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            with self.b.guard(url):
+                raise requests.exceptions.ConnectionError("down")
+    
+    def test_trips_after_failures_and_remembers_url(self):
+        """Test that repeated host errors open the circuit and failed URLs are skipped"""
+        self.b.cooldown = 60
+        self.fail_fetch(self.URL)
+        with self.assertRaises(self.breaker.KnownFailure):
+            self.b.check(self.URL)
+        self.fail_fetch(self.URL + '?2')
+        with self.assertRaises(self.breaker.CircuitOpen):
+            self.b.check('http://flaky.invalid/other.png')
+    
+    def test_probe_refused_locally_does_not_wedge_half_open(self):
+        """Test that a FastFail inside the half-open probe lets the next caller probe"""
+        import hostlimit
+        self.fail_fetch(self.URL)
+        self.fail_fetch(self.URL + '?2')
+        with self.assertRaises(hostlimit.HostBusy):
+            with self.b.guard('http://flaky.invalid/b.png'):
+                raise hostlimit.HostBusy("no slot")
+        with self.b.guard('http://flaky.invalid/c.png') as attempt:
+            attempt.status(200)
+        self.assertEqual(self.b.stats()['hosts'].get('flaky.invalid', {}).get('state', 'closed'), 'closed')
+
+
+class TestBandwidth(unittest.TestCase):
+    """Test the video bandwidth scheduler offline"""
+    
+    def test_max_min_share(self):
+        """Test that light users keep their demand and the rest is split evenly"""
+        import bandwidth
+        allocation = bandwidth.max_min_share({'a': 1, 'b': 10, 'c': 10}, 12)
+        self.assertEqual(allocation, {'a': 1, 'b': 5.5, 'c': 5.5})
+    
+    def test_sequential_streams_share_one_bucket(self):
+        """Test that back-to-back short streams (HLS segments) stay under the per-client cap"""
+        import bandwidth
+        scheduler = bandwidth.BandwidthScheduler(global_rate=0, per_client=4 * 1024 * 1024, burst=1024 * 1024)
+        chunk = b'x' * (256 * 1024)
+        start = time.monotonic()
+        for _ in range(5):  # 5 MB: one burst, then 4 MB at 4 MB/s
+            meter = scheduler.meter('10.0.0.1', 'segment')
+            for _ in meter.wrap([chunk] * 4):
+                pass
+        self.assertGreater(time.monotonic() - start, 0.8)
+        self.assertIn('10.0.0.1', scheduler.stats()['clients'])
+
+
+class TestRelay(unittest.TestCase):
+    """Test the pooled readinto relay loop on in-memory bodies"""
+    
+    def test_read_views_round_trip_and_reuse(self):
+        """Test that bodies come through intact and buffers go back to the pool"""
+        import io
+        import relay
+        pool = relay.BufferPool()
+        body = os.urandom(3 * 1024 * 1024 + 17)
+        self.assertEqual(b''.join(bytes(v) for v in relay.read_views(io.BytesIO(body), pool=pool)), body)
+        small = os.urandom(5000)
+        chunks = [bytes(v) for v in relay.read_views(io.BytesIO(small), len(small), pool=pool)]
+        self.assertEqual(chunks, [small])
+        allocated = pool.allocated
+        for _ in range(3):
+            list(relay.read_views(io.BytesIO(small), len(small), pool=pool))
+        self.assertEqual(pool.allocated, allocated)
+    
+    def test_passthrough_merges_caller_headers(self):
+        """Test that passthrough extends the caller's Vary and sets the coding headers itself"""
+        from types import SimpleNamespace
+        from flask import Flask
+        from requests.structures import CaseInsensitiveDict
+        import relay
+        upstream = SimpleNamespace(
+            headers=CaseInsensitiveDict({'Content-Encoding': 'gzip', 'Content-Length': '3'}),
+            raw=SimpleNamespace(stream=lambda amt, decode_content: iter([b'abc'])),
+            close=lambda: None,
+        )
+        with Flask(__name__).test_request_context('/', headers={'Accept-Encoding': 'gzip'}):
+            response = relay.passthrough(upstream, 'application/octet-stream', headers={'vary': 'Origin'})
+        self.assertEqual(response.headers.getlist('Vary'), ['Origin, Accept-Encoding'])
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-Length'], '3')
+    
+    def test_passthrough_decodes_for_clients_without_the_coding(self):
+        """Test that a coding the client can't take is decoded and its headers dropped"""
+        import gzip
+        from types import SimpleNamespace
+        from flask import Flask
+        from requests.structures import CaseInsensitiveDict
+        import relay
+        body = b'hello world' * 100
+        compressed = gzip.compress(body)
+        upstream = SimpleNamespace(
+            headers=CaseInsensitiveDict({'Content-Encoding': 'gzip', 'Content-Length': str(len(compressed))}),
+            raw=SimpleNamespace(stream=lambda amt, decode_content: iter([compressed])),
+            iter_content=lambda chunk_size: iter([body[:500], body[500:]]),
+            close=lambda: None,
+        )
+        with Flask(__name__).test_request_context('/', headers={'Accept-Encoding': 'identity'}):
+            response = relay.passthrough(upstream, 'text/plain')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(b''.join(response.response), body)
+    
+    def splice_upstream(self, body, buffered, sock=None):
+        """Stub stream=True response: http.client holds `buffered`, the rest is on sock"""
+        import io
+        from types import SimpleNamespace
+        from requests.structures import CaseInsensitiveDict
+        class HTTPResponse(io.BytesIO):
+            chunked = False
+            length = len(body)
+            fp = io.BufferedReader(io.BytesIO(buffered))
+            def isclosed(self):
+                return self.tell() == len(body)
+        raw = SimpleNamespace(_fp=HTTPResponse(body), _connection=SimpleNamespace(sock=sock),
+                              release_conn=lambda: None)
+        return SimpleNamespace(raw=raw, headers=CaseInsensitiveDict({'Content-Length': str(len(body))}),
+                               close=lambda: None)
+    
+    def test_zero_copy_relays_headers_and_body(self):
+        """Test that a spliced response writes its head, the buffered bytes and the socket's rest"""
+        import socket
+        from unittest import mock
+        from flask import Flask
+        import relay
+        if not hasattr(os, 'splice'):
+            self.skipTest("no os.splice on this platform")
+        body = os.urandom(3 * relay.SPLICE_CHUNK + 5)
+        upstream_in, upstream_out = socket.socketpair()
+        client_in, client_out = socket.socketpair()
+        received = []
+        reader = Thread(target=lambda: received.append(b''.join(iter(lambda: client_out.recv(65536), b''))))
+        reader.start()
+        writer = Thread(target=upstream_in.sendall, args=(body[100:],))
+        writer.start()
+        upstream = self.splice_upstream(body, body[:100], sock=upstream_out)
+        app = Flask(__name__)
+        try:
+            with mock.patch.object(relay, 'ZERO_COPY', True), \
+                    app.test_request_context('/', environ_base={'werkzeug.socket': client_in}) as ctx:
+                response = relay.passthrough(upstream, 'image/png')
+                self.assertIsInstance(response, relay.SpliceResponse)
+                with self.assertRaises(ConnectionError):
+                    response(ctx.request.environ, lambda *args: None)
+            reader.join(5)
+            writer.join(5)
+        finally:
+            for sock in (upstream_in, upstream_out, client_in, client_out):
+                sock.close()
+        head, _, relayed = received[0].partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 OK'))
+        self.assertIn(f'Content-Length: {len(body)}'.encode(), head)
+        self.assertEqual(relayed, body)
+    
+    def test_zero_copy_falls_back_to_read_loop(self):
+        """Test that without splice or a client socket the body goes through iter_raw"""
+        import socket
+        from types import SimpleNamespace
+        from unittest import mock
+        from flask import Flask
+        import relay
+        body = os.urandom(70000)
+        client_in, client_out = socket.socketpair()
+        app = Flask(__name__)
+        cases = [
+            ({}, relay.os),                                      # WSGI server exposes no socket
+            ({'werkzeug.socket': client_in}, SimpleNamespace()),  # no os.splice
+        ]
+        try:
+            for environ, os_module in cases:
+                with mock.patch.object(relay, 'ZERO_COPY', True), mock.patch.object(relay, 'os', os_module), \
+                        app.test_request_context('/', environ_base=environ):
+                    response = relay.passthrough(self.splice_upstream(body, b''), 'image/png')
+                self.assertNotIsInstance(response, relay.SpliceResponse)
+                self.assertEqual(response.headers['Content-Length'], str(len(body)))
+                self.assertEqual(b''.join(response.response), body)
+        finally:
+            client_in.close()
+            client_out.close()
+    
+    def test_small_bodies_get_small_buffers(self):
+        """Test that the first buffer is sized from the body, not MAX_READ"""
+        import relay
+        pool = relay.BufferPool()
+        self.assertEqual(len(pool.acquire(5000)), 8192)
+        self.assertEqual(len(pool.acquire(10 * relay.MAX_READ)), relay.MAX_READ)
+
+
+class TestPipeline(unittest.TestCase):
+    """Test the shared fetch path offline"""
+    
+    def test_only_subresources_consult_response_cache(self):
+        """Test that navigations skip the response cache and asset fetches use it"""
+        from unittest import mock
+        from flask import Flask
+        import pipeline
+        app = Flask(__name__)
+        cases = [
+            ({'Sec-Fetch-Dest': 'document'}, 'page'),
+            ({'Sec-Fetch-Dest': 'image', 'Accept': 'text/html'}, 'subresource'),
+            ({'Accept': 'text/html,*/*;q=0.8'}, 'page'),
+            ({'Accept': '*/*'}, 'subresource'),
+        ]
+        for headers, expected in cases:
+            with app.test_request_context('/', headers=headers):
+                self.assertEqual(pipeline.client_request_class(), expected)
+        with mock.patch.object(pipeline.response_cache.cache, 'lookup', return_value='hit') as lookup:
+            self.assertEqual(pipeline.fetch('http://a.invalid/x.js', request_class='subresource'), 'hit')
+            with mock.patch.object(pipeline.session, 'request', return_value='upstream'):
+                self.assertEqual(pipeline.fetch('http://a.invalid/'), 'upstream')
+            lookup.assert_called_once_with('http://a.invalid/x.js')
+    
+    def test_relay_headers_only_on_untouched_bodies(self):
+        """Test that a mode's relay_headers reach relayed media but not rewritten pages"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from flask import Flask
+        from requests.structures import CaseInsensitiveDict
+        import pipeline
+        mode = pipeline.Mode('test', transforms={'html': ()}, headers={'X-Mode': 'test'},
+                             relay_headers={'Access-Control-Allow-Origin': '*'})
+        page = SimpleNamespace(status_code=200, text='<html></html>',
+                               headers=CaseInsensitiveDict({'Content-Type': 'text/html'}))
+        image = SimpleNamespace(status_code=200, headers=CaseInsensitiveDict({'Content-Type': 'image/png'}),
+                                raw=SimpleNamespace(stream=lambda amt, decode_content: iter([b'png'])),
+                                close=lambda: None)
+        with Flask(__name__).test_request_context('/'):
+            with mock.patch.object(pipeline, 'fetch', return_value=page):
+                response = pipeline.run(mode, 'http://a.invalid/')
+            self.assertEqual(response.headers['X-Mode'], 'test')
+            self.assertNotIn('Access-Control-Allow-Origin', response.headers)
+            with mock.patch.object(pipeline, 'fetch', return_value=image):
+                response = pipeline.run(mode, 'http://a.invalid/x.png')
+            self.assertEqual(response.headers['X-Mode'], 'test')
+            self.assertEqual(response.headers['Access-Control-Allow-Origin'], '*')
+
+
+class TestAdmission(unittest.TestCase):
+    """Test the admission controller's queueing and shedding"""
+    
+    def test_queue_and_shed(self):
+        """Test that a waiter gets a freed slot and arrivals past the queue are shed"""
+        import admission
+        controller = admission.AdmissionController(limits={'ultra': 1}, total=4, queue_size=1, max_wait=2)
+        controller.acquire('ultra')
+        admitted = []
+        waiter = Thread(target=lambda: admitted.append(controller.acquire('ultra') or True))
+        waiter.start()
+        while not controller.stats()['queued']:
+            time.sleep(0.01)
+        with self.assertRaises(admission.Overloaded):
+            controller.acquire('ultra', admission.EXPENSIVE)
+        controller.release('ultra')
+        waiter.join(2)
+        self.assertEqual(admitted, [True])
+        self.assertEqual(controller.stats()['modes']['ultra']['shed'], 1)
+    
+    def test_zero_queue_sheds_immediately(self):
+        """Test that with no queue a request over the cap is shed, not crashed"""
+        import admission
+        controller = admission.AdmissionController(limits={'ultra': 1}, total=4, queue_size=0)
+        controller.acquire('ultra')
+        with self.assertRaises(admission.Overloaded):
+            controller.acquire('ultra')
+    
+    def test_cheaper_arrival_bumps_expensive_waiter(self):
+        """Test that a full queue sheds its most expensive waiter for a cheap newcomer"""
+        import admission
+        controller = admission.AdmissionController(limits={'page': 1}, total=4, queue_size=1, max_wait=2)
+        controller.acquire('page')
+        outcome = []
+        
+        def expensive():
+            try:
+                controller.acquire('page', admission.EXPENSIVE)
+                outcome.append('admitted')
+            except admission.Overloaded:
+                outcome.append('shed')
+        
+        waiter = Thread(target=expensive)
+        waiter.start()
+        while not controller.stats()['queued']:
+            time.sleep(0.01)
+        cheap = Thread(target=controller.acquire, args=('page', admission.CHEAP))
+        cheap.start()
+        waiter.join(2)
+        self.assertEqual(outcome, ['shed'])
+        controller.release('page')
+        cheap.join(2)
+        self.assertEqual(controller.stats()['modes']['page']['in_flight'], 1)
+    
+    def test_ultra_assets_are_not_page_assemblies(self):
+        """Test that only navigations to /ultra take the capped ultra slots"""
+        import admission
+        import master_proxy
+        from flask import request
+        url = '/ultra/?url=https%3A%2F%2Fa.invalid%2Fx.png'
+        cases = [
+            ({'Sec-Fetch-Dest': 'document'}, ('ultra', admission.EXPENSIVE)),
+            ({'Sec-Fetch-Dest': 'image'}, ('page', admission.NORMAL)),
+            ({'Accept': 'image/avif,image/webp,*/*'}, ('page', admission.NORMAL)),
+        ]
+        for headers, expected in cases:
+            with master_proxy.app.test_request_context(url, headers=headers):
+                self.assertEqual(master_proxy.classify_request(request), expected)
+
+
+class TestHedge(unittest.TestCase):
+    """Test hedged fetches against a stubbed slow-then-fast upstream"""
+    
+    def slow_then_fast(self):
+        calls = []
+        def fetch():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return 'primary'
+            return 'backup'
+        return fetch
+    
+    def seed(self, url):
+        from latency import tracker
+        for _ in range(20):
+            tracker.observe(url, 0.01)
+    
+    def test_backup_wins_when_primary_stalls(self):
+        """Test that a fetch past the host's p90 is hedged and the faster attempt is returned"""
+        import hedge
+        url = 'http://hedge-wins.invalid/a.png'
+        self.seed(url)
+        hedger = hedge.Hedger(budget=1)
+        start = time.monotonic()
+        self.assertEqual(hedger.call(url, self.slow_then_fast()), 'backup')
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(hedger.stats()['hedged'], 1)
+        self.assertEqual(hedger.stats()['hedge_wins'], 1)
+    
+    def test_no_hedge_without_budget_or_samples(self):
+        """Test that an empty token budget, or an unmeasured host, waits for the primary"""
+        import hedge
+        url = 'http://hedge-budget.invalid/a.png'
+        self.seed(url)
+        hedger = hedge.Hedger(budget=0)
+        self.assertEqual(hedger.call(url, self.slow_then_fast()), 'primary')
+        self.assertEqual(hedger.stats()['budget_denied'], 1)
+        hedger = hedge.Hedger(budget=1)
+        self.assertEqual(hedger.call('http://hedge-new.invalid/a.png', self.slow_then_fast()), 'primary')
+        self.assertEqual(hedger.stats()['hedged'], 0)
+    
+    def test_failed_result_does_not_win(self):
+        """Test that a primary returning a failed result loses to a slower backup"""
+        import hedge
+        url = 'http://hedge-failed.invalid/a.png'
+        self.seed(url)
+        calls = []
+        def fetch():
+            calls.append(None)
+            attempt = len(calls)
+            time.sleep(0.1 * attempt)
+            return None if attempt == 1 else 'backup'
+        hedger = hedge.Hedger(budget=1)
+        self.assertEqual(hedger.call(url, fetch, ok=lambda result: result is not None), 'backup')
+        self.assertEqual(hedger.stats()['hedge_wins'], 1)
+
+
+class TestTimeouts(unittest.TestCase):
+    """Test latency windows and the timeouts derived from them"""
+    
+    def test_percentile_over_rolling_window(self):
+        """Test that only the newest samples count and too few give no estimate"""
+        import latency
+        tracker = latency.LatencyTracker(samples=5)
+        for seconds in range(1, 11):
+            tracker.observe('http://window.invalid/x', seconds)
+        self.assertEqual(tracker.count('http://window.invalid/other'), 5)
+        self.assertEqual(tracker.percentile('http://window.invalid/x', 50), 8)
+        self.assertEqual(tracker.percentile('http://window.invalid/x', 99), 10)
+        self.assertIsNone(tracker.percentile('http://window.invalid/x', 50, min_samples=6))
+        self.assertIsNone(tracker.percentile('http://window.invalid/x', 50, metric='ttfb'))
+    
+    def test_timeouts_follow_observed_latency(self):
+        """Test that timeouts start at the ceiling and then track p99, clamped to the floor"""
+        import timeouts
+        from latency import tracker
+        url = 'http://timeouts.invalid/a.css'
+        policy = timeouts.CLASSES['subresource']
+        if policy.static:
+            self.skipTest("subresource timeouts fixed by PROXY_TIMEOUT_SUBRESOURCE")
+        self.assertEqual(timeouts.for_request(url, 'subresource'),
+                         (policy.connect_ceiling, policy.first_byte_ceiling))
+        for _ in range(timeouts.TIMEOUT_MIN_SAMPLES):
+            tracker.observe(url, 0.01, 'connect')
+            tracker.observe(url, 2.0, 'ttfb')
+        connect, first_byte = timeouts.for_request(url, 'subresource')
+        self.assertEqual(connect, policy.connect_floor)
+        self.assertEqual(first_byte, min(policy.first_byte_ceiling, 2.0 * timeouts.TIMEOUT_MULTIPLIER))
+
+
+class TestStylesheets(unittest.TestCase):
+    """Test stylesheet dependency scanning and the transformed-output cache"""
+    
+    CSS = ('@import "theme.css";\n'
+           '@font-face { src: url(fonts/a.woff2) }\n'
+           'body { background: url("//cdn.invalid/bg.png") }\n'
+           '.x { background: url(data:image/png;base64,AAAA) }\n')
+    
+    def test_dependencies_in_order(self):
+        """Test that url() and @import references are resolved and classified"""
+        import stylesheets
+        deps = stylesheets.dependencies(self.CSS, 'http://site.invalid/css/main.css')
+        self.assertEqual([(dep.url, dep.kind) for dep in deps], [
+            ('http://site.invalid/css/theme.css', 'import'),
+            ('http://site.invalid/css/fonts/a.woff2', 'font'),
+            ('https://cdn.invalid/bg.png', 'url'),
+            (None, 'url'),
+        ])
+    
+    def test_transform_cached_until_a_font_fails(self):
+        """Test that fonts are embedded, the rest rewritten, and only complete output reused"""
+        import cache_backends
+        import stylesheets
+        cache = stylesheets.StylesheetCache(backend=cache_backends.MemoryBackend())
+        fetched = []
+        def fetch_font(url):
+            fetched.append(url)
+            return 'data:font/woff2;base64,AAAA'
+        kwargs = dict(validator='"v1"', base_url='http://site.invalid/css/main.css',
+                      fetch_font=fetch_font, rewrite=lambda url: '/proxy?url=' + url)
+        output = cache.transform('http://site.invalid/css/main.css', self.CSS, **kwargs)
+        self.assertIn('@import "/proxy?url=http://site.invalid/css/theme.css"', output)
+        self.assertIn('url("data:font/woff2;base64,AAAA")', output)
+        self.assertIn('url("/proxy?url=https://cdn.invalid/bg.png")', output)
+        self.assertIn('url(data:image/png;base64,AAAA)', output)
+        self.assertEqual(cache.transform('http://site.invalid/css/main.css', self.CSS, **kwargs), output)
+        self.assertEqual(len(fetched), 1)
+        self.assertEqual(len(cache.dependencies_of('http://site.invalid/css/main.css', '"v1"')), 4)
+        
+        kwargs['fetch_font'] = lambda url: fetched.append(url)
+        for _ in range(2):
+            cache.transform('http://site.invalid/css/other.css', self.CSS, **kwargs)
+        self.assertEqual(len(fetched), 3)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 3, 'uncacheable': 2})
+    
+    def test_unchanged_stylesheet_is_revalidated(self):
+        """Test that a transformed sheet is re-requested conditionally and a 304 serves the cache"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import main
+        sent = []
+        class Upstream(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.headers.get('If-None-Match') == '"v1"':
+                    sent.append(304)
+                    self.send_response(304)
+                    self.send_header('ETag', '"v1"')
+                    self.end_headers()
+                    return
+                sent.append(200)
+                body = b'body { background: url(http://cdn.invalid/bg.png) }'
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/css')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', '"v1"')
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Upstream)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/revalidate.css'
+            client = main.app.test_client()
+            first = client.get('/proxy', query_string={'url': url}, headers={'Accept': 'text/css'})
+            second = client.get('/proxy', query_string={'url': url}, headers={'Accept': 'text/css'})
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(sent, [200, 304])
+        self.assertEqual(second.status_code, 200)
+        self.assertIn('/proxy?url=', first.get_data(as_text=True))
+        self.assertEqual(second.get_data(), first.get_data())
+
+
+class TestDataUri(unittest.TestCase):
+    """Test the streaming data: URI encoder on stubbed responses"""
+    
+    def stub(self, body, chunk=1000, length=True):
+        from types import SimpleNamespace
+        from requests.structures import CaseInsensitiveDict
+        headers = CaseInsensitiveDict({'Content-Length': str(len(body))} if length else {})
+        read = []
+        def iter_content(chunk_size):
+            for i in range(0, len(body), chunk):
+                read.append(chunk)
+                yield body[i:i + chunk]
+        return SimpleNamespace(headers=headers, url='http://fonts.invalid/a.woff2', iter_content=iter_content), read
+    
+    def test_encode_matches_base64(self):
+        """Test that chunked encoding, with or without Content-Length, equals one-shot base64"""
+        import base64
+        import datauri
+        body = os.urandom(10007)
+        expected = 'data:font/woff2;base64,' + base64.b64encode(body).decode('ascii')
+        for length in (True, False):
+            resp, _ = self.stub(body, length=length)
+            self.assertEqual(datauri.encode(resp, 'font/woff2'), expected)
+        self.assertEqual(datauri.encoded_size(len(body)), len(base64.b64encode(body)))
+        self.assertEqual(datauri.encoded_size(0), 0)
+    
+    def test_encode_over_cap(self):
+        """Test that a large Content-Length is refused unread and a large body abandoned early"""
+        import datauri
+        resp, read = self.stub(os.urandom(50000))
+        self.assertIsNone(datauri.encode(resp, 'font/woff2', max_bytes=10000))
+        self.assertEqual(read, [])
+        resp, read = self.stub(os.urandom(50000), length=False)
+        self.assertIsNone(datauri.encode(resp, 'font/woff2', max_bytes=10000))
+        self.assertEqual(len(read), 11)
+
+
+class TestInlinePolicy(unittest.TestCase):
+    """Test the per-page inlining budget with pre-sized candidates"""
+    
+    def test_choose_settle_release(self):
+        """Test document-order choice within the caps and the accounting after fetches"""
+        from unittest import mock
+        import inlining
+        base = 'http://inline.invalid/'
+        for name, size in [('a', 600), ('b', 1500), ('c', 1200), ('d', 900), ('e', 300), ('f', ''), ('g', 700)]:
+            inlining.sizes.set(base + name, str(size).encode('ascii'))
+        urls = [base + name for name in 'abacdefg']
+        with mock.patch.object(inlining.imageopt, 'enabled', False):
+            policy = inlining.InlinePolicy(budget=3000, max_item=1000)
+            self.assertEqual(policy.choose(urls), [base + name for name in 'adef'])
+            self.assertEqual(policy.spent, 800 + 1200 + 400)
+            self.assertEqual(inlining.InlinePolicy(budget=0).choose(urls), [])
+            self.assertEqual(inlining.InlinePolicy(budget=3000, max_item=1000).choose(urls, encoded=False),
+                             [base + name for name in 'adefg'])
+        self.assertTrue(policy.settle(base + 'd', 1000))
+        self.assertEqual(policy.spent, 2200)
+        self.assertFalse(policy.settle(base + 'f', 900))
+        self.assertEqual(policy.spent, 2200)
+        policy.release(base + 'e')
+        self.assertEqual(policy.spent, 1800)
+    
+    def test_request_overrides_are_clamped(self):
+        """Test that ?inline_budget / ?inline_max are bounded and bad values ignored"""
+        import inlining
+        policy = inlining.InlinePolicy.from_args({'inline_budget': '-5', 'inline_max': str(10 ** 12)})
+        self.assertEqual((policy.budget, policy.max_item), (0, inlining.INLINE_BUDGET_CEILING))
+        policy = inlining.InlinePolicy.from_args({'inline_budget': 'lots'})
+        self.assertEqual(policy.budget, inlining.INLINE_BUDGET)
+
+
+class TestImageOptimizer(unittest.TestCase):
+    """Test which images are recompressed and the converted-result cache"""
+    
+    def test_applies_only_when_enabled_to_raster_images(self):
+        """Test that disabled or skipped types are inlined untouched"""
+        from unittest import mock
+        import imageopt
+        optimizer = imageopt.ImageOptimizer()
+        with mock.patch.object(imageopt, 'enabled', False):
+            self.assertFalse(imageopt.applies('image/png'))
+            self.assertEqual(optimizer.optimize(b'png', 'image/png'), (b'png', 'image/png'))
+        with mock.patch.object(imageopt, 'enabled', True):
+            self.assertTrue(imageopt.applies('image/jpeg'))
+            for mime in imageopt.SKIP_TYPES + ('font/woff2',):
+                self.assertFalse(imageopt.applies(mime))
+            with mock.patch.object(imageopt, 'SOURCE_MAX_BYTES', 2):
+                self.assertEqual(optimizer.optimize(b'png', 'image/png'), (b'png', 'image/png'))
+        self.assertEqual(optimizer.stats()['converted'], 0)
+    
+    def test_cached_results_skip_the_pool(self):
+        """Test that a cached conversion, or a cached decision to keep, is reused"""
+        from unittest import mock
+        import imageopt
+        optimizer = imageopt.ImageOptimizer(max_dim=64)
+        imageopt.results.set(optimizer.key(b'big'), b'image/webp\nsmall')
+        imageopt.results.set(optimizer.key(b'kept'), b'')
+        with mock.patch.object(imageopt, 'enabled', True), \
+                mock.patch.object(optimizer, '_executor', side_effect=AssertionError):
+            self.assertEqual(optimizer.optimize(b'big', 'image/png'), (b'small', 'image/webp'))
+            self.assertEqual(optimizer.optimize(b'kept', 'image/png'), (b'kept', 'image/png'))
+        self.assertEqual(optimizer.stats()['hits'], 2)
+    
+    def test_convert_shrinks_to_max_dim(self):
+        """Test that a large image comes back smaller and within the size limit"""
+        import io
+        import imageopt
+        if imageopt.Image is None:
+            self.skipTest("Pillow not installed")
+        source = io.BytesIO()
+        imageopt.Image.effect_noise((2000, 1000), 64).convert('RGB').save(source, 'PNG')
+        body, mime = imageopt.convert(source.getvalue(), 256, 70, 'WEBP')
+        self.assertEqual(mime, 'image/webp')
+        self.assertLess(len(body), len(source.getvalue()))
+        self.assertEqual(max(imageopt.Image.open(io.BytesIO(body)).size), 256)
+        self.assertIsNone(imageopt.convert(b'not an image', 256, 70, 'WEBP'))
+
+
+class TestCompression(unittest.TestCase):
+    """Test client-facing compression on responses built in-process"""
+    
+    BODY = b'<html><body>' + b'<p>Master Proxy</p>' * 200 + b'</body></html>'
+    
+    def compress(self, response, accept_encoding):
+        from flask import Flask
+        import compression
+        with Flask(__name__).test_request_context('/', headers={'Accept-Encoding': accept_encoding}):
+            return compression.compress_response(response)
+    
+    def test_negotiated_encoding(self):
+        """Test that br is preferred when available, gzip otherwise, identity when neither is accepted"""
+        import gzip
+        from flask import Response
+        import compression
+        preferred = 'br' if compression.brotli else 'gzip'
+        for accept_encoding, expected in [('gzip, br', preferred), ('gzip', 'gzip'), ('identity', None)]:
+            response = self.compress(Response(self.BODY, mimetype='text/html'), accept_encoding)
+            self.assertEqual(response.headers.get('Content-Encoding'), expected)
+            if expected is None:
+                self.assertEqual(response.get_data(), self.BODY)
+                continue
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            data = response.get_data()
+            decoded = compression.brotli.decompress(data) if expected == 'br' else gzip.decompress(data)
+            self.assertEqual(decoded, self.BODY)
+    
+    def test_strong_etag_downgraded(self):
+        """Test that a strong validator becomes weak once the bytes are recompressed"""
+        from flask import Response
+        response = Response(self.BODY, mimetype='text/html')
+        response.set_etag('abc')
+        response = self.compress(response, 'gzip')
+        self.assertEqual(response.get_etag(), ('abc', True))
+    
+    def test_passthrough_and_encoded_bodies_untouched(self):
+        """Test that relayed, already-encoded, small and media bodies are left alone"""
+        from flask import Response
+        relayed = Response(iter([self.BODY]), mimetype='text/html', direct_passthrough=True)
+        encoded = Response(self.BODY, mimetype='text/html', headers={'Content-Encoding': 'gzip'})
+        small = Response(b'<p>hi</p>', mimetype='text/html')
+        image = Response(self.BODY, mimetype='image/png')
+        for response in (relayed, encoded, small, image):
+            before = response.headers.get('Content-Encoding')
+            response = self.compress(response, 'gzip')
+            self.assertEqual(response.headers.get('Content-Encoding'), before)
+            self.assertNotIn('Vary', response.headers)
+        self.assertEqual(b''.join(relayed.response), self.BODY)
+    
+    def test_streamed_body_compressed_per_chunk(self):
+        """Test that a streamed body is compressed without buffering and drops Content-Length"""
+        import gzip
+        from flask import Response
+        response = Response(iter([self.BODY[:100], self.BODY[100:]]), mimetype='text/html',
+                            headers={'Content-Length': str(len(self.BODY))})
+        response = self.compress(response, 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gzip.decompress(b''.join(response.response)), self.BODY)
+
+
+class TestEmbedImages(unittest.TestCase):
+    """Test main.py's concurrent image embedding with a stubbed fetcher"""
+    
+    def test_embed_keeps_order_and_failures(self):
+        """Test that images are fetched concurrently through the host limiter, in page order"""
+        from unittest import mock
+        import hostlimit
+        import main
+        urls = [f'http://embed.invalid/{name}.png' for name in ('d', 'c', 'b', 'a')]
+        def fetch(url, mime=None, max_bytes=None):
+            time.sleep(0.2)
+            return None if url.endswith('/c.png') else 'data:image/png;base64,' + url[-5]
+        with mock.patch.object(main.datauri, 'fetch', side_effect=fetch), \
+                mock.patch.object(main.hostlimit, 'submit', wraps=hostlimit.submit) as submit:
+            start = time.monotonic()
+            embedded = main.embed_images(urls)
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(list(embedded), urls)
+        self.assertEqual(embedded[urls[0]], 'data:image/png;base64,d')
+        self.assertIsNone(embedded[urls[1]])
+        self.assertEqual([call.args[2] for call in submit.call_args_list], urls)
+        self.assertIsNone(main.image_cache.get(urls[1]))
+        self.assertIsNotNone(main.image_cache.get(urls[0]))
+    
+    def test_failed_images_keep_their_proxied_url(self):
+        """Test that a page's embeddable images become data URIs and failures stay proxied links"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from unittest import mock
+        from urllib.parse import quote
+        import main
+        class Upstream(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = (b'<html><head></head><body><img src="//img.invalid/ok.png">'
+                        b'<img src="//img.invalid/missing.png"></body></html>')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        def fetch(url, mime=None, max_bytes=None):
+            return 'data:image/png;base64,b2s=' if url.endswith('/ok.png') else None
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Upstream)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with mock.patch.object(main.datauri, 'fetch', side_effect=fetch):
+                resp = main.app.test_client().get(
+                    '/proxy', query_string={'url': f'http://127.0.0.1:{server.server_port}/page.html'},
+                    headers={'Accept': 'text/html'})
+            html = resp.get_data(as_text=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('<img src="data:image/png;base64,b2s=">', html)
+        self.assertIn(f'<img src="http://localhost/proxy?url={quote("https://img.invalid/missing.png")}">', html)
+
+
+class TestEarlyHints(unittest.TestCase):
+    """Test preload selection and 103 Early Hints offline"""
+    
+    PAGE = '''<html><head>
+<script src="/proxy?url=https%3A//cdn.site.com/app.js"></script>
+<script src="/proxy?url=https%3A//tracker.other.net/t.js"></script>
+<script type="module" src="/proxy?url=https%3A//cdn.site.com/m.js"></script>
+<link rel="preload" as="font" href="/proxy?url=https%3A//fonts.site.com/a.woff2">
+<link rel="icon" href="/favicon.ico">
+<link rel="stylesheet" href="https://elsewhere.com/x.css">
+<link rel="stylesheet" href="http://proxy.local:5000/proxy?url=https%3A//www.site.com/a.css">
+</head></html>'''
+    LINKS = [
+        '<http://proxy.local:5000/proxy?url=https%3A//www.site.com/a.css>; rel=preload; as=style',
+        '</proxy?url=https%3A//fonts.site.com/a.woff2>; rel=preload; as=font; crossorigin',
+        '</proxy?url=https%3A//cdn.site.com/app.js>; rel=preload; as=script',
+    ]
+    
+    def test_collect_ranks_and_caps(self):
+        """Test that proxied stylesheets, fonts and first-party scripts are picked in that order"""
+        import early_hints
+        links = early_hints.collect(self.PAGE, 'https://www.site.com/', 'http://proxy.local:5000')
+        self.assertEqual(links, self.LINKS)
+        self.assertEqual(early_hints.collect(self.PAGE, 'https://www.site.com/', 'http://proxy.local:5000',
+                                             limit=2), self.LINKS[:2])
+    
+    def test_early_hints_off_by_default(self):
+        """Test that 103s are only written with PROXY_EARLY_HINTS=1, and then for known pages"""
+        import socket
+        from flask import Flask, Response
+        import early_hints
+        for value, expected in [(None, 'False'), ('1', 'True')]:
+            env = {key: val for key, val in os.environ.items() if key != 'PROXY_EARLY_HINTS'}
+            if value:
+                env['PROXY_EARLY_HINTS'] = value
+            result = subprocess.run([sys.executable, '-c', 'import early_hints; print(early_hints.hints.early)'],
+                                    cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+            self.assertEqual(result.stdout.strip(), expected)
+        
+        client_in, client_out = socket.socketpair()
+        client_out.settimeout(1)
+        app = Flask(__name__)
+        environ = {'werkzeug.socket': client_in, 'SERVER_PROTOCOL': 'HTTP/1.1'}
+        try:
+            for early in (False, True):
+                hints = early_hints.PreloadHints(early=early)
+                with app.test_request_context('/', environ_base=environ):
+                    self.assertFalse(hints.send_early('https://www.site.com/'))
+                    response = hints.apply(Response('page'), 'https://www.site.com/', self.LINKS)
+                    self.assertEqual(response.headers.getlist('Link'), self.LINKS)
+                    self.assertEqual(hints.send_early('https://www.site.com/'), early)
+            head = client_out.recv(65536).decode('latin-1')
+        finally:
+            client_in.close()
+            client_out.close()
+        self.assertEqual(head, 'HTTP/1.1 103 Early Hints\r\n'
+                         + ''.join(f'Link: {link}\r\n' for link in self.LINKS) + '\r\n')
+
+
+class TestHostLimit(unittest.TestCase):
+    """Test per-host slots and round-robin queuing across flows"""
+    
+    def test_hosts_do_not_share_slots(self):
+        """Test that a saturated host queues its own fetches without blocking another host"""
+        import hostlimit
+        limiter = hostlimit.HostLimiter(default_limit=1, limits={'big.invalid': 2}, queue_timeout=0.1)
+        limiter.acquire('a.invalid')
+        limiter.acquire('b.invalid')
+        limiter.acquire('big.invalid')
+        limiter.acquire('big.invalid')
+        with self.assertRaises(hostlimit.HostBusy):
+            limiter.acquire('a.invalid')
+        limiter.release('a.invalid')
+        limiter.acquire('a.invalid')
+        stats = limiter.stats()
+        self.assertEqual((stats['a.invalid']['active'], stats['a.invalid']['timeouts']), (1, 1))
+        self.assertEqual(stats['big.invalid']['active'], 2)
+    
+    def test_free_slots_alternate_between_flows(self):
+        """Test that a flow with a burst queued can't starve a flow that queued after it"""
+        import hostlimit
+        limiter = hostlimit.HostLimiter(default_limit=1, queue_timeout=5)
+        limiter.acquire('h.invalid', flow='holder')
+        order = []
+        def fetch(flow):
+            limiter.acquire('h.invalid', flow=flow)
+            order.append(flow)
+            limiter.release('h.invalid')
+        threads = []
+        for flow in ['page'] * 3 + ['other'] * 2:
+            threads.append(Thread(target=fetch, args=(flow,)))
+            threads[-1].start()
+            while limiter.stats()['h.invalid']['waiting'] < len(threads):
+                time.sleep(0.01)
+        limiter.release('h.invalid')
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, ['page', 'other', 'page', 'other', 'page'])
+
+
+class TestServe(unittest.TestCase):
+    """Test the production launcher's option mapping"""
+    
+    def options_with_env(self, **overrides):
+        """build_options() for no CLI arguments, in a fresh interpreter with only these PROXY_* vars"""
+        import json
+        env = {key: value for key, value in os.environ.items() if not key.startswith('PROXY_')}
+        env.update(overrides)
+        script = ('import json, serve; options = serve.build_options(serve.parse_args([]));'
+                  'print(json.dumps({k: v for k, v in options.items() if not callable(v)}))')
+        result = subprocess.run([sys.executable, '-c', script], cwd=PROJECT_ROOT, env=env,
+                                capture_output=True, text=True, check=True)
+        return json.loads(result.stdout.splitlines()[-1])
+    
+    def test_defaults(self):
+        """Test the worker and thread defaults without any environment"""
+        import multiprocessing
+        options = self.options_with_env()
+        self.assertEqual(options['workers'], multiprocessing.cpu_count() * 2 + 1)
+        self.assertEqual(options['worker_class'], 'gthread')
+        self.assertEqual(options['threads'], 8)
+        self.assertEqual(options['bind'], '0.0.0.0:5000')
+        self.assertTrue(options['reuse_port'])
+    
+    def test_environment_overrides(self):
+        """Test that PROXY_* variables become the gunicorn settings"""
+        options = self.options_with_env(PROXY_BIND='127.0.0.1:8080', PROXY_WORKERS='3', PROXY_THREADS='4',
+                                        PROXY_MAX_REQUESTS='50', PROXY_WORKER_TIMEOUT='9', PROXY_KEEPALIVE='2')
+        self.assertEqual(
+            {key: options[key] for key in ('bind', 'workers', 'threads', 'max_requests', 'timeout', 'keepalive')},
+            {'bind': '127.0.0.1:8080', 'workers': 3, 'threads': 4, 'max_requests': 50, 'timeout': 9, 'keepalive': 2})
+        options = self.options_with_env(PROXY_WORKER_CLASS='gevent')
+        self.assertEqual(options['worker_class'], 'gevent')
+        self.assertNotIn('threads', options)
+    
+    def test_cli_flags(self):
+        """Test that command-line flags win and hooks are wired in"""
+        import serve
+        options = serve.build_options(serve.parse_args(['--workers', '2', '--no-reuse-port']))
+        self.assertEqual(options['workers'], 2)
+        self.assertFalse(options['reuse_port'])
+        self.assertIs(options['post_worker_init'], serve.post_worker_init)
+
+
 class TestPerformance(MasterProxyTestCase):
     """Performance and reliability tests"""
     
@@ -377,6 +1439,26 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestUltraMode))
     suite.addTests(loader.loadTestsFromTestCase(TestStealthMode))
     suite.addTests(loader.loadTestsFromTestCase(TestUtilityFunctions))
+    suite.addTests(loader.loadTestsFromTestCase(TestHealth))
+    suite.addTests(loader.loadTestsFromTestCase(TestStats))
+    suite.addTests(loader.loadTestsFromTestCase(TestCacheBackends))
+    suite.addTests(loader.loadTestsFromTestCase(TestCluster))
+    suite.addTests(loader.loadTestsFromTestCase(TestBreaker))
+    suite.addTests(loader.loadTestsFromTestCase(TestBandwidth))
+    suite.addTests(loader.loadTestsFromTestCase(TestRelay))
+    suite.addTests(loader.loadTestsFromTestCase(TestPipeline))
+    suite.addTests(loader.loadTestsFromTestCase(TestAdmission))
+    suite.addTests(loader.loadTestsFromTestCase(TestHedge))
+    suite.addTests(loader.loadTestsFromTestCase(TestTimeouts))
+    suite.addTests(loader.loadTestsFromTestCase(TestStylesheets))
+    suite.addTests(loader.loadTestsFromTestCase(TestDataUri))
+    suite.addTests(loader.loadTestsFromTestCase(TestInlinePolicy))
+    suite.addTests(loader.loadTestsFromTestCase(TestImageOptimizer))
+    suite.addTests(loader.loadTestsFromTestCase(TestCompression))
+    suite.addTests(loader.loadTestsFromTestCase(TestEmbedImages))
+    suite.addTests(loader.loadTestsFromTestCase(TestEarlyHints))
+    suite.addTests(loader.loadTestsFromTestCase(TestHostLimit))
+    suite.addTests(loader.loadTestsFromTestCase(TestServe))
     suite.addTests(loader.loadTestsFromTestCase(TestPerformance))
     
     # Run tests with verbose output
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+TIMEOUTS - Latency-derived upstream timeouts per request class
+Each class (page, subresource, video, tunnel) has a connect, first-byte
+and idle-read timeout. Once a host has enough samples, connect and
+first-byte are set to TIMEOUT_MULTIPLIER x the host's p99, clamped to the
+class's [floor, ceiling]; until then the ceiling is used. Idle-read (max
+gap between body bytes) is applied to streamed bodies once headers are in.
+
+Static overrides: PROXY_TIMEOUT_<CLASS>=connect,first_byte,idle pins a
+class to fixed values, e.g. PROXY_TIMEOUT_VIDEO=5,30,120.
+"""
+import os
+
+from latency import tracker
+from upstream import upstream_socket
+
+TIMEOUT_MULTIPLIER = float(os.environ.get('PROXY_TIMEOUT_MULTIPLIER', 3))
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_MIN_SAMPLES = 20
+
+
+class TimeoutClass:
+    """Timeout bounds (seconds) for one class of upstream request"""
+
+    def __init__(self, connect_floor, connect_ceiling, first_byte_floor, first_byte_ceiling,
+                 idle, static=False):
+        self.connect_floor = connect_floor
+        self.connect_ceiling = connect_ceiling
+        self.first_byte_floor = first_byte_floor
+        self.first_byte_ceiling = first_byte_ceiling
+        self.idle = idle
+        self.static = static
+
+
+CLASSES = {
+    'page':        TimeoutClass(1.0, 5.0, 3.0, 15.0, 15.0),
+    'subresource': TimeoutClass(0.5, 4.0, 2.0, 10.0, 10.0),
+    'video':       TimeoutClass(1.0, 5.0, 5.0, 30.0, 60.0),
+    'tunnel':      TimeoutClass(1.0, 5.0, 3.0, 15.0, 15.0),
+}
+
+
+def _load_overrides():
+    for name, policy in CLASSES.items():
+        spec = os.environ.get(f'PROXY_TIMEOUT_{name.upper()}')
+        if spec:
+            connect, first_byte, idle = (float(v) for v in spec.split(','))
+            CLASSES[name] = TimeoutClass(connect, connect, first_byte, first_byte, idle, static=True)
+
+
+_load_overrides()
+
+
+def _derive(url, metric, floor, ceiling):
+    p = tracker.percentile(url, TIMEOUT_PERCENTILE, metric=metric, min_samples=TIMEOUT_MIN_SAMPLES)
+    if p is None:
+        return ceiling
+    return max(floor, min(ceiling, p * TIMEOUT_MULTIPLIER))
+
+
+def for_request(url, request_class):
+    """(connect, first_byte) timeout tuple for a requests call"""
+    policy = CLASSES[request_class]
+    if policy.static:
+        return (policy.connect_ceiling, policy.first_byte_ceiling)
+    return (
+        round(_derive(url, 'connect', policy.connect_floor, policy.connect_ceiling), 2),
+        round(_derive(url, 'ttfb', policy.first_byte_floor, policy.first_byte_ceiling), 2),
+    )
+
+
+def idle(request_class):
+    return CLASSES[request_class].idle
+
+
+def set_idle(resp, request_class):
+    """Switch a stream=True response from the first-byte to the idle-read
+    timeout for the rest of its body (best effort)"""
+    sock = upstream_socket(resp)
+    if sock is not None:
+        sock.settimeout(idle(request_class))
+    return resp
+
+
+def stats():
+    return {name: vars(policy) for name, policy in CLASSES.items()}
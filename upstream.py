@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+UPSTREAM CLIENT - Shared pooled HTTP session for outbound fetches
+One requests.Session per process so every mode reuses warm keep-alive
+connections instead of paying DNS+TCP+TLS on each fetch.
+"""
+import http.cookiejar
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import dnscache
+from latency import tracker
+
+dnscache.install()
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+POOL_CONNECTIONS = 32   # Number of distinct hosts to keep pools for
+POOL_MAXSIZE = 32       # Keep-alive connections kept per host
+WARM_TIMEOUT = 5
+
+
+def make_session():
+    """Build a pooled session that never stores upstream cookies"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    # The session is shared by every client - a Set-Cookie from one must not
+    # leak into another client's requests
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    session.hooks['response'].append(observe_first_byte)
+    return session
+
+
+def observe_first_byte(resp, *args, **kwargs):
+    """Response hook: record time-to-headers for the timeout policy"""
+    tracker.observe(resp.request.url, resp.elapsed.total_seconds(), 'ttfb')
+
+
+session = make_session()
+
+
+def upstream_socket(resp):
+    """The socket under a stream=True response, or None"""
+    sock = getattr(getattr(resp.raw, '_connection', None), 'sock', None)
+    if sock is None:
+        # Connection: close - http.client has handed the socket to the body reader
+        fp = getattr(getattr(resp.raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    return sock
+
+
+def origin_of(url):
+    """scheme://host[:port]/ for a URL"""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}/"
+
+
+def pool_for(url):
+    """The urllib3 connection pool `session` would use for url"""
+    adapter = session.get_adapter(url)
+    settings = session.merge_environment_settings(url, {}, None, None, None)
+    if hasattr(adapter, 'get_connection_with_tls_context'):
+        prepared = requests.Request('GET', url).prepare()
+        return adapter.get_connection_with_tls_context(
+            prepared, settings['verify'], settings['proxies'], settings['cert']
+        )
+    return adapter.get_connection(url, settings['proxies'])
+
+
+def warm(url, connections=1, timeout=WARM_TIMEOUT):
+    """Make sure `connections` idle, connected (TCP+TLS) sockets to url's
+    origin sit in the pool; returns how many had to be opened"""
+    pool = pool_for(origin_of(url))
+    checked_out = []
+    opened = 0
+    try:
+        # Check out several at once so we don't get the same socket back
+        for _ in range(connections):
+            conn = pool._get_conn(timeout=0)
+            connected = conn.is_connected if hasattr(conn, 'is_connected') else conn.sock is not None
+            if not connected:
+                conn.timeout = timeout
+                conn.connect()
+                opened += 1
+            checked_out.append(conn)
+    finally:
+        for conn in checked_out:
+            pool._put_conn(conn)
+    return opened
@@ -6,14 +6,16 @@ Creates an encrypted tunnel between browser and server using WebSockets.
 All traffic flows through a single encrypted connection - filter only sees gibberish!
 """
 
-from flask import Flask, render_template_string, request, Response
+from flask import Flask, request, Response
 from flask_sock import Sock
-import requests
 import base64
 import json
 import gzip
 from urllib.parse import urljoin, urlparse
 
+import pipeline
+from static_assets import StaticAsset
+
 app = Flask(__name__)
 sock = Sock(app)
 
@@ -56,12 +58,8 @@ def tunnel(ws):
             
             # Make the actual request server-side
             try:
-                if method == 'GET':
-                    resp = requests.get(url, headers=headers, timeout=15, allow_redirects=True)
-                elif method == 'POST':
-                    resp = requests.post(url, headers=headers, data=body, timeout=15, allow_redirects=True)
-                else:
-                    resp = requests.request(method, url, headers=headers, data=body, timeout=15, allow_redirects=True)
+                resp = pipeline.fetch(url, method, 'tunnel', headers=headers,
+                                      data=body if method != 'GET' else None, cached=False)
                 
                 # Prepare response
                 response_data = {
@@ -98,12 +96,12 @@ def tunnel(ws):
 # Main page - loads the VPN client
 @app.route('/')
 def index():
-    return render_template_string(VPN_CLIENT_HTML)
+    return VPN_CLIENT_PAGE.response()
 
 @app.route('/<path:path>')
 def catch_all(path):
     """Redirect everything to the VPN client"""
-    return render_template_string(VPN_CLIENT_HTML)
+    return VPN_CLIENT_PAGE.response()
 
 # VPN Client HTML - runs in browser
 VPN_CLIENT_HTML = """
@@ -379,6 +377,9 @@ VPN_CLIENT_HTML = """
 </html>
 """
 
+# Built once at startup: strong ETag + pre-compressed variants
+VPN_CLIENT_PAGE = StaticAsset(VPN_CLIENT_HTML, 'text/html')
+
 if __name__ == '__main__':
     print("\n" + "="*70)
     print("🔒 VPN-STYLE ENCRYPTED WEBSOCKET TUNNEL PROXY")
@@ -394,11 +395,5 @@ if __name__ == '__main__':
     print("  ✓ VPN-like behavior without VPN software")
     print("  ✓ Works in browser (no installation needed)")
     print("="*70 + "\n")
-    print("Installing flask-sock for WebSocket support...\n")
-    
-    import subprocess
-    import sys
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "-q", "flask-sock"])
-    
-    print("\nStarting VPN tunnel server on port 5000...\n")
+    print("Starting VPN tunnel server on port 5000...\n")
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
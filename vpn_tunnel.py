@@ -4,9 +4,12 @@ Simple VPN Tunnel Proxy - Encrypted WebSocket
 """
 from flask import Flask, request, Response
 from flask_sock import Sock
-import requests
 import base64
 import json
+import os
+
+import pipeline
+from static_assets import StaticAsset
 
 app = Flask(__name__)
 sock = Sock(app)
@@ -42,9 +45,7 @@ def tunnel(ws):
             print(f"[TUNNEL] {method} {url}")
             
             try:
-                resp = requests.get(url, timeout=15, allow_redirects=True, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
+                resp = pipeline.fetch(url, request_class='tunnel', cached=False)
                 
                 response_data = {
                     'status': resp.status_code,
@@ -69,18 +70,15 @@ def tunnel(ws):
     
     print("[TUNNEL] Disconnected")
 
+# Read from disk once at startup instead of on every hit
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vpn_client.html'), encoding='utf-8') as f:
+    CLIENT_PAGE = StaticAsset(f.read(), 'text/html')
+
 @app.route('/')
 def index():
-    html = open('/workspaces/proxy/vpn_client.html').read()
-    return Response(html, mimetype='text/html')
+    return CLIENT_PAGE.response()
 
 if __name__ == '__main__':
-    import subprocess
-    import sys
-    
     print("\n🔒 VPN TUNNEL PROXY\n")
-    print("Installing flask-sock...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "-q", "flask-sock"])
-    
-    print("\nStarting server on port 5000...\n")
+    print("Starting server on port 5000...\n")
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
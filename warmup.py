@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+WARMUP - Startup warm-up phase and readiness tracking
+Pre-opens upstream connection pools and pre-renders static pages before
+a server reports ready on /healthz, and measures time-to-ready.
+"""
+import threading
+import time
+
+
+class Warmup:
+    """Named warm-up steps run once per process, concurrently"""
+
+    def __init__(self, name, boot_time=None):
+        self.name = name
+        self.boot_time = boot_time if boot_time is not None else time.monotonic()
+        self.steps = []
+        self.results = {}
+        self.ready_at = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def step(self, name):
+        """Decorator registering a warm-up step"""
+        def decorator(fn):
+            self.steps.append((name, fn))
+            return fn
+        return decorator
+
+    @property
+    def ready(self):
+        return self.ready_at is not None
+
+    def _run_step(self, name, fn):
+        started = time.monotonic()
+        try:
+            detail = fn()
+            result = {'ok': True}
+            if detail is not None:
+                result['detail'] = detail
+        except Exception as e:
+            # A step failing (e.g. upstream offline) must not keep us from
+            # serving - warm-up is best effort
+            result = {'ok': False, 'error': str(e)[:200]}
+        result['ms'] = round((time.monotonic() - started) * 1000, 1)
+        self.results[name] = result
+
+    def run(self):
+        """Run all steps (blocking); safe to call more than once"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        threads = [threading.Thread(target=self._run_step, args=step, daemon=True) for step in self.steps]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.ready_at = time.monotonic()
+        failed = [name for name, result in self.results.items() if not result['ok']]
+        print(f"[WARMUP] {self.name} ready in {self.time_to_ready_ms:.0f}ms"
+              + (f" (failed: {', '.join(failed)})" if failed else ""))
+
+    def start(self):
+        """Run warm-up in the background so the server can bind immediately"""
+        threading.Thread(target=self.run, name=f"{self.name}-warmup", daemon=True).start()
+
+    @property
+    def time_to_ready_ms(self):
+        if self.ready_at is None:
+            return None
+        return round((self.ready_at - self.boot_time) * 1000, 1)
+
+    def status(self):
+        """(payload, http status) for a /healthz endpoint"""
+        payload = {
+            'status': 'ready' if self.ready else 'warming',
+            'time_to_ready_ms': self.time_to_ready_ms,
+            'uptime_s': round(time.monotonic() - self.boot_time, 1),
+            'steps': self.results,
+        }
+        return payload, 200 if self.ready else 503
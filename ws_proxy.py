@@ -1,9 +1,12 @@
 import requests
 import json
 import base64
-from flask import Flask, render_template_string
+from flask import Flask
 from flask_sock import Sock
 
+import pipeline
+from static_assets import StaticAsset
+
 app = Flask(__name__)
 sock = Sock(app)
 
@@ -197,9 +200,12 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
 </html>
 '''
 
+# Built once at startup: strong ETag + pre-compressed variants
+INDEX_PAGE = StaticAsset(HTML_TEMPLATE, 'text/html')
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return INDEX_PAGE.response()
 
 @sock.route('/ws')
 def websocket(ws):
@@ -228,14 +234,8 @@ def websocket(ws):
                 if request.get('body'):
                     body = base64.b64decode(request['body'])
                 
-                resp = requests.request(
-                    method=request['method'],
-                    url=url,
-                    headers=headers,
-                    data=body,
-                    timeout=10,
-                    allow_redirects=True
-                )
+                resp = pipeline.fetch(url, request['method'], 'tunnel', headers=headers, data=body,
+                                      cached=False)
                 
                 # Encode response
                 content_b64 = base64.b64encode(resp.content).decode('utf-8')